@@ -0,0 +1,191 @@
+//! Benchmarks for the `Calculator` entry points the UI calls on every keystroke
+//! or button press. No Python interpreter is involved.
+//!
+//! Run with: cargo bench -p neocalc-python --no-default-features --bench calculator
+
+use criterion::{black_box, criterion_group, criterion_main, BenchmarkId, Criterion};
+use neocalc_backend::Calculator;
+use std::alloc::{GlobalAlloc, Layout, System};
+use std::sync::atomic::{AtomicU64, Ordering};
+
+/// The system allocator, counting allocations so the preview bench can report
+/// them per call next to the timings.
+struct Counting;
+
+static ALLOCATIONS: AtomicU64 = AtomicU64::new(0);
+
+unsafe impl GlobalAlloc for Counting {
+    unsafe fn alloc(&self, layout: Layout) -> *mut u8 {
+        ALLOCATIONS.fetch_add(1, Ordering::Relaxed);
+        unsafe { System.alloc(layout) }
+    }
+
+    unsafe fn dealloc(&self, ptr: *mut u8, layout: Layout) {
+        unsafe { System.dealloc(ptr, layout) }
+    }
+
+    unsafe fn realloc(&self, ptr: *mut u8, layout: Layout, new_size: usize) -> *mut u8 {
+        ALLOCATIONS.fetch_add(1, Ordering::Relaxed);
+        unsafe { System.realloc(ptr, layout, new_size) }
+    }
+}
+
+#[global_allocator]
+static GLOBAL: Counting = Counting;
+
+const TYPED: &str = include_str!("corpus/arithmetic.txt");
+const BITWISE: &str = include_str!("corpus/bitwise.txt");
+
+fn expressions(corpus: &str) -> Vec<&str> {
+    corpus
+        .lines()
+        .map(str::trim)
+        .filter(|l| !l.is_empty() && !l.starts_with('#'))
+        .collect()
+}
+
+/// A calculator with `count` variables already assigned.
+fn with_variables(count: usize) -> Calculator {
+    let calc = Calculator::new();
+    for i in 0..count {
+        calc.evaluate(Some(format!("v{} = {}", i, i))).unwrap();
+    }
+    calc
+}
+
+fn bench_preview(c: &mut Criterion) {
+    let mut group = c.benchmark_group("preview");
+    for count in [0, 1_000] {
+        let calc = with_variables(count);
+        /* Every prefix of every line, as the preview sees them while typing */
+        let prefixes: Vec<String> = expressions(TYPED)
+            .iter()
+            .flat_map(|e| e.char_indices().map(move |(i, ch)| e[..i + ch.len_utf8()].to_string()))
+            .collect();
+
+        /* One untimed pass first, so caches filled on first use are not counted */
+        for prefix in &prefixes {
+            calc.preview(prefix.clone()).unwrap();
+        }
+        let before = ALLOCATIONS.load(Ordering::Relaxed);
+        for prefix in &prefixes {
+            black_box(calc.preview(prefix.clone()).unwrap());
+        }
+        let allocations = ALLOCATIONS.load(Ordering::Relaxed) - before;
+        println!(
+            "preview/typing/{}: {:.1} allocations per call",
+            count,
+            allocations as f64 / prefixes.len() as f64
+        );
+
+        group.bench_with_input(BenchmarkId::new("typing", count), &prefixes, |b, prefixes| {
+            b.iter(|| {
+                for prefix in prefixes {
+                    black_box(calc.preview(prefix.clone()).unwrap());
+                }
+            })
+        });
+    }
+    group.finish();
+}
+
+fn bench_evaluate(c: &mut Criterion) {
+    let calc = Calculator::new();
+    let exprs = expressions(TYPED);
+    c.bench_function("calculator_evaluate/arithmetic", |b| {
+        b.iter(|| {
+            for expr in &exprs {
+                black_box(calc.evaluate(Some(expr.to_string())).unwrap());
+            }
+            /* Keep the history from growing across millions of iterations */
+            calc.clear_history().unwrap();
+        })
+    });
+
+    let calc = Calculator::new();
+    calc.set_word_size(Some(64), true).unwrap();
+    let exprs = expressions(BITWISE);
+    c.bench_function("calculator_evaluate/bitwise", |b| {
+        b.iter(|| {
+            for expr in &exprs {
+                black_box(calc.evaluate(Some(expr.to_string())).unwrap());
+            }
+            /* Keep the history from growing across millions of iterations */
+            calc.clear_history().unwrap();
+        })
+    });
+}
+
+fn bench_convert(c: &mut Criterion) {
+    let mut group = c.benchmark_group("convert");
+    for (name, expr) in [("small", "123456789"), ("bigint", "2^512-1")] {
+        let calc = Calculator::new();
+        group.bench_function(BenchmarkId::new("hex", name), |b| {
+            b.iter(|| {
+                /* The conversion replaces the buffer with its result */
+                calc.set_expression(expr.to_string()).unwrap();
+                black_box(calc.convert_to_hex().unwrap())
+            })
+        });
+        group.bench_function(BenchmarkId::new("bin", name), |b| {
+            b.iter(|| {
+                calc.set_expression(expr.to_string()).unwrap();
+                black_box(calc.convert_to_bin().unwrap())
+            })
+        });
+    }
+    group.finish();
+}
+
+/// Inputs the integer kernels take over from the engine.
+fn bench_integer(c: &mut Criterion) {
+    let mut group = c.benchmark_group("integer");
+    group.sample_size(10);
+    for (name, expr) in [
+        ("factorial_200000", "200000!"),
+        ("binomial", "binomial(1000000, 500000)"),
+        ("product", "product(100000, 300000)"),
+        ("pow", "3^1000000"),
+    ] {
+        let calc = Calculator::new();
+        group.bench_function(name, |b| {
+            b.iter(|| {
+                black_box(calc.evaluate(Some(expr.to_string())).unwrap());
+                calc.clear_history().unwrap();
+            })
+        });
+    }
+    group.finish();
+}
+
+/// Matrix expressions at a size where blocking and threads matter.
+fn bench_linalg(c: &mut Criterion) {
+    let mut group = c.benchmark_group("linalg");
+    group.sample_size(10);
+    let n = 500;
+    /* Diagonally dominant, so solves are well conditioned */
+    let rows: Vec<Vec<f64>> = (0..n)
+        .map(|i| (0..n).map(|j| if i == j { n as f64 } else { ((i * 7 + j * 13) % 10) as f64 / 10.0 }).collect())
+        .collect();
+    let calc = Calculator::new();
+    calc.set_matrix("A".to_string(), rows.clone()).unwrap();
+    calc.set_matrix("B".to_string(), rows).unwrap();
+    for (name, expr) in [
+        ("matmul_500", "matmul(A, B)"),
+        ("solve_500", "solve(A, B)"),
+        ("det_500", "det(A)"),
+        ("elementwise_500", "2 * A + B"),
+        ("transpose_slice", "dot(col(transpose(A), 3), col(B, 7))"),
+    ] {
+        group.bench_function(name, |b| {
+            b.iter(|| {
+                black_box(calc.evaluate(Some(expr.to_string())).unwrap());
+                calc.clear_history().unwrap();
+            })
+        });
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_preview, bench_evaluate, bench_convert, bench_integer, bench_linalg);
+criterion_main!(benches);
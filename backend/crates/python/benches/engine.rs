@@ -0,0 +1,88 @@
+//! Engine benchmarks: expression corpora, number formatting and context copies.
+//!
+//! Run with: cargo bench -p neocalc-python --no-default-features --bench engine
+
+use criterion::{black_box, criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use neocalc_core::utils::format_number;
+use neocalc_core::{engine, Context};
+
+/* Bitwise expressions need a word size and are measured in the calculator bench */
+const CORPORA: [(&str, &str); 4] = [
+    ("arithmetic", include_str!("corpus/arithmetic.txt")),
+    ("bigint", include_str!("corpus/bigint.txt")),
+    ("trig", include_str!("corpus/trig.txt")),
+    ("financial", include_str!("corpus/financial.txt")),
+];
+
+/// The expressions of a corpus file, without comments and blank lines.
+fn expressions(corpus: &str) -> Vec<&str> {
+    corpus
+        .lines()
+        .map(str::trim)
+        .filter(|l| !l.is_empty() && !l.starts_with('#'))
+        .collect()
+}
+
+/// A context with the variables the corpora read.
+fn base_context() -> Context {
+    let mut context = Context::new();
+    engine::evaluate("x = 0.7", &mut context).unwrap();
+    context
+}
+
+fn bench_corpora(c: &mut Criterion) {
+    let mut group = c.benchmark_group("evaluate");
+    for (name, corpus) in CORPORA {
+        let exprs = expressions(corpus);
+        /* Fail loudly if a corpus line stops parsing, instead of timing the error path */
+        for expr in &exprs {
+            if let Err(e) = engine::evaluate(expr, &mut base_context()) {
+                panic!("{}: {:?} does not evaluate: {}", name, expr, e);
+            }
+        }
+        group.throughput(Throughput::Elements(exprs.len() as u64));
+        group.bench_with_input(BenchmarkId::from_parameter(name), &exprs, |b, exprs| {
+            let mut context = base_context();
+            b.iter(|| {
+                for expr in exprs {
+                    black_box(engine::evaluate(black_box(expr), &mut context).unwrap());
+                }
+            })
+        });
+    }
+    group.finish();
+}
+
+fn bench_format(c: &mut Criterion) {
+    let mut context = Context::new();
+    let values = [
+        ("integer", engine::evaluate("123456789", &mut context).unwrap()),
+        ("bigint", engine::evaluate("2^1024", &mut context).unwrap()),
+        ("float", engine::evaluate("1/7", &mut context).unwrap()),
+    ];
+    let mut group = c.benchmark_group("format_number");
+    for (name, value) in values {
+        group.bench_with_input(BenchmarkId::from_parameter(name), &value, |b, value| {
+            b.iter(|| format_number(black_box(value.clone())))
+        });
+    }
+    group.finish();
+}
+
+fn bench_context_clone(c: &mut Criterion) {
+    let mut group = c.benchmark_group("context_clone");
+    for size in [10, 1_000, 10_000] {
+        let mut context = Context::new();
+        for i in 0..size {
+            engine::evaluate(&format!("v{} = {}", i, i), &mut context).unwrap();
+        }
+        /* Values are shared, so this measures the maps and keys, not the numbers */
+        group.bench_with_input(BenchmarkId::from_parameter(size), &context, |b, context| {
+            b.iter(|| black_box(context.clone()))
+        });
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_corpora, bench_format, bench_context_clone);
+criterion_main!(benches);
@@ -0,0 +1,44 @@
+//! Solver benchmarks for the financial functions.
+//!
+//! Run with: cargo bench -p neocalc-python --no-default-features --bench financial
+
+use criterion::{black_box, criterion_group, criterion_main, BenchmarkId, Criterion};
+use neocalc_backend::financial::{irr, npv, rate};
+
+/// An initial outlay followed by `periods` level payments.
+fn schedule(periods: usize) -> Vec<f64> {
+    let mut flows = Vec::with_capacity(periods + 1);
+    flows.push(-1_000_000.0);
+    flows.extend((0..periods).map(|t| 150.0 + (t % 12) as f64));
+    flows
+}
+
+fn bench_irr(c: &mut Criterion) {
+    let mut group = c.benchmark_group("irr");
+    for periods in [12, 360, 10_000] {
+        let flows = schedule(periods);
+        group.bench_with_input(BenchmarkId::new("cold", periods), &flows, |b, flows| {
+            b.iter(|| irr(black_box(flows), None).unwrap())
+        });
+
+        let previous = irr(&flows, None).unwrap();
+        group.bench_with_input(BenchmarkId::new("warm", periods), &flows, |b, flows| {
+            b.iter(|| irr(black_box(flows), Some(previous)).unwrap())
+        });
+    }
+    group.finish();
+}
+
+fn bench_npv(c: &mut Criterion) {
+    let flows = schedule(10_000);
+    c.bench_function("npv/10000", |b| b.iter(|| npv(black_box(0.001), black_box(&flows)).unwrap()));
+}
+
+fn bench_rate(c: &mut Criterion) {
+    c.bench_function("rate/mortgage", |b| {
+        b.iter(|| rate(black_box(360.0), black_box(-1000.0), black_box(150_000.0), 0.0, 0.0, None).unwrap())
+    });
+}
+
+criterion_group!(benches, bench_irr, bench_npv, bench_rate);
+criterion_main!(benches);
@@ -1,11 +1,28 @@
 use pyo3::prelude::*;
-use pyo3::exceptions::PyRuntimeError;
+use pyo3::exceptions::{PyKeyError, PyValueError};
 use pyo3_async_runtimes::tokio::future_into_py;
-use std::sync::{Arc, Mutex};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, Mutex, PoisonError};
+use std::time::Duration;
 
 use neocalc_core::engine;
-use neocalc_core::{Context, Number, EngineError};
-use crate::utils::lock_mutex;
+use neocalc_core::{Context, Number};
+use crate::dataset::{Dataset, Datasets};
+use crate::error::BackendError;
+use crate::events::{Change, Listener};
+use crate::feed::{ChangeLog, FormatCache};
+use crate::expr::{self, Arena};
+use crate::financial::{self, WarmStart};
+use crate::integer::{self, Interrupt};
+use crate::linalg::{self, LinalgError, Matrices, Matrix};
+use crate::metrics::{self, Counter, Timer};
+use crate::reactive::{self, FormulaGraph};
+use crate::session::TabState;
+use crate::state::Shared;
+use crate::stats;
+use crate::programming::{self, WordError, WordSize, WordValue};
+use crate::utils::{assign_variable, format_number, lock_mutex, lookup_variable};
+use crate::vm::{self, Definition, FunctionTable, Machine};
 use neocalc_core::utils as core_utils; // Rename to avoid conflict with local utils
 
 /// The interface between Python (Dynamic Bliss) and Rust (Static Pain).
@@ -14,23 +31,98 @@ use neocalc_core::utils as core_utils; // Rename to avoid conflict with local ut
 #[allow(deprecated)] // Ignore deprecations during refactor if any
 pub struct Calculator {
     /* Stores the history of calculations as a list of strings */
-    history: Arc<Mutex<Vec<String>>>,
+    history: Arc<Shared<Vec<String>>>,
     /* Stores the current input value being typed or displayed */
-    input_buffer: Arc<Mutex<String>>,
-    /* Stores variables */
-    variables: Arc<Mutex<Context>>,
+    input_buffer: Arc<Shared<String>>,
+    /* Stores variables. Readers work on a shared snapshot and never wait;
+     * an evaluation only takes the lock to commit what it changed */
+    variables: Arc<Shared<Context>>,
+    /* Fixed machine word used by the programming mode, None for unbounded math */
+    word_size: Arc<Mutex<Option<WordSize>>>,
+    /* Named numeric series (cash flows, samples), in memory or file-backed */
+    datasets: Arc<Mutex<Datasets>>,
+    /* Named vectors and matrices; the engine's numbers are scalars only */
+    matrices: Arc<Mutex<Matrices>>,
+    /* Previous irr/rate solutions, used as the next starting guess */
+    warm_start: Arc<Mutex<WarmStart>>,
+    /* User-defined functions, compiled to bytecode when they are defined */
+    functions: Arc<Mutex<FunctionTable>>,
+    /* Formulas bound with `name := expr`, recomputed when their inputs change */
+    formulas: Arc<Mutex<FormulaGraph>>,
+    /* Formulas recomputed by the last assignment, in the order they ran */
+    recomputed: Arc<Mutex<Vec<String>>>,
+    /* Which variables and functions changed at each version, for incremental listings */
+    changes: Arc<Mutex<ChangeLog>>,
+    /* Display strings of variable values, kept until the value changes */
+    formatted: Arc<Mutex<FormatCache>>,
+    /* Bumped by `cancel`; long integer computations stop when it moves */
+    generation: Arc<AtomicU64>,
+    /* Told what each evaluation changed, see `set_listener` */
+    listener: Listener,
+}
+
+/// Most values `tabulate` computes in one call.
+const TABULATE_MAX: usize = 1 << 20;
+
+/// How long a preview may spend in the integer kernels before giving up.
+const PREVIEW_BUDGET: Duration = Duration::from_millis(100);
+
+/// Largest integer a preview computes, about 20000 digits, so formatting it
+/// on the UI thread stays quick too.
+const PREVIEW_MAX_BITS: u64 = 1 << 16;
+
+/// What `evaluate_matrix_entry` made of its input.
+enum MatrixEntry {
+    /// A matrix or an error, as shown to the user; nothing is left to do.
+    Shown(String),
+    /// A number, computed from this version of the variables.
+    Scalar(Number, u64),
 }
 
 impl Calculator {
     fn convert_base_internal(&self, radix: u32, prefix: &str) -> PyResult<String> {
-        let buffer = lock_mutex(&self.input_buffer)?;
-        let mut context = lock_mutex(&self.variables)?;
+        let mark = self.mark();
+        let res = self.convert_base(radix, prefix);
+        self.notify_since(mark);
+        res
+    }
 
-        let res = engine::evaluate(&buffer, &mut context);
+    fn convert_base(&self, radix: u32, prefix: &str) -> PyResult<String> {
+        let expr = self.input_buffer.snapshot().to_string();
+        let word_size = *lock_mutex(&self.word_size)?;
+
+        if let Some(size) = word_size {
+            let value = loop {
+                let (base, version) = self.variables.versioned();
+                let mut working = self.scratch_context(&base, &expr);
+                let before = working.clone();
+                match Self::evaluate_word(&expr, size, &mut working) {
+                    Ok(value) if self.commit_variables(version, &before, &working) => break value,
+                    Ok(_) => continue,
+                    Err(e) => return Ok(e.to_string()),
+                }
+            };
+            let result_str = value.to_radix(radix);
+            self.input_buffer.commit(|b| *b = result_str.clone());
+            return Ok(result_str);
+        }
+
+        /* Like `record_evaluation`, evaluated again if another commit came first */
+        let res = loop {
+            let (base, version) = self.variables.versioned();
+            let mut working = self.scratch_context(&base, &expr);
+            let before = working.clone();
+            let res = {
+                let _span = metrics::span(Timer::Engine);
+                engine::evaluate(&expr, &mut working)
+            };
+            if res.is_err() || self.commit_variables(version, &before, &working) {
+                break res;
+            }
+        };
 
         match res {
             Ok(num) => {
-                let mut buffer = self.input_buffer.lock().unwrap();
                 let result_str = match num {
                     Number::Integer(i) => {
                         let mut val_str = i.to_str_radix(radix);
@@ -49,109 +141,785 @@ impl Calculator {
                     }
                     // _ => "Error: Conversion not supported for this number type".to_string(),
                 };
-                *buffer = result_str.clone();
+                self.input_buffer.commit(|b| *b = result_str.clone());
                 Ok(result_str)
             }
             Err(e) => Ok(e.to_string()), // Convert EngineError to string for Python UI
         }
     }
 
+    /// Native fixed-width evaluation, falling back to the engine (then wrapping)
+    /// for anything outside the integer subset, such as assignments.
+    fn evaluate_word(
+        expr: &str,
+        size: WordSize,
+        context: &mut Context,
+    ) -> Result<WordValue, BackendError> {
+        match programming::evaluate(expr, size, context) {
+            Err(WordError::Unsupported) => {
+                let _span = metrics::span(Timer::Engine);
+                let num = engine::evaluate(expr, context)?;
+                let value = size.value(size.from_number(&num));
+                /* The engine stores an unbounded result; keep the variable in the word too */
+                if let Some(name) = reactive::assigned_name(expr) {
+                    if let Some(raw) = lookup_variable(context, name).map(|n| size.from_number(n)) {
+                        assign_variable(context, name, size.value(raw).to_number());
+                    }
+                }
+                Ok(value)
+            }
+            res => Ok(res?),
+        }
+    }
+
     fn evaluate_internal(
         &self,
         expr_to_eval: &str,
         context: &mut Context,
-    ) -> Result<Number, EngineError> {
-        engine::evaluate(expr_to_eval, context)
+        word_size: Option<WordSize>,
+        interrupt: &Interrupt,
+    ) -> Result<Number, BackendError> {
+        match word_size {
+            Some(size) => Self::evaluate_word(expr_to_eval, size, context).map(|v| v.to_number()),
+            None => {
+                if let Some(res) = self.evaluate_dataset_call(expr_to_eval, context, interrupt) {
+                    return Ok(Number::Float(res?));
+                }
+                if let Some((name, res)) = self.evaluate_matrix(expr_to_eval, context, interrupt) {
+                    let value = match res? {
+                        linalg::Value::Scalar(x) => Number::Float(x),
+                        linalg::Value::Matrix(_) => return Err(LinalgError::NotScalar.into()),
+                    };
+                    if let Some(name) = name {
+                        assign_variable(context, name, value.clone());
+                    }
+                    return Ok(value);
+                }
+                if let Some(res) = self.evaluate_function_call(expr_to_eval, context) {
+                    return res;
+                }
+                let kernel = {
+                    let _span = metrics::span(Timer::Integer);
+                    integer::evaluate(expr_to_eval, context, interrupt)
+                };
+                if let Some(res) = kernel {
+                    return Ok(Number::Integer(res?));
+                }
+                let _span = metrics::span(Timer::Engine);
+                Ok(engine::evaluate(expr_to_eval, context)?)
+            }
+        }
+    }
+
+    /// Financial and statistics functions over a stored dataset are computed
+    /// natively instead of by the engine. Under a budgeted `interrupt` (a
+    /// preview) file-backed datasets are left alone, since they are read whole,
+    /// and the solvers' starting guesses are not updated.
+    fn evaluate_dataset_call(
+        &self,
+        expr_to_eval: &str,
+        context: &Context,
+        interrupt: &Interrupt,
+    ) -> Option<Result<f64, BackendError>> {
+        /* Work on a copy (names and shared handles only) so a long computation
+         * does not hold the lock */
+        let mut datasets = self.datasets.lock().ok()?.clone();
+        let preview = interrupt.has_budget();
+        if preview {
+            datasets.retain(|_, ds| matches!(ds, Dataset::Memory(_)));
+        }
+        if datasets.is_empty() {
+            return None;
+        }
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, expr_to_eval).ok()?;
+        if let Some(res) = stats::evaluate_call(&parsed, &datasets) {
+            return Some(res);
+        }
+        let mut warm = *self.warm_start.lock().ok()?;
+        let res = financial::evaluate_call(&parsed, &datasets, context, &mut warm);
+        if !preview {
+            if let Ok(mut w) = self.warm_start.lock() {
+                *w = warm;
+            }
+        }
+        res
+    }
+
+    /// Expressions over stored matrices are evaluated natively. For `name = expr`
+    /// the right-hand side is evaluated and `name` returned; storing the result is
+    /// left to the caller, so previews never assign.
+    fn evaluate_matrix<'e>(
+        &self,
+        expr_to_eval: &'e str,
+        context: &Context,
+        interrupt: &Interrupt,
+    ) -> Option<(Option<&'e str>, Result<linalg::Value, BackendError>)> {
+        /* Copies of the maps share the values, so evaluation runs unlocked */
+        let matrices = self.matrices.lock().ok()?.clone();
+        let mut datasets = self.datasets.lock().ok()?.clone();
+        if interrupt.has_budget() {
+            /* As in `evaluate_dataset_call`, a preview never reads a whole file */
+            datasets.retain(|_, ds| matches!(ds, Dataset::Memory(_)));
+        }
+        if matrices.is_empty() && datasets.is_empty() {
+            return None;
+        }
+        let (name, rhs) = match reactive::assignment(expr_to_eval) {
+            Some((name, rhs)) => (Some(name), rhs),
+            None => (None, expr_to_eval),
+        };
+        let _span = metrics::span(Timer::Matrix);
+        let scope = linalg::Scope { matrices: &matrices, datasets: &datasets, context, interrupt };
+        let res = linalg::evaluate(rhs, &scope)?;
+        Some((name, res.map_err(Into::into)))
+    }
+
+    /// Evaluates an expression over matrices. A matrix result is stored for
+    /// `name = expr` and shown; a number is handed back with the variables
+    /// version it was computed from, for the usual path to assign and record
+    /// so assignments reach formulas and the change log.
+    fn evaluate_matrix_entry(&self, expr_to_eval: &str, interrupt: &Interrupt) -> Option<MatrixEntry> {
+        let (base, version) = self.variables.versioned();
+        let (name, res) = self.evaluate_matrix(expr_to_eval, &base, interrupt)?;
+        let matrix = match res {
+            Ok(linalg::Value::Matrix(m)) => m,
+            Ok(linalg::Value::Scalar(x)) => return Some(MatrixEntry::Scalar(Number::Float(x), version)),
+            Err(e) => return Some(MatrixEntry::Shown(e.to_string())),
+        };
+        let output = linalg::format(&matrix);
+        if let Some(name) = name {
+            self.store_matrix(name.to_string(), matrix);
+        }
+        self.history.commit(|h| h.push(format!("{} = {}", expr_to_eval, output)));
+        Some(MatrixEntry::Shown(output))
+    }
+
+    /// Expressions that call a user function: every call runs on the bytecode
+    /// VM and the engine evaluates the rest with the results in place, so
+    /// built-ins the VM lacks and exact integers keep working. `name = expr`
+    /// is supported the same way.
+    fn evaluate_function_call(
+        &self,
+        expr_to_eval: &str,
+        context: &mut Context,
+    ) -> Option<Result<Number, BackendError>> {
+        let (name, rhs) = match reactive::assignment(expr_to_eval) {
+            Some((name, rhs)) => (Some(name), rhs),
+            None => (None, expr_to_eval),
+        };
+        let split = {
+            let mut functions = self.functions.lock().ok()?;
+            if functions.is_empty() {
+                return None;
+            }
+            match functions.split_calls(rhs)? {
+                Ok(split) => split,
+                Err(e) => return Some(Err(e.into())),
+            }
+        };
+        let values = {
+            let _span = metrics::span(Timer::Function);
+            let mut machine = Machine::new(context);
+            split.calls.iter().map(|program| machine.run(program, &[])).collect::<Result<Vec<f64>, _>>()
+        };
+        let values = match values {
+            Ok(values) => values,
+            Err(e) => return Some(Err(e.into())),
+        };
+
+        /* A lone call needs no engine, and the engine cannot read NaN or infinity */
+        let whole = if split.is_single_call() {
+            Some(values[0])
+        } else if values.iter().any(|v| !v.is_finite()) {
+            match self.run_whole(rhs, context) {
+                Ok(value) => Some(value),
+                Err(e) => return Some(Err(e)),
+            }
+        } else {
+            None
+        };
+        if let Some(value) = whole {
+            let value = Number::Float(value);
+            if let Some(name) = name {
+                assign_variable(context, name, value.clone());
+            }
+            return Some(Ok(value));
+        }
+        let text = match name {
+            Some(name) => format!("{} = {}", name, split.join(&values)),
+            None => split.join(&values),
+        };
+        let _span = metrics::span(Timer::Engine);
+        Some(engine::evaluate(&text, context).map_err(Into::into))
+    }
+
+    /// Runs all of `text` on the VM, for results the engine cannot take.
+    fn run_whole(&self, text: &str, context: &Context) -> Result<f64, BackendError> {
+        let program = self
+            .functions
+            .lock()
+            .unwrap_or_else(PoisonError::into_inner)
+            .program_for(text)
+            .expect("calls a user function")?;
+        let _span = metrics::span(Timer::Function);
+        Ok(Machine::new(context).run(&program, &[])?)
+    }
+
+    /// Compiles `f(x) = ...` into the function table. Returns `None` when the
+    /// input is not a function definition.
+    fn define_function(&self, expr_to_eval: &str) -> Option<Result<String, BackendError>> {
+        let def = Definition::parse(expr_to_eval)?;
+        let mut functions = self.functions.lock().ok()?;
+        let previous = functions.get(def.name).map(|f| f.signature());
+        let res = functions.define(&def);
+        drop(functions);
+
+        Some(res.map_err(Into::into).map(|f| {
+            /* Listed by signature, so a changed parameter list replaces the old entry */
+            self.record_changes(previous.into_iter().chain([f.signature()]));
+            format!("{} = {}", f.signature(), f.body)
+        }))
+    }
+
+    /// Shared by `evaluate` and `evaluate_async`: evaluates, records the result
+    /// in the history and the input buffer, then tells the listener.
+    fn run_evaluation(&self, expr_to_eval: &str, word_size: Option<WordSize>) -> String {
+        let mark = self.mark();
+        let output = self.record_evaluation(expr_to_eval, word_size);
+        self.notify_since(mark);
+        output
+    }
+
+    fn record_evaluation(&self, expr_to_eval: &str, word_size: Option<WordSize>) -> String {
+        let _span = metrics::span(Timer::Evaluate);
+        let interrupt = Interrupt::new(&self.generation);
+        let mut known = None;
+        if word_size.is_none() {
+            if let Some(res) = self.define_function(expr_to_eval) {
+                return match res {
+                    Ok(definition) => {
+                        self.history.commit(|h| h.push(definition.clone()));
+                        definition
+                    }
+                    Err(e) => e.to_string(),
+                };
+            }
+            match self.evaluate_matrix_entry(expr_to_eval, &interrupt) {
+                Some(MatrixEntry::Shown(output)) => return output,
+                Some(MatrixEntry::Scalar(value, version)) => known = Some((value, version)),
+                None => {}
+            }
+        }
+
+        /* Evaluate without holding any lock; only the changes are committed, and
+        only onto the version they were computed from, or `x = x + 1` run twice at
+        once could lose an increment. Evaluate again when another commit came first */
+        let res = loop {
+            let (base, version) = self.variables.versioned();
+            let mut working = self.scratch_context(&base, expr_to_eval);
+            let before = working.clone();
+            /* A number from the matrix pass is reused while the variables it read are current */
+            let value = known.take().and_then(|(value, at)| (at == version).then_some(value));
+            let res = self.evaluate_reactive(expr_to_eval, value, &base, &mut working, word_size, &interrupt);
+            if res.is_err() || self.commit_variables(version, &before, &working) {
+                break res;
+            }
+        };
+
+        let output = match &res {
+            Ok(n) => format_number(n.clone()),
+            Err(e) => e.to_string(),
+        };
+
+        if res.is_ok() && !expr_to_eval.trim().is_empty() {
+            self.history.commit(|h| h.push(format!("{} = {}", expr_to_eval, output)));
+            self.input_buffer.commit(|b| *b = output.clone());
+        }
+        output
+    }
+
+    /// Evaluates with formula bookkeeping: `name := expr` binds a formula, and
+    /// any assignment recomputes the formulas that read the assigned name.
+    /// `known` is the value of `expr_to_eval` when it has already been computed.
+    fn evaluate_reactive(
+        &self,
+        expr_to_eval: &str,
+        known: Option<Number>,
+        base: &Context,
+        context: &mut Context,
+        word_size: Option<WordSize>,
+        interrupt: &Interrupt,
+    ) -> Result<Number, BackendError> {
+        let formula = match word_size {
+            None => reactive::parse_formula(expr_to_eval),
+            Some(_) => None,
+        };
+        let Some((name, text)) = formula else {
+            let res = match known {
+                Some(value) => {
+                    if let Some(name) = reactive::assigned_name(expr_to_eval) {
+                        assign_variable(context, name, value.clone());
+                    }
+                    Ok(value)
+                }
+                None => self.evaluate_internal(expr_to_eval, context, word_size, interrupt),
+            };
+            if res.is_ok() {
+                if let Some(name) = reactive::assigned_name(expr_to_eval) {
+                    /* Typing a value over a formula replaces it, as in a spreadsheet */
+                    self.formulas.lock().unwrap_or_else(PoisonError::into_inner).remove(name);
+                    self.propagate(name, base, context, word_size, interrupt);
+                }
+            }
+            return res;
+        };
+
+        /* Registered only once it evaluates, so a broken formula leaves nothing behind */
+        self.fill_reads(base, text, context);
+        let value = self.evaluate_internal(text, context, None, interrupt)?;
+        {
+            let functions = self.functions.lock().unwrap_or_else(PoisonError::into_inner);
+            let mut formulas = self.formulas.lock().unwrap_or_else(PoisonError::into_inner);
+            formulas.set(name, text, &functions)?;
+        }
+        assign_variable(context, name, value.clone());
+        self.propagate(name, base, context, word_size, interrupt);
+        Ok(value)
+    }
+
+    /// Recomputes, in dependency order, only the formulas downstream of `changed`,
+    /// in the word size the change was made in.
+    fn propagate(
+        &self,
+        changed: &str,
+        base: &Context,
+        context: &mut Context,
+        word_size: Option<WordSize>,
+        interrupt: &Interrupt,
+    ) {
+        let affected: Vec<(String, String)> = {
+            let formulas = self.formulas.lock().unwrap_or_else(PoisonError::into_inner);
+            if formulas.is_empty() {
+                return;
+            }
+            formulas
+                .affected(changed)
+                .into_iter()
+                .map(|name| {
+                    let text = formulas.get(&name).expect("affected formulas exist").text.clone();
+                    (name, text)
+                })
+                .collect()
+        };
+        for (name, text) in &affected {
+            self.fill_reads(base, text, context);
+            /* A formula that fails keeps its previous value */
+            if let Ok(value) = self.evaluate_internal(text, context, word_size, interrupt) {
+                assign_variable(context, name, value);
+            }
+        }
+        *self.recomputed.lock().unwrap_or_else(PoisonError::into_inner) =
+            affected.into_iter().map(|(name, _)| name).collect();
+    }
+
+    /// Variables `expression` reads, or `None` if only the engine can parse it.
+    /// For `x = ...` this is what the right-hand side reads.
+    fn reads_of(&self, expression: &str) -> Option<Vec<String>> {
+        let source = reactive::assignment(expression).map_or(expression, |(_, rhs)| rhs);
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, source).ok()?;
+        Some(self.functions.lock().ok()?.free_variables(&parsed))
+    }
+
+    /// Copies the variables `expression` reads from `base` into `context`,
+    /// unless `context` already has them.
+    fn fill_reads(&self, base: &Context, expression: &str, context: &mut Context) {
+        for name in self.reads_of(expression).unwrap_or_default() {
+            if lookup_variable(context, &name).is_some() {
+                continue;
+            }
+            let value = base.scopes.iter().rev().find_map(|scope| scope.get(&name));
+            if let (Some(value), Some(scope)) = (value, context.scopes.last_mut()) {
+                scope.insert(name, value.clone());
+            }
+        }
+    }
+
+    /// A throwaway context for evaluating `expression` against `base`.
+    /// Only the variables the expression reads are carried over (as shared
+    /// values), so the cost does not grow with the number of variables defined.
+    fn scratch_context(&self, base: &Context, expression: &str) -> Context {
+        if self.reads_of(expression).is_none() {
+            /* Syntax only the engine understands: fall back to a full copy */
+            metrics::count(Counter::FullContextCopy, 1);
+            return base.clone();
+        }
+        let mut scratch = Context::new();
+        self.fill_reads(base, expression, &mut scratch);
+        scratch
+    }
+
+    /// Publishes the bindings an evaluation created or replaced in `after`
+    /// (compared with `before`) as one new version of the variables. Returns
+    /// false, committing nothing, if the variables moved past version `base`
+    /// since `before` was taken; the caller then evaluates again.
+    fn commit_variables(&self, base: u64, before: &Context, after: &Context) -> bool {
+        let mut changed = Vec::new();
+        for scope in &after.scopes {
+            for (name, value) in scope {
+                let old = before.scopes.iter().rev().find_map(|s| s.get(name));
+                if !old.is_some_and(|old| Arc::ptr_eq(old, value)) {
+                    changed.push((name.clone(), value.clone()));
+                }
+            }
+        }
+        if changed.is_empty() {
+            return true;
+        }
+        let names: Vec<String> = changed.iter().map(|(name, _)| name.clone()).collect();
+        let committed = self.variables.commit_at(base, |context| {
+            for (name, value) in changed {
+                assign_variable(context, &name, value);
+            }
+        });
+        if committed.is_none() {
+            return false;
+        }
+        /* A name holds a number or a matrix, never both */
+        let mut matrices = self.matrices.lock().unwrap_or_else(PoisonError::into_inner);
+        for name in &names {
+            matrices.remove(name);
+        }
+        drop(matrices);
+        self.record_changes(names);
+        true
+    }
+
+    /// Stores `matrix` under `name`, replacing any variable or formula of that name.
+    fn store_matrix(&self, name: String, matrix: Matrix) {
+        self.forget_variable(&name);
+        self.matrices.lock().unwrap_or_else(PoisonError::into_inner).insert(name.clone(), matrix);
+        self.recompute_readers(&name);
+    }
+
+    /// Recomputes the formulas reading `name` after it was removed or replaced
+    /// outside an evaluation, committing their new values like an assignment.
+    fn recompute_readers(&self, name: &str) {
+        let interrupt = Interrupt::new(&self.generation);
+        loop {
+            let (base, version) = self.variables.versioned();
+            let mut working = Context::new();
+            let before = working.clone();
+            self.propagate(name, &base, &mut working, None, &interrupt);
+            if self.commit_variables(version, &before, &working) {
+                break;
+            }
+        }
+    }
+
+    /// Removes the variable `name` and any formula bound to it.
+    fn forget_variable(&self, name: &str) -> bool {
+        self.formulas.lock().unwrap_or_else(PoisonError::into_inner).remove(name);
+        let removed = self.variables.commit(|context| {
+            let mut found = false;
+            for scope in context.scopes.iter_mut() {
+                found |= scope.remove(name).is_some();
+            }
+            found
+        });
+        if removed {
+            self.record_changes([name.to_string()]);
+        }
+        removed
+    }
+
+    /// Versions of what the listener hears about, taken before an operation so
+    /// `notify_since` can report what it changed. `None` when nobody listens.
+    fn mark(&self) -> Option<[u64; 3]> {
+        self.listener.is_set().then(|| {
+            let variables = self.changes.lock().unwrap_or_else(PoisonError::into_inner).version();
+            [self.input_buffer.version(), self.history.version(), variables]
+        })
+    }
+
+    /// Sends the listener everything that changed after `mark`, in one call.
+    fn notify_since(&self, mark: Option<[u64; 3]>) {
+        let Some([buffer, history, variables]) = mark else {
+            return;
+        };
+        let mut changes = Vec::new();
+        let version = self.changes.lock().unwrap_or_else(PoisonError::into_inner).version();
+        if version != variables {
+            changes.push(Change::Variables { version });
+        }
+        let version = self.history.version();
+        if version != history {
+            /* A single new entry is sent as is; anything else is read again */
+            let appended = if version == history + 1 { self.history.snapshot().last().cloned() } else { None };
+            changes.push(match appended {
+                Some(entry) => Change::HistoryAppended { version, entry },
+                None => Change::History { version },
+            });
+        }
+        if self.input_buffer.version() != buffer {
+            changes.push(Change::Buffer(self.input_buffer.snapshot().to_string()));
+        }
+        self.listener.notify(&changes);
+    }
+
+    /// Logs changed names once their new values are visible to readers.
+    fn record_changes(&self, names: impl IntoIterator<Item = String>) {
+        self.changes.lock().unwrap_or_else(PoisonError::into_inner).record(names);
+    }
+
+    fn lookup_function(&self, name: &str) -> PyResult<Arc<vm::UserFunction>> {
+        lock_mutex(&self.functions)?
+            .get(name)
+            .cloned()
+            .ok_or_else(|| PyKeyError::new_err(format!("Unknown function: {}", name)))
+    }
+
+    fn resolve_dataset(&self, data: &Bound<'_, PyAny>) -> PyResult<Dataset> {
+        if let Ok(name) = data.extract::<String>() {
+            return lock_mutex(&self.datasets)?
+                .get(&name)
+                .cloned()
+                .ok_or_else(|| PyKeyError::new_err(format!("Unknown dataset: {}", name)));
+        }
+        Ok(Dataset::Memory(Arc::from(data.extract::<Vec<f64>>()?)))
+    }
+
+    /// Accepts either the name of a stored dataset or any sequence of numbers.
+    fn resolve_flows(&self, py: Python<'_>, flows: &Bound<'_, PyAny>) -> PyResult<Arc<[f64]>> {
+        let dataset = self.resolve_dataset(flows)?;
+        Ok(py.detach(|| dataset.values())?)
+    }
+
+    /// Identifies this calculator across clones, which share all their state.
+    pub(crate) fn identity(&self) -> usize {
+        Arc::as_ptr(&self.history) as usize
+    }
+
+    /// The most recent history entry, without copying the rest.
+    pub(crate) fn last_entry(&self) -> Option<String> {
+        self.history.snapshot().last().cloned()
+    }
+
+    /// Changes whenever anything `to_state` saves may have changed.
+    pub(crate) fn state_stamp(&self) -> [u64; 5] {
+        let word = self.word_size.lock().unwrap_or_else(PoisonError::into_inner).map_or(0, |s| {
+            u64::from(s.bits()) << 1 | u64::from(s.signed())
+        });
+        let changes = self.changes.lock().unwrap_or_else(PoisonError::into_inner).version();
+        [self.input_buffer.version(), self.history.version(), self.variables.version(), changes, word]
+    }
+
+    /// Everything a session needs to rebuild this calculator. Datasets and
+    /// matrices are not saved: they may be large, and all of them can be reloaded.
+    pub(crate) fn to_state(&self, mode: String) -> TabState {
+        let context = self.variables.snapshot();
+        let mut variables: Vec<(String, Number)> = Vec::new();
+        /* Outer scopes first, so inner bindings overwrite them on restore */
+        for scope in &context.scopes {
+            variables.extend(scope.iter().map(|(k, v)| (k.clone(), (**v).clone())));
+        }
+        let functions = self.functions.lock().unwrap_or_else(PoisonError::into_inner);
+        let formulas = self.formulas.lock().unwrap_or_else(PoisonError::into_inner);
+        TabState {
+            mode,
+            buffer: self.input_buffer.snapshot().to_string(),
+            history: self.history.snapshot().to_vec(),
+            variables,
+            /* `iter` is in dependency order, so restoring never meets a caller first */
+            functions: functions.iter().map(|f| format!("{} = {}", f.signature(), f.body)).collect(),
+            formulas: formulas.iter().map(|(name, f)| (name.clone(), f.text.clone())).collect(),
+            word_size: self.word_size.lock().unwrap_or_else(PoisonError::into_inner).map(|s| (s.bits(), s.signed())),
+        }
+    }
+
+    /// Rebuilds a calculator saved with `to_state`. Definitions that no longer
+    /// compile are skipped rather than failing the whole session, and returned
+    /// described so the caller can report them.
+    pub(crate) fn from_state(state: TabState) -> (Calculator, Vec<String>) {
+        let calc = Calculator::new();
+        let mut names = Vec::with_capacity(state.variables.len() + state.functions.len());
+        let mut dropped = Vec::new();
+
+        let mut context = Context::new();
+        for (name, value) in state.variables {
+            assign_variable(&mut context, &name, value);
+            names.push(name);
+        }
+        calc.variables.commit(|c| *c = context);
+
+        {
+            let mut functions = calc.functions.lock().unwrap_or_else(PoisonError::into_inner);
+            /* Saved callees first, but a session written by an older version may
+            not be; retry what failed for as long as another definition succeeds */
+            let mut pending: Vec<&String> = state.functions.iter().collect();
+            let mut failed = Vec::new();
+            loop {
+                failed.clear();
+                let before = pending.len();
+                pending.retain(|text| match Definition::parse(text).map(|def| functions.define(&def)) {
+                    Some(Ok(f)) => {
+                        names.push(f.signature());
+                        false
+                    }
+                    Some(Err(e)) => {
+                        failed.push(e.to_string());
+                        true
+                    }
+                    None => {
+                        failed.push("not a function definition".to_string());
+                        true
+                    }
+                });
+                if pending.is_empty() || pending.len() == before {
+                    break;
+                }
+            }
+            for (text, error) in pending.iter().zip(&failed) {
+                dropped.push(format!("function `{}`: {}", text, error));
+            }
+            let mut formulas = calc.formulas.lock().unwrap_or_else(PoisonError::into_inner);
+            for (name, text) in &state.formulas {
+                if let Err(e) = formulas.set(name, text, &functions) {
+                    dropped.push(format!("formula `{} := {}`: {}", name, text, e));
+                }
+            }
+        }
+
+        *calc.word_size.lock().unwrap_or_else(PoisonError::into_inner) =
+            state.word_size.and_then(|(bits, signed)| WordSize::new(bits, signed).ok());
+        calc.history.commit(|h| *h = state.history);
+        calc.input_buffer.commit(|b| *b = state.buffer);
+        /* So the first incremental variable listing includes everything */
+        calc.record_changes(names);
+        (calc, dropped)
     }
 }
 
 #[pymethods]
 impl Calculator {
     #[new]
-    fn new() -> Self {
+    pub fn new() -> Self {
         /* Initialize a new Calculator with empty history and "0" as input */
         Calculator {
-            history: Arc::new(Mutex::new(Vec::new())),
-            input_buffer: Arc::new(Mutex::new(String::from("0"))),
-            variables: Arc::new(Mutex::new(Context::new())),
+            history: Arc::new(Shared::new(Vec::new())),
+            input_buffer: Arc::new(Shared::new(String::from("0"))),
+            variables: Arc::new(Shared::timed(Context::new(), Timer::VariablesRead, Timer::VariablesWrite)),
+            word_size: Arc::new(Mutex::new(None)),
+            datasets: Arc::new(Mutex::new(Datasets::new())),
+            matrices: Arc::new(Mutex::new(Matrices::new())),
+            warm_start: Arc::new(Mutex::new(WarmStart::default())),
+            functions: Arc::new(Mutex::new(FunctionTable::default())),
+            formulas: Arc::new(Mutex::new(FormulaGraph::default())),
+            recomputed: Arc::new(Mutex::new(Vec::new())),
+            changes: Arc::new(Mutex::new(ChangeLog::default())),
+            formatted: Arc::new(Mutex::new(FormatCache::default())),
+            generation: Arc::new(AtomicU64::new(0)),
+            listener: Listener::default(),
         }
     }
 
-    fn input(&self, text: String) -> PyResult<String> {
-        /* Lock the buffer to safely modify it across threads */
-        let mut buffer = lock_mutex(&self.input_buffer)?;
+    pub fn input(&self, text: String) -> PyResult<String> {
+        /* Commit the edit as one update so concurrent edits cannot interleave */
+        Ok(self.input_buffer.commit(|buffer| {
+            /* If buffer is "0", replace it unless user enters decimal or paren */
+            if *buffer == "0" && text != "." && text != ")" {
+                *buffer = text;
+            } else {
+                /* Map special tokens like X to * and append */
+                let mapped = core_utils::map_input_token(&text);
+                buffer.push_str(&mapped);
 
-        /* If buffer is "0", replace it unless user enters decimal or paren */
-        if *buffer == "0" && text != "." && text != ")" {
-            *buffer = text;
-        } else {
-            /* Map special tokens like X to * and append */
-            let mapped = core_utils::map_input_token(&text);
-            buffer.push_str(&mapped);
-
-            /* If a function like sin( is added, ensure opening paren */
-            if core_utils::should_auto_paren(mapped) {
-                buffer.push('(');
+                /* If a function like sin( is added, ensure opening paren */
+                if core_utils::should_auto_paren(mapped) {
+                    buffer.push('(');
+                }
             }
-        }
-        /* Return the updated buffer */
-        Ok(buffer.clone())
+            /* Return the updated buffer */
+            buffer.clone()
+        }))
     }
 
     fn backspace(&self) -> PyResult<String> {
-        let mut buffer = lock_mutex(&self.input_buffer)?;
-        /* Remove the last character if buffer is not empty */
-        if !buffer.is_empty() {
-            buffer.pop();
-            /* If buffer becomes empty, reset to "0" */
-            if buffer.is_empty() {
-                *buffer = "0".to_string();
+        Ok(self.input_buffer.commit(|buffer| {
+            /* Remove the last character if buffer is not empty */
+            if !buffer.is_empty() {
+                buffer.pop();
+                /* If buffer becomes empty, reset to "0" */
+                if buffer.is_empty() {
+                    *buffer = "0".to_string();
+                }
             }
-        }
-        Ok(buffer.clone())
+            buffer.clone()
+        }))
     }
 
-    fn clear(&self) -> PyResult<String> {
+    pub fn clear(&self) -> PyResult<String> {
         /* Reset the entire buffer to "0" */
-        let mut buffer = lock_mutex(&self.input_buffer)?;
-        *buffer = "0".to_string();
-        Ok(buffer.clone())
+        Ok(self.input_buffer.commit(|buffer| {
+            *buffer = "0".to_string();
+            buffer.clone()
+        }))
     }
 
     fn get_buffer(&self) -> PyResult<String> {
-        Ok(lock_mutex(&self.input_buffer)?.clone())
+        Ok(self.input_buffer.snapshot().to_string())
     }
 
-    fn evaluate(&self, _expression: Option<String>) -> PyResult<String> {
+    pub fn evaluate(&self, _expression: Option<String>) -> PyResult<String> {
         let expr_to_eval = if let Some(e) = _expression {
             e
         } else {
-            lock_mutex(&self.input_buffer)?.clone()
+            self.input_buffer.snapshot().to_string()
         };
 
-        let mut context = lock_mutex(&self.variables)?;
-        let res = self.evaluate_internal(&expr_to_eval, &mut context);
+        let word_size = *lock_mutex(&self.word_size)?;
+        Ok(metrics::returned(self.run_evaluation(&expr_to_eval, word_size)))
+    }
 
-        let output = match &res {
-            Ok(n) => core_utils::format_number(n.clone()),
-            Err(e) => e.to_string(),
+    pub fn set_expression(&self, expression: String) -> PyResult<()> {
+        self.input_buffer.commit(|buffer| *buffer = expression);
+        Ok(())
+    }
+
+    /// Replaces the characters `start..end` of the buffer with `text` (`end=None`
+    /// means to the end of the buffer) and reports everything the display needs in
+    /// one call: `(buffer, preview, history_version, variables_version, changed,
+    /// removed, complete)`, the last four as in `get_variable_changes(since)`.
+    /// An empty edit changes nothing and just reports the current state.
+    #[pyo3(signature = (text, start=0, end=None, since=0))]
+    fn apply_edit(
+        &self,
+        text: String,
+        start: usize,
+        end: Option<usize>,
+        since: u64,
+    ) -> PyResult<(String, String, u64, u64, std::collections::HashMap<String, String>, Vec<String>, bool)> {
+        let buffer = if text.is_empty() && end == Some(start) {
+            self.input_buffer.snapshot().to_string()
+        } else {
+            self.input_buffer.commit(|buffer| {
+                /* Positions count characters, as in the Gtk.Entry */
+                let byte = |chars: usize| buffer.char_indices().nth(chars).map_or(buffer.len(), |(i, _)| i);
+                let from = byte(start);
+                let to = end.map_or(buffer.len(), byte).max(from);
+                buffer.replace_range(from..to, &text);
+                buffer.clone()
+            })
         };
 
-        if res.is_ok() && !expr_to_eval.trim().is_empty() {
-            if let Ok(mut h) = self.history.lock() {
-                h.push(format!("{} = {}", expr_to_eval, output));
-            }
-            if let Ok(mut b) = self.input_buffer.lock() {
-                *b = output.clone();
-            }
-        }
-        Ok(output)
-    }
+        /* Plain numbers evaluate to themselves, so they get no preview */
+        let is_number = !buffer.is_empty() && buffer.replacen('.', "", 1).chars().all(|c| c.is_ascii_digit());
+        let preview = if is_number { String::new() } else { self.preview(buffer.clone())? };
 
-    fn set_expression(&self, expression: String) -> PyResult<()> {
-        let mut buffer = lock_mutex(&self.input_buffer)?;
-        *buffer = expression;
-        Ok(())
+        let (variables_version, changed, removed, complete) = self.get_variable_changes(since)?;
+        let history_version = self.history.version();
+        Ok((metrics::returned(buffer), preview, history_version, variables_version, changed, removed, complete))
     }
 
     fn evaluate_async<'py>(
@@ -162,93 +930,469 @@ impl Calculator {
         let buffer_val = if let Some(e) = expression {
             e
         } else {
-            match lock_mutex(&self.input_buffer) {
-                Ok(g) => g.clone(),
-                Err(e) => return Err(e.into()),
-            }
+            self.input_buffer.snapshot().to_string()
         };
 
+        let word_size = *lock_mutex(&self.word_size)?;
         let self_clone = self.clone();
-        let expr_for_task = buffer_val.clone();
-        let history = self.history.clone();
-        let input_buffer = self.input_buffer.clone();
 
         future_into_py(py, async move {
-            let res = tokio::task::spawn_blocking(move || {
-                let mut context = self_clone.variables.lock().unwrap();
-                self_clone.evaluate_internal(&expr_for_task, &mut context)
+            let output = tokio::task::spawn_blocking(move || {
+                self_clone.run_evaluation(&buffer_val, word_size)
             })
             .await
             .unwrap();
 
-            let output = match &res {
-                Ok(n) => core_utils::format_number(n.clone()),
-                Err(e) => e.to_string(),
-            };
-
-            if res.is_ok() && !buffer_val.trim().is_empty() {
-                if let Ok(mut h) = history.lock() {
-                    h.push(format!("{} = {}", buffer_val, output));
-                }
-                if let Ok(mut b) = input_buffer.lock() {
-                    *b = output.clone();
-                }
-            }
-
             Ok(output)
         })
     }
 
+    /// Stops any running evaluation at its next check. It reports
+    /// "Calculation cancelled" and changes nothing.
+    fn cancel(&self) {
+        self.generation.fetch_add(1, Ordering::Relaxed);
+    }
+
     fn get_history(&self) -> PyResult<Vec<String>> {
-        Ok(lock_mutex(&self.history)?.clone())
+        let _span = metrics::span(Timer::GetHistory);
+        let history = self.history.snapshot().to_vec();
+        metrics::count(Counter::BytesToPython, history.iter().map(|h| h.len() as u64).sum());
+        Ok(history)
     }
 
-    fn clear_history(&self) -> PyResult<()> {
-        let mut h = lock_mutex(&self.history)?;
-        h.clear();
+    pub fn clear_history(&self) -> PyResult<()> {
+        let mark = self.mark();
+        self.history.commit(|h| h.clear());
+        self.notify_since(mark);
         Ok(())
     }
 
-    fn convert_to_hex(&self) -> PyResult<String> {
+    /// Registers `callback(changes)`, called after every evaluation, base
+    /// conversion and history clear with what it changed, as a list of
+    /// `(kind, payload)`: `("buffer", text)`, `("history_appended", (version, entry))`,
+    /// `("history", version)` or `("variables", version)`. It runs on the thread
+    /// that made the change. Edits that return the new buffer to their caller
+    /// (input, apply_edit, ...) are not reported. None unregisters it.
+    #[pyo3(signature = (callback=None))]
+    fn set_listener(&self, callback: Option<Py<PyAny>>) {
+        self.listener.set(callback);
+    }
+
+    pub fn convert_to_hex(&self) -> PyResult<String> {
         self.convert_base_internal(16, "0x")
     }
 
-    fn convert_to_bin(&self) -> PyResult<String> {
+    pub fn convert_to_bin(&self) -> PyResult<String> {
         self.convert_base_internal(2, "0b")
     }
 
-    fn preview(&self, expression: String) -> PyResult<String> {
-        // Optimization: Use try_lock to avoid freezing the UI if a long calculation is running.
-        // If the variables context is locked (busy), we just skip the preview update.
-        let context_guard = match self.variables.try_lock() {
-            Ok(guard) => guard,
-            Err(std::sync::TryLockError::WouldBlock) => return Ok("...".to_string()),
-            Err(e) => return Err(PyRuntimeError::new_err(format!("Lock poisoned: {}", e))),
-        };
+    pub fn preview(&self, expression: String) -> PyResult<String> {
+        let _span = metrics::span(Timer::Preview);
+        /* A definition is only applied on evaluate, never while typing */
+        if Definition::parse(&expression).is_some() || reactive::parse_formula(&expression).is_some() {
+            return Ok("".to_string());
+        }
+
+        // Previews read the last committed variables, so they stay live while a
+        // long calculation is running.
+        let snapshot = self.variables.snapshot();
+
+        // Evaluate in a scratch context so the preview never modifies actual state
+        let mut scratch = self.scratch_context(&snapshot, &expression);
+        drop(snapshot);
 
-        // Clone context to ensure preview doesn't modify actual state (if we had mutable ops)
-        let mut context_clone = context_guard.clone();
-        drop(context_guard); // Release lock immediately after cloning (though clone might take a microsecond)
-        
-        // Actually, if evaluate is running, we won't get the lock at all.
-        // So we return "...".
-        
-        let res = engine::evaluate(&expression, &mut context_clone);
+        let word_size = *lock_mutex(&self.word_size)?;
+        /* Matrix kernels are held to the same budget, so a large product never stalls typing */
+        let interrupt = Interrupt::new(&self.generation).with_budget(PREVIEW_BUDGET).with_max_bits(PREVIEW_MAX_BITS);
+        if word_size.is_none() {
+            if let Some((_, res)) = self.evaluate_matrix(&expression, &scratch, &interrupt) {
+                return Ok(match res {
+                    Ok(linalg::Value::Matrix(m)) => metrics::returned(linalg::format(&m)),
+                    Ok(linalg::Value::Scalar(x)) => metrics::returned(format_number(Number::Float(x))),
+                    Err(_) => "".to_string(),
+                });
+            }
+        }
+        let res = self.evaluate_internal(&expression, &mut scratch, word_size, &interrupt);
         match res {
-            Ok(n) => Ok(core_utils::format_number(n)),
+            Ok(n) => Ok(metrics::returned(format_number(n))),
             Err(_) => Ok("".to_string()),
         }
     }
 
+    /// Evaluates many expressions against one consistent snapshot of the variables,
+    /// in parallel and without holding the lock. Nothing is assigned or recorded.
+    fn evaluate_batch(&self, py: Python<'_>, expressions: Vec<String>) -> PyResult<Vec<String>> {
+        let _span = metrics::span(Timer::EvaluateBatch);
+        let snapshot = self.variables.snapshot();
+        let word_size = *lock_mutex(&self.word_size)?;
+        let interrupt = Interrupt::new(&self.generation);
+        let evaluate = |expression: &String| {
+            let mut scratch = self.scratch_context(&snapshot, expression);
+            match self.evaluate_internal(expression, &mut scratch, word_size, &interrupt) {
+                Ok(n) => format_number(n),
+                Err(e) => e.to_string(),
+            }
+        };
+
+        let evaluate = &evaluate;
+        let results: Vec<String> = py.detach(|| {
+            let workers = std::thread::available_parallelism().map_or(1, |n| n.get());
+            let chunk_len = expressions.len().div_ceil(workers).max(1);
+            std::thread::scope(|scope| {
+                let handles: Vec<_> = expressions
+                    .chunks(chunk_len)
+                    .map(|chunk| scope.spawn(move || chunk.iter().map(evaluate).collect::<Vec<_>>()))
+                    .collect();
+                handles
+                    .into_iter()
+                    .flat_map(|h| h.join().expect("batch worker panicked"))
+                    .collect()
+            })
+        });
+        metrics::count(Counter::BytesToPython, results.iter().map(|r| r.len() as u64).sum());
+        Ok(results)
+    }
+
+    /// Evaluates `expression` as a machine word and renders it in every base at once.
+    /// Uses the calculator's word size, or 64-bit signed when none is selected.
+    fn preview_bases(&self, expression: String) -> PyResult<std::collections::HashMap<String, String>> {
+        let mut result = std::collections::HashMap::new();
+        let size = match *lock_mutex(&self.word_size)? {
+            Some(size) => size,
+            None => WordSize::new(64, true).map_err(|e| PyValueError::new_err(e.to_string()))?,
+        };
+
+        let snapshot = self.variables.snapshot();
+        let mut scratch = self.scratch_context(&snapshot, &expression);
+        drop(snapshot);
+
+        if let Ok(value) = Self::evaluate_word(&expression, size, &mut scratch) {
+            result.insert("hex".to_string(), value.to_hex());
+            result.insert("dec".to_string(), value.to_dec());
+            result.insert("oct".to_string(), value.to_oct());
+            result.insert("bin".to_string(), value.to_bin());
+        }
+        Ok(result)
+    }
+
+    /// Selects the machine word for programming mode. `bits=None` restores unbounded math.
+    #[pyo3(signature = (bits, signed = true))]
+    pub fn set_word_size(&self, bits: Option<u32>, signed: bool) -> PyResult<()> {
+        let size = match bits {
+            Some(b) => Some(WordSize::new(b, signed).map_err(|e| PyValueError::new_err(e.to_string()))?),
+            None => None,
+        };
+        *lock_mutex(&self.word_size)? = size;
+        Ok(())
+    }
+
+    fn get_word_size(&self) -> PyResult<Option<(u32, bool)>> {
+        Ok(lock_mutex(&self.word_size)?.map(|s| (s.bits(), s.signed())))
+    }
+
     fn get_variables(&self) -> PyResult<std::collections::HashMap<String, String>> {
-        let context = lock_mutex(&self.variables)?;
+        let context = self.variables.snapshot();
+        let mut formatted = lock_mutex(&self.formatted)?;
         let mut result = std::collections::HashMap::new();
+        /* Innermost scope last, so shadowing bindings win as in lookups */
         for scope in &context.scopes {
             for (k, v) in scope {
-                result.insert(k.clone(), core_utils::format_number((**v).clone()));
+                result.insert(k.clone(), formatted.format(k, v));
             }
         }
+        drop(formatted);
+        for f in lock_mutex(&self.functions)?.iter() {
+            result.insert(f.signature(), f.body.clone());
+        }
+        metrics::count(Counter::BytesToPython, result.iter().map(|(k, v)| (k.len() + v.len()) as u64).sum());
         Ok(result)
     }
-}
 
+    /// Version of the variable listing; bumps on every committed change.
+    fn get_variables_version(&self) -> PyResult<u64> {
+        Ok(lock_mutex(&self.changes)?.version())
+    }
+
+    /// Variables and functions added, changed or removed after version `since`:
+    /// (version, changed name -> display value, removed names, complete).
+    /// `complete` is true when `since` is too old for the log and `changed` is
+    /// the full listing instead; anything not in it has been removed.
+    fn get_variable_changes(
+        &self,
+        since: u64,
+    ) -> PyResult<(u64, std::collections::HashMap<String, String>, Vec<String>, bool)> {
+        /* Read the log before the snapshot: every logged change is then visible */
+        let (version, names) = {
+            let changes = lock_mutex(&self.changes)?;
+            (changes.version(), changes.since(since))
+        };
+        let Some(names) = names else {
+            return Ok((version, self.get_variables()?, Vec::new(), true));
+        };
+
+        let context = self.variables.snapshot();
+        let functions = lock_mutex(&self.functions)?;
+        let mut formatted = lock_mutex(&self.formatted)?;
+        let mut changed = std::collections::HashMap::new();
+        let mut removed = Vec::new();
+        for name in names {
+            if let Some(value) = context.scopes.iter().rev().find_map(|scope| scope.get(&name)) {
+                let text = formatted.format(&name, value);
+                changed.insert(name, text);
+            } else if let Some(f) = functions.iter().find(|f| f.signature() == name) {
+                changed.insert(name, f.body.clone());
+            } else {
+                formatted.forget(&name);
+                removed.push(name);
+            }
+        }
+        Ok((version, changed, removed, false))
+    }
+
+    /// Deletes a variable from every scope, along with any formula bound to it.
+    fn remove_variable(&self, name: String) -> PyResult<bool> {
+        let removed = self.forget_variable(&name);
+        self.recompute_readers(&name);
+        Ok(removed)
+    }
+
+    /// Calls a user function with plain numbers, without going through the parser.
+    fn call_function(&self, py: Python<'_>, name: String, args: Vec<f64>) -> PyResult<f64> {
+        let function = self.lookup_function(&name)?;
+        if args.len() != function.params.len() {
+            return Err(PyValueError::new_err(format!(
+                "{} expects {} argument(s), got {}",
+                name,
+                function.params.len(),
+                args.len()
+            )));
+        }
+        let context = self.variables.snapshot();
+        py.detach(|| Machine::new(&context).run(&function.program, &args))
+            .map_err(|e| PyValueError::new_err(e.to_string()))
+    }
+
+    /// Values of a one-argument function over `start, start + step, ...` up to `stop`.
+    /// The function is compiled once and every point reuses the same VM stack.
+    fn tabulate(&self, py: Python<'_>, name: String, start: f64, stop: f64, step: f64) -> PyResult<Vec<f64>> {
+        let function = self.lookup_function(&name)?;
+        if function.params.len() != 1 {
+            return Err(PyValueError::new_err(format!("{} must take exactly one argument", name)));
+        }
+        if !(step.is_finite() && step != 0.0) || (stop - start) / step < 0.0 {
+            return Err(PyValueError::new_err("Invalid range"));
+        }
+        let points = ((stop - start) / step + 1e-9).floor() + 1.0;
+        if !(points <= TABULATE_MAX as f64) {
+            return Err(PyValueError::new_err(format!("Range has more than {} points", TABULATE_MAX)));
+        }
+        let count = points as usize;
+        let context = self.variables.snapshot();
+        py.detach(|| {
+            let mut machine = Machine::new(&context);
+            let mut values = Vec::with_capacity(count);
+            for i in 0..count {
+                let x = start + step * i as f64;
+                values.push(machine.run(&function.program, &[x])?);
+            }
+            Ok(values)
+        })
+        .map_err(|e: vm::FunctionError| PyValueError::new_err(e.to_string()))
+    }
+
+    fn remove_function(&self, name: String) -> PyResult<bool> {
+        let mut functions = lock_mutex(&self.functions)?;
+        let signature = functions.get(&name).map(|f| f.signature());
+        let removed = functions.remove(&name).map_err(|e| PyValueError::new_err(e.to_string()))?;
+        drop(functions);
+        self.record_changes(signature);
+        Ok(removed)
+    }
+
+    /// Lock acquisitions and total/worst wait in nanoseconds, per piece of state.
+    fn get_lock_stats(&self) -> PyResult<std::collections::HashMap<String, std::collections::HashMap<String, u64>>> {
+        let mut result = std::collections::HashMap::new();
+        for (name, stats) in [
+            ("variables", self.variables.stats()),
+            ("history", self.history.stats()),
+            ("input_buffer", self.input_buffer.stats()),
+        ] {
+            let s = stats.snapshot();
+            let entry: std::collections::HashMap<String, u64> = [
+                ("reads", s.reads),
+                ("writes", s.writes),
+                ("read_wait_ns", s.read_wait_ns),
+                ("write_wait_ns", s.write_wait_ns),
+                ("max_wait_ns", s.max_wait_ns),
+            ]
+            .into_iter()
+            .map(|(k, v)| (k.to_string(), v))
+            .collect();
+            result.insert(name.to_string(), entry);
+        }
+        Ok(result)
+    }
+
+    fn reset_lock_stats(&self) -> PyResult<()> {
+        self.variables.stats().reset();
+        self.history.stats().reset();
+        self.input_buffer.stats().reset();
+        Ok(())
+    }
+
+    /// Formulas bound with `name := expr`, by name.
+    fn get_formulas(&self) -> PyResult<std::collections::HashMap<String, String>> {
+        Ok(lock_mutex(&self.formulas)?
+            .iter()
+            .map(|(name, f)| (name.clone(), f.text.clone()))
+            .collect())
+    }
+
+    /// Stops recomputing `name`; the variable keeps its current value.
+    fn remove_formula(&self, name: String) -> PyResult<bool> {
+        Ok(lock_mutex(&self.formulas)?.remove(&name))
+    }
+
+    /// Formulas the last assignment recomputed, in evaluation order.
+    fn get_recomputed(&self) -> PyResult<Vec<String>> {
+        Ok(lock_mutex(&self.recomputed)?.clone())
+    }
+
+    /// Enables or disables constant folding and subexpression hoisting for user
+    /// functions and the expressions that call them.
+    fn set_optimization(&self, enabled: bool) -> PyResult<()> {
+        lock_mutex(&self.functions)?
+            .set_optimize(enabled)
+            .map_err(|e| PyValueError::new_err(e.to_string()))
+    }
+
+    /// What the optimizer does to `expression`, as
+    /// (folded, simplified, hoisted subexpressions, ops before, ops after).
+    fn optimization_report(&self, expression: String) -> PyResult<(usize, usize, Vec<String>, usize, usize)> {
+        let functions = lock_mutex(&self.functions)?;
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, &expression).map_err(|e| PyValueError::new_err(e.to_string()))?;
+        let (_, r) = vm::compile_with_report(&parsed, &[], &functions)
+            .map_err(|e| PyValueError::new_err(e.to_string()))?;
+        Ok((r.folded, r.simplified, r.hoisted, r.ops_before, r.ops_after))
+    }
+
+    /// Stores a numeric series under `name`, e.g. cash flows for `irr(name)`.
+    fn set_dataset(&self, name: String, values: Vec<f64>) -> PyResult<()> {
+        lock_mutex(&self.datasets)?.insert(name, Dataset::Memory(Arc::from(values)));
+        Ok(())
+    }
+
+    /// Registers a file-backed dataset. Nothing is read until it is used.
+    fn load_dataset(&self, name: String, path: String) -> PyResult<()> {
+        let dataset = Dataset::from_file(path)?;
+        lock_mutex(&self.datasets)?.insert(name, dataset);
+        Ok(())
+    }
+
+    fn remove_dataset(&self, name: String) -> PyResult<bool> {
+        Ok(lock_mutex(&self.datasets)?.remove(&name).is_some())
+    }
+
+    /// Dataset names with their lengths (None for text files not yet read).
+    fn get_datasets(&self) -> PyResult<std::collections::HashMap<String, Option<usize>>> {
+        Ok(lock_mutex(&self.datasets)?
+            .iter()
+            .map(|(k, v)| (k.clone(), v.len_hint()))
+            .collect())
+    }
+
+    /// Stores a matrix given as a list of equal-length rows.
+    pub fn set_matrix(&self, name: String, rows: Vec<Vec<f64>>) -> PyResult<()> {
+        let matrix = Matrix::from_rows(&rows).map_err(|e| PyValueError::new_err(e.to_string()))?;
+        self.store_matrix(name, matrix);
+        Ok(())
+    }
+
+    /// Stores a vector, which is a matrix with one column.
+    fn set_vector(&self, name: String, values: Vec<f64>) -> PyResult<()> {
+        self.store_matrix(name, Matrix::column(Arc::from(values)));
+        Ok(())
+    }
+
+    fn get_matrix(&self, name: String) -> PyResult<Vec<Vec<f64>>> {
+        lock_mutex(&self.matrices)?
+            .get(&name)
+            .map(Matrix::to_rows)
+            .ok_or_else(|| PyKeyError::new_err(format!("Unknown matrix: {}", name)))
+    }
+
+    fn remove_matrix(&self, name: String) -> PyResult<bool> {
+        let removed = lock_mutex(&self.matrices)?.remove(&name).is_some();
+        if removed {
+            self.record_changes([name.clone()]);
+            self.recompute_readers(&name);
+        }
+        Ok(removed)
+    }
+
+    /// Matrix names with their (rows, cols) shapes.
+    fn get_matrices(&self) -> PyResult<std::collections::HashMap<String, (usize, usize)>> {
+        Ok(lock_mutex(&self.matrices)?
+            .iter()
+            .map(|(k, v)| (k.clone(), v.shape()))
+            .collect())
+    }
+
+    /// count/mean/var/std/min/max of a dataset name or sequence, in one pass.
+    fn statistics(&self, py: Python<'_>, data: &Bound<'_, PyAny>) -> PyResult<std::collections::HashMap<String, f64>> {
+        let dataset = self.resolve_dataset(data)?;
+        let m = py.detach(|| stats::dataset_moments(&dataset))?;
+
+        let mut result = std::collections::HashMap::new();
+        result.insert("count".to_string(), m.count as f64);
+        if m.count > 0 {
+            result.insert("mean".to_string(), m.mean);
+            result.insert("min".to_string(), m.min);
+            result.insert("max".to_string(), m.max);
+        }
+        if let (Some(var), Some(std)) = (m.variance(), m.std_dev()) {
+            result.insert("var".to_string(), var);
+            result.insert("std".to_string(), std);
+        }
+        Ok(result)
+    }
+
+    fn median(&self, py: Python<'_>, data: &Bound<'_, PyAny>) -> PyResult<f64> {
+        let dataset = self.resolve_dataset(data)?;
+        py.detach(|| stats::dataset_median(&dataset))
+            .map_err(|e| PyValueError::new_err(e.to_string()))
+    }
+
+    #[pyo3(signature = (flows, guess = None))]
+    fn irr(&self, py: Python<'_>, flows: &Bound<'_, PyAny>, guess: Option<f64>) -> PyResult<f64> {
+        let flows = self.resolve_flows(py, flows)?;
+        let guess = guess.or(lock_mutex(&self.warm_start)?.irr);
+        let res = py
+            .detach(|| financial::irr(&flows, guess))
+            .map_err(|e| PyValueError::new_err(e.to_string()))?;
+        lock_mutex(&self.warm_start)?.irr = Some(res);
+        Ok(res)
+    }
+
+    fn npv(&self, py: Python<'_>, rate: f64, flows: &Bound<'_, PyAny>) -> PyResult<f64> {
+        let flows = self.resolve_flows(py, flows)?;
+        py.detach(|| financial::npv(rate, &flows))
+            .map_err(|e| PyValueError::new_err(e.to_string()))
+    }
+
+    #[pyo3(signature = (nper, pmt, pv, fv = 0.0, when = 0.0, guess = None))]
+    fn rate(&self, nper: f64, pmt: f64, pv: f64, fv: f64, when: f64, guess: Option<f64>) -> PyResult<f64> {
+        let guess = guess.or(lock_mutex(&self.warm_start)?.rate);
+        let res = financial::rate(nper, pmt, pv, fv, when, guess)
+            .map_err(|e| PyValueError::new_err(e.to_string()))?;
+        lock_mutex(&self.warm_start)?.rate = Some(res);
+        Ok(res)
+    }
+
+    #[pyo3(signature = (rate, pmt, pv, fv = 0.0, when = 0.0))]
+    fn nper(&self, rate: f64, pmt: f64, pv: f64, fv: f64, when: f64) -> PyResult<f64> {
+        financial::nper(rate, pmt, pv, fv, when).map_err(|e| PyValueError::new_err(e.to_string()))
+    }
+}
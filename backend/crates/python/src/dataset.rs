@@ -0,0 +1,154 @@
+//! Named numeric series that live next to a calculator's variables.
+//!
+//! A dataset is either held in memory or backed by a file that is streamed on
+//! demand. Binary files are raw little-endian `f64`s (`.f64` / `.bin`); anything
+//! else is read as text with values separated by whitespace, commas or newlines.
+
+use std::collections::HashMap;
+use std::fs::File;
+use std::io::{self, BufRead, BufReader, Read, Seek, SeekFrom};
+use std::path::{Path, PathBuf};
+use std::sync::Arc;
+
+pub type Datasets = HashMap<String, Dataset>;
+
+const READ_CHUNK: usize = 1 << 16;
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum FileFormat {
+    Binary,
+    Text,
+}
+
+#[derive(Debug, Clone)]
+pub enum Dataset {
+    Memory(Arc<[f64]>),
+    File { path: PathBuf, format: FileFormat },
+}
+
+impl Dataset {
+    pub fn from_file(path: impl Into<PathBuf>) -> io::Result<Self> {
+        let path = path.into();
+        let format = match path.extension().and_then(|e| e.to_str()) {
+            Some("f64") | Some("bin") => FileFormat::Binary,
+            _ => FileFormat::Text,
+        };
+        let meta = std::fs::metadata(&path)?;
+        if format == FileFormat::Binary && meta.len() % 8 != 0 {
+            return Err(io::Error::new(
+                io::ErrorKind::InvalidData,
+                "binary dataset size is not a multiple of 8 bytes",
+            ));
+        }
+        Ok(Dataset::File { path, format })
+    }
+
+    /// Number of values when it is known without reading the data.
+    pub fn len_hint(&self) -> Option<usize> {
+        match self {
+            Dataset::Memory(values) => Some(values.len()),
+            Dataset::File { path, format: FileFormat::Binary } => {
+                std::fs::metadata(path).ok().map(|m| (m.len() / 8) as usize)
+            }
+            Dataset::File { .. } => None,
+        }
+    }
+
+    /// All values in memory. Free for in-memory datasets, a full read for files.
+    pub fn values(&self) -> io::Result<Arc<[f64]>> {
+        match self {
+            Dataset::Memory(values) => Ok(values.clone()),
+            Dataset::File { .. } => Ok(Arc::from(self.to_vec()?)),
+        }
+    }
+
+    /// An owned copy of the values, for callers that reorder them. A file is
+    /// read straight into it, so it is held in memory only once.
+    pub fn to_vec(&self) -> io::Result<Vec<f64>> {
+        match self {
+            Dataset::Memory(values) => Ok(values.to_vec()),
+            Dataset::File { path, format } => {
+                let mut values = Vec::with_capacity(self.len_hint().unwrap_or(0));
+                for_each_chunk(path, *format, 0, u64::MAX, |chunk| values.extend_from_slice(chunk))?;
+                Ok(values)
+            }
+        }
+    }
+}
+
+fn read_binary_range(
+    path: &Path,
+    start: u64,
+    count: u64,
+    mut visit: impl FnMut(&[f64]),
+) -> io::Result<()> {
+    let mut file = File::open(path)?;
+    file.seek(SeekFrom::Start(start * 8))?;
+    let mut reader = BufReader::with_capacity(READ_CHUNK * 8, file).take(count.saturating_mul(8));
+
+    let mut bytes = vec![0u8; READ_CHUNK * 8];
+    let mut values = Vec::with_capacity(READ_CHUNK);
+    loop {
+        let mut filled = 0;
+        while filled < bytes.len() {
+            let n = reader.read(&mut bytes[filled..])?;
+            if n == 0 {
+                break;
+            }
+            filled += n;
+        }
+        if filled == 0 {
+            return Ok(());
+        }
+        values.clear();
+        values.extend(
+            bytes[..filled - filled % 8]
+                .chunks_exact(8)
+                .map(|b| f64::from_le_bytes(b.try_into().unwrap())),
+        );
+        visit(&values);
+        if filled < bytes.len() {
+            return Ok(());
+        }
+    }
+}
+
+fn read_text(path: &Path, mut visit: impl FnMut(&[f64])) -> io::Result<()> {
+    let reader = BufReader::new(File::open(path)?);
+    let mut values = Vec::with_capacity(READ_CHUNK);
+    for line in reader.lines() {
+        let line = line?;
+        for field in line.split(|c: char| c == ',' || c.is_whitespace()) {
+            if field.is_empty() {
+                continue;
+            }
+            let v = field.parse::<f64>().map_err(|_| {
+                io::Error::new(io::ErrorKind::InvalidData, format!("not a number: {}", field))
+            })?;
+            values.push(v);
+            if values.len() == READ_CHUNK {
+                visit(&values);
+                values.clear();
+            }
+        }
+    }
+    if !values.is_empty() {
+        visit(&values);
+    }
+    Ok(())
+}
+
+/// Streams a file dataset in bounded chunks. `start`/`count` select a range of
+/// values and only apply to binary files; text is always read whole.
+pub fn for_each_chunk(
+    path: &Path,
+    format: FileFormat,
+    start: u64,
+    count: u64,
+    visit: impl FnMut(&[f64]),
+) -> io::Result<()> {
+    match format {
+        FileFormat::Binary => read_binary_range(path, start, count, visit),
+        FileFormat::Text => read_text(path, visit),
+    }
+}
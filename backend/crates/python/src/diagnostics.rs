@@ -0,0 +1,56 @@
+//! Module-level functions exposing `metrics` to Python.
+
+use pyo3::prelude::*;
+use pyo3::exceptions::PyOSError;
+use pyo3::types::PyDict;
+
+use crate::metrics::{self, Counter};
+
+/// Turns collection on or off. Tracing also keeps every span for `dump_trace`.
+#[pyfunction]
+#[pyo3(signature = (enabled, trace=false))]
+pub fn set_stats_enabled(enabled: bool, trace: bool) {
+    metrics::set_enabled(enabled, trace);
+}
+
+/// Timers as count, total, max and p50/p90/p99 in nanoseconds, plus counters
+/// and cache hit rates.
+#[pyfunction]
+pub fn get_stats(py: Python<'_>) -> PyResult<Bound<'_, PyDict>> {
+    let stats = PyDict::new(py);
+    stats.set_item("enabled", metrics::enabled())?;
+    stats.set_item("tracing", metrics::tracing())?;
+
+    let timers = PyDict::new(py);
+    for (name, t) in metrics::timers() {
+        let entry = PyDict::new(py);
+        entry.set_item("count", t.count)?;
+        entry.set_item("total_ns", t.total_ns)?;
+        entry.set_item("max_ns", t.max_ns)?;
+        entry.set_item("p50_ns", t.p50_ns)?;
+        entry.set_item("p90_ns", t.p90_ns)?;
+        entry.set_item("p99_ns", t.p99_ns)?;
+        timers.set_item(name, entry)?;
+    }
+    stats.set_item("timers", timers)?;
+    stats.set_item("counters", metrics::counters().into_iter().collect::<std::collections::HashMap<_, _>>())?;
+
+    let rates = PyDict::new(py);
+    rates.set_item("program_cache", metrics::hit_rate(Counter::ProgramCacheHit, Counter::ProgramCacheMiss))?;
+    rates.set_item("format_cache", metrics::hit_rate(Counter::FormatCacheHit, Counter::FormatCacheMiss))?;
+    stats.set_item("hit_rates", rates)?;
+    Ok(stats)
+}
+
+#[pyfunction]
+pub fn reset_stats() {
+    metrics::reset();
+}
+
+/// Writes the recorded spans as Chrome trace events. Returns how many were written.
+#[pyfunction]
+pub fn dump_trace(py: Python<'_>, path: String) -> PyResult<usize> {
+    let (count, json) = metrics::trace_json();
+    py.detach(|| std::fs::write(&path, json)).map_err(|e| PyOSError::new_err(format!("{}: {}", path, e)))?;
+    Ok(count)
+}
@@ -0,0 +1,33 @@
+use neocalc_core::EngineError;
+use thiserror::Error;
+
+use crate::financial::SolverError;
+use crate::integer::IntegerError;
+use crate::linalg::LinalgError;
+use crate::programming::WordError;
+use crate::reactive::ReactiveError;
+use crate::stats::StatsError;
+use crate::vm::FunctionError;
+
+/// Errors produced while evaluating on behalf of a `Calculator`.
+#[derive(Debug, Error)]
+pub enum BackendError {
+    #[error(transparent)]
+    Engine(#[from] EngineError),
+    #[error(transparent)]
+    Word(#[from] WordError),
+    #[error(transparent)]
+    Solver(#[from] SolverError),
+    #[error(transparent)]
+    Stats(#[from] StatsError),
+    #[error(transparent)]
+    Function(#[from] FunctionError),
+    #[error(transparent)]
+    Integer(#[from] IntegerError),
+    #[error(transparent)]
+    Linalg(#[from] LinalgError),
+    #[error(transparent)]
+    Reactive(#[from] ReactiveError),
+    #[error("Could not read dataset: {0}")]
+    Dataset(#[from] std::io::Error),
+}
@@ -0,0 +1,66 @@
+//! Change events pushed to the UI after an evaluation, so it can update from
+//! what changed instead of reading the whole state back.
+
+use std::sync::{Arc, Mutex, PoisonError};
+
+use pyo3::prelude::*;
+use pyo3::IntoPyObjectExt;
+
+/// Something an evaluation changed.
+#[derive(Debug, Clone, PartialEq)]
+pub enum Change {
+    /// The buffer now holds this text.
+    Buffer(String),
+    /// One entry was added to the history, which is now at `version`.
+    HistoryAppended { version: u64, entry: String },
+    /// The history changed some other way (cleared, or several entries at once).
+    History { version: u64 },
+    /// Variables or functions changed; `version` is the change log's.
+    Variables { version: u64 },
+}
+
+impl Change {
+    /// `(kind, payload)`, as the Python side receives it.
+    fn to_py<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+        match self {
+            Change::Buffer(text) => ("buffer", text).into_bound_py_any(py),
+            Change::HistoryAppended { version, entry } => ("history_appended", (version, entry)).into_bound_py_any(py),
+            Change::History { version } => ("history", version).into_bound_py_any(py),
+            Change::Variables { version } => ("variables", version).into_bound_py_any(py),
+        }
+    }
+}
+
+/// The Python callable changes are pushed to, if one is registered. Clones
+/// share the registration.
+#[derive(Debug, Clone, Default)]
+pub struct Listener(Arc<Mutex<Option<Arc<Py<PyAny>>>>>);
+
+impl Listener {
+    pub fn set(&self, callback: Option<Py<PyAny>>) {
+        *self.0.lock().unwrap_or_else(PoisonError::into_inner) = callback.map(Arc::new);
+    }
+
+    pub fn is_set(&self) -> bool {
+        self.0.lock().unwrap_or_else(PoisonError::into_inner).is_some()
+    }
+
+    /// Calls the listener once with all of `changes`, from whichever thread
+    /// made them. A failing listener is reported and otherwise ignored; the
+    /// changes are already made.
+    pub fn notify(&self, changes: &[Change]) {
+        if changes.is_empty() {
+            return;
+        }
+        /* Cloned out so the lock is not held while Python runs */
+        let Some(callback) = self.0.lock().unwrap_or_else(PoisonError::into_inner).clone() else {
+            return;
+        };
+        Python::attach(|py| {
+            let events: PyResult<Vec<Bound<'_, PyAny>>> = changes.iter().map(|c| c.to_py(py)).collect();
+            if let Err(e) = events.and_then(|events| callback.call1(py, (events,))) {
+                e.write_unraisable(py, None);
+            }
+        });
+    }
+}
@@ -0,0 +1,51 @@
+//! Bump allocation for expression trees. A parse puts every node in one arena
+//! and the whole tree is freed at once when the arena is dropped, so a
+//! short-lived parse costs a chunk allocation or two rather than one per node.
+
+use std::cell::RefCell;
+
+/// Nodes in the first chunk. Enough for anything typed on the keypad.
+const FIRST_CHUNK: usize = 32;
+
+/// A bump arena for `Copy` values. Nothing is freed until the arena is.
+pub struct Arena<T: Copy> {
+    /* A chunk is never pushed past its capacity, so its buffer never moves */
+    chunks: RefCell<Vec<Vec<T>>>,
+}
+
+impl<T: Copy> Default for Arena<T> {
+    fn default() -> Self {
+        Arena { chunks: RefCell::new(Vec::new()) }
+    }
+}
+
+impl<T: Copy> Arena<T> {
+    pub fn new() -> Self {
+        Arena::default()
+    }
+
+    pub fn alloc(&self, value: T) -> &T {
+        &self.alloc_slice(&[value])[0]
+    }
+
+    /// Copies `values` into the arena as one contiguous slice.
+    pub fn alloc_slice(&self, values: &[T]) -> &[T] {
+        if values.is_empty() {
+            return &[];
+        }
+        let mut chunks = self.chunks.borrow_mut();
+        let fits = chunks.last().is_some_and(|c| c.capacity() - c.len() >= values.len());
+        if !fits {
+            let capacity = chunks.last().map_or(FIRST_CHUNK, |c| c.capacity() * 2).max(values.len());
+            chunks.push(Vec::with_capacity(capacity));
+        }
+        let chunk = chunks.last_mut().expect("a chunk was just ensured");
+        let start = chunk.len();
+        chunk.extend_from_slice(values);
+        let ptr = chunk[start..].as_ptr();
+        /* SAFETY: the values were written within the chunk's capacity, so its
+         * buffer was not reallocated and is only freed with the arena, which
+         * the returned borrow outlives. Written slots are never written again. */
+        unsafe { std::slice::from_raw_parts(ptr, values.len()) }
+    }
+}
@@ -0,0 +1,126 @@
+/// Tokens borrow their text straight from the input, so lexing never allocates.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum Token<'a> {
+    Number(&'a str),
+    Ident(&'a str),
+    Op(char),
+    LParen,
+    RParen,
+    /// `[`, opening a list such as a matrix literal.
+    LBracket,
+    RBracket,
+    Comma,
+}
+
+#[derive(Debug, Clone, PartialEq)]
+pub struct LexError {
+    pub position: usize,
+    pub found: char,
+}
+
+pub struct Lexer<'a> {
+    input: &'a str,
+    pos: usize,
+}
+
+impl<'a> Lexer<'a> {
+    pub fn new(input: &'a str) -> Self {
+        Lexer { input, pos: 0 }
+    }
+
+    fn peek_byte(&self, offset: usize) -> Option<u8> {
+        self.input.as_bytes().get(self.pos + offset).copied()
+    }
+
+    fn take_while(&mut self, start: usize, pred: impl Fn(u8) -> bool) -> &'a str {
+        while let Some(b) = self.peek_byte(0) {
+            if !pred(b) {
+                break;
+            }
+            self.pos += 1;
+        }
+        &self.input[start..self.pos]
+    }
+
+    fn lex_number(&mut self) -> &'a str {
+        let start = self.pos;
+
+        /* Radix prefixes: 0x, 0b, 0o */
+        if self.peek_byte(0) == Some(b'0') {
+            let radix_digit: Option<fn(u8) -> bool> = match self.peek_byte(1) {
+                Some(b'x') | Some(b'X') => Some(|b: u8| b.is_ascii_hexdigit()),
+                Some(b'b') | Some(b'B') => Some(|b: u8| b == b'0' || b == b'1'),
+                Some(b'o') | Some(b'O') => Some(|b: u8| (b'0'..=b'7').contains(&b)),
+                _ => None,
+            };
+            if let Some(is_digit) = radix_digit {
+                if self.peek_byte(2).is_some_and(is_digit) {
+                    self.pos += 2;
+                    return self.take_while(start, is_digit);
+                }
+            }
+        }
+
+        self.take_while(start, |b| b.is_ascii_digit());
+        if self.peek_byte(0) == Some(b'.') {
+            self.pos += 1;
+            self.take_while(start, |b| b.is_ascii_digit());
+        }
+
+        /* Exponent, only when digits actually follow so `2e` stays `2 * e` */
+        if matches!(self.peek_byte(0), Some(b'e') | Some(b'E')) {
+            let sign = matches!(self.peek_byte(1), Some(b'+') | Some(b'-')) as usize;
+            if self.peek_byte(1 + sign).is_some_and(|b| b.is_ascii_digit()) {
+                self.pos += 1 + sign;
+                self.take_while(start, |b| b.is_ascii_digit());
+            }
+        }
+        &self.input[start..self.pos]
+    }
+}
+
+impl<'a> Iterator for Lexer<'a> {
+    type Item = Result<Token<'a>, LexError>;
+
+    fn next(&mut self) -> Option<Self::Item> {
+        self.take_while(self.pos, |b| b.is_ascii_whitespace());
+
+        let c = self.input[self.pos..].chars().next()?;
+        let start = self.pos;
+
+        let token = match c {
+            '0'..='9' | '.' => Token::Number(self.lex_number()),
+            c if c.is_ascii_alphabetic() || c == '_' => {
+                Token::Ident(self.take_while(start, |b| b.is_ascii_alphanumeric() || b == b'_'))
+            }
+            '(' => {
+                self.pos += 1;
+                Token::LParen
+            }
+            ')' => {
+                self.pos += 1;
+                Token::RParen
+            }
+            '[' => {
+                self.pos += 1;
+                Token::LBracket
+            }
+            ']' => {
+                self.pos += 1;
+                Token::RBracket
+            }
+            ',' => {
+                self.pos += 1;
+                Token::Comma
+            }
+            '+' | '-' | '*' | '/' | '%' | '^' | '=' | '!' => {
+                self.pos += 1;
+                Token::Op(c)
+            }
+            _ => {
+                return Some(Err(LexError { position: start, found: c }));
+            }
+        };
+        Some(Ok(token))
+    }
+}
@@ -0,0 +1,11 @@
+//! Lightweight expression front-end used by the native evaluators in this crate.
+//!
+//! The full engine lives in `neocalc-core`; this parser only understands the
+//! arithmetic subset that the backend can evaluate without going through it.
+
+pub mod arena;
+pub mod lexer;
+pub mod parser;
+
+pub use arena::Arena;
+pub use parser::{identifier, parse, signature, BinaryOp, Expr, ParseError, UnaryOp};
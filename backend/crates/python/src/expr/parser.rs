@@ -0,0 +1,291 @@
+use std::fmt;
+use std::iter::Peekable;
+
+use thiserror::Error;
+
+use super::arena::Arena;
+use super::lexer::{LexError, Lexer, Token};
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
+pub enum UnaryOp {
+    Neg,
+    /// Postfix `!`.
+    Factorial,
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
+pub enum BinaryOp {
+    Add,
+    Sub,
+    Mul,
+    Div,
+    Rem,
+    Pow,
+}
+
+impl BinaryOp {
+    pub fn symbol(self) -> char {
+        match self {
+            BinaryOp::Add => '+',
+            BinaryOp::Sub => '-',
+            BinaryOp::Mul => '*',
+            BinaryOp::Div => '/',
+            BinaryOp::Rem => '%',
+            BinaryOp::Pow => '^',
+        }
+    }
+}
+
+/// Expression tree produced by [`parse`]. Literals and names borrow from the
+/// source text and subtrees live in the arena the tree was parsed into.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum Expr<'a> {
+    Number(&'a str),
+    Ident(&'a str),
+    Unary(UnaryOp, &'a Expr<'a>),
+    Binary(BinaryOp, &'a Expr<'a>, &'a Expr<'a>),
+    Call(&'a str, &'a [Expr<'a>]),
+    /// `[a, b, ...]`: a vector, or a matrix when every item is itself a list of one row.
+    List(&'a [Expr<'a>]),
+}
+
+/// Writes the expression back as text, parenthesizing every operation so it
+/// reads the same to any parser with the usual operators.
+impl fmt::Display for Expr<'_> {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        match self {
+            Expr::Number(text) | Expr::Ident(text) => f.write_str(text),
+            Expr::Unary(UnaryOp::Neg, inner) => write!(f, "(-{})", inner),
+            Expr::Unary(UnaryOp::Factorial, inner) => write!(f, "({})!", inner),
+            Expr::Binary(op, lhs, rhs) => write!(f, "({} {} {})", lhs, op.symbol(), rhs),
+            Expr::Call(name, args) => {
+                write!(f, "{}(", name)?;
+                write_items(f, args)?;
+                f.write_str(")")
+            }
+            Expr::List(items) => {
+                f.write_str("[")?;
+                write_items(f, items)?;
+                f.write_str("]")
+            }
+        }
+    }
+}
+
+fn write_items(f: &mut fmt::Formatter<'_>, items: &[Expr<'_>]) -> fmt::Result {
+    for (i, item) in items.iter().enumerate() {
+        if i > 0 {
+            f.write_str(", ")?;
+        }
+        write!(f, "{}", item)?;
+    }
+    Ok(())
+}
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum ParseError {
+    #[error("Unexpected character '{found}' at position {position}")]
+    InvalidCharacter { position: usize, found: char },
+    #[error("Unexpected token {0}")]
+    UnexpectedToken(String),
+    #[error("Unexpected end of expression")]
+    UnexpectedEnd,
+}
+
+impl From<LexError> for ParseError {
+    fn from(e: LexError) -> Self {
+        ParseError::InvalidCharacter { position: e.position, found: e.found }
+    }
+}
+
+struct Parser<'a> {
+    tokens: Peekable<Lexer<'a>>,
+    arena: &'a Arena<Expr<'a>>,
+    /* Arguments of the calls and items of the lists being parsed, innermost
+     * last, moved into the arena as one slice when their call or list closes */
+    args: Vec<Expr<'a>>,
+}
+
+impl<'a> Parser<'a> {
+    fn peek(&mut self) -> Result<Option<Token<'a>>, ParseError> {
+        match self.tokens.peek() {
+            Some(Ok(t)) => Ok(Some(*t)),
+            Some(Err(e)) => Err(e.clone().into()),
+            None => Ok(None),
+        }
+    }
+
+    fn next(&mut self) -> Result<Token<'a>, ParseError> {
+        match self.tokens.next() {
+            Some(t) => Ok(t?),
+            None => Err(ParseError::UnexpectedEnd),
+        }
+    }
+
+    fn expect(&mut self, expected: Token<'a>) -> Result<(), ParseError> {
+        let token = self.next()?;
+        if token == expected {
+            Ok(())
+        } else {
+            Err(ParseError::UnexpectedToken(format!("{:?}", token)))
+        }
+    }
+
+    fn sum(&mut self) -> Result<Expr<'a>, ParseError> {
+        let mut lhs = self.product()?;
+        loop {
+            let op = match self.peek()? {
+                Some(Token::Op('+')) => BinaryOp::Add,
+                Some(Token::Op('-')) => BinaryOp::Sub,
+                _ => return Ok(lhs),
+            };
+            self.next()?;
+            let rhs = self.product()?;
+            lhs = Expr::Binary(op, self.arena.alloc(lhs), self.arena.alloc(rhs));
+        }
+    }
+
+    fn product(&mut self) -> Result<Expr<'a>, ParseError> {
+        let mut lhs = self.unary()?;
+        loop {
+            let (op, rhs) = match self.peek()? {
+                Some(Token::Op('*')) => (BinaryOp::Mul, None),
+                Some(Token::Op('/')) => (BinaryOp::Div, None),
+                Some(Token::Op('%')) => (BinaryOp::Rem, None),
+                /* Juxtaposition such as `3x` or `2(1+1)` is implicit multiplication */
+                Some(Token::Number(_)) | Some(Token::Ident(_)) | Some(Token::LParen) => {
+                    (BinaryOp::Mul, Some(self.power()?))
+                }
+                _ => return Ok(lhs),
+            };
+            let rhs = match rhs {
+                Some(rhs) => rhs,
+                None => {
+                    self.next()?;
+                    self.unary()?
+                }
+            };
+            lhs = Expr::Binary(op, self.arena.alloc(lhs), self.arena.alloc(rhs));
+        }
+    }
+
+    fn unary(&mut self) -> Result<Expr<'a>, ParseError> {
+        match self.peek()? {
+            Some(Token::Op('-')) => {
+                self.next()?;
+                let inner = self.unary()?;
+                Ok(Expr::Unary(UnaryOp::Neg, self.arena.alloc(inner)))
+            }
+            Some(Token::Op('+')) => {
+                self.next()?;
+                self.unary()
+            }
+            _ => self.power(),
+        }
+    }
+
+    fn power(&mut self) -> Result<Expr<'a>, ParseError> {
+        let mut base = self.primary()?;
+        /* Postfix, binding tighter than `^`, so `2^3!` is `2^6` */
+        while let Some(Token::Op('!')) = self.peek()? {
+            self.next()?;
+            base = Expr::Unary(UnaryOp::Factorial, self.arena.alloc(base));
+        }
+        if let Some(Token::Op('^')) = self.peek()? {
+            self.next()?;
+            /* Right associative, and `2^-1` is allowed */
+            let exponent = self.unary()?;
+            return Ok(Expr::Binary(BinaryOp::Pow, self.arena.alloc(base), self.arena.alloc(exponent)));
+        }
+        Ok(base)
+    }
+
+    fn primary(&mut self) -> Result<Expr<'a>, ParseError> {
+        match self.next()? {
+            Token::Number(text) => Ok(Expr::Number(text)),
+            Token::Ident(name) => {
+                if let Some(Token::LParen) = self.peek()? {
+                    self.next()?;
+                    let args = self.items(Token::RParen)?;
+                    Ok(Expr::Call(name, args))
+                } else {
+                    Ok(Expr::Ident(name))
+                }
+            }
+            Token::LParen => {
+                let inner = self.sum()?;
+                self.expect(Token::RParen)?;
+                Ok(inner)
+            }
+            Token::LBracket => Ok(Expr::List(self.items(Token::RBracket)?)),
+            other => Err(ParseError::UnexpectedToken(format!("{:?}", other))),
+        }
+    }
+
+    /// Comma-separated expressions up to and including `close`.
+    fn items(&mut self, close: Token<'a>) -> Result<&'a [Expr<'a>], ParseError> {
+        if self.peek()? == Some(close) {
+            self.next()?;
+            return Ok(&[]);
+        }
+        let mark = self.args.len();
+        loop {
+            let arg = self.sum()?;
+            self.args.push(arg);
+            match self.next()? {
+                Token::Comma => continue,
+                token if token == close => break,
+                other => return Err(ParseError::UnexpectedToken(format!("{:?}", other))),
+            }
+        }
+        let args = self.arena.alloc_slice(&self.args[mark..]);
+        self.args.truncate(mark);
+        Ok(args)
+    }
+}
+
+/// Parses a complete expression into `arena`, rejecting trailing input.
+pub fn parse<'a>(arena: &'a Arena<Expr<'a>>, input: &'a str) -> Result<Expr<'a>, ParseError> {
+    let mut parser = Parser { tokens: Lexer::new(input).peekable(), arena, args: Vec::new() };
+    let expr = parser.sum()?;
+    match parser.peek()? {
+        None => Ok(expr),
+        Some(token) => Err(ParseError::UnexpectedToken(format!("{:?}", token))),
+    }
+}
+
+/// The name if `input` is a single identifier, such as the target of `x = 5`.
+/// Only lexes, so it needs no arena.
+pub fn identifier(input: &str) -> Option<&str> {
+    let mut tokens = Lexer::new(input);
+    match (tokens.next(), tokens.next()) {
+        (Some(Ok(Token::Ident(name))), None) => Some(name),
+        _ => None,
+    }
+}
+
+/// Name and parameters if `input` is a call whose arguments are all plain
+/// identifiers, such as the head of `f(x, y) = ...`. Only lexes.
+pub fn signature(input: &str) -> Option<(&str, Vec<&str>)> {
+    let mut tokens = Lexer::new(input);
+    let Some(Ok(Token::Ident(name))) = tokens.next() else {
+        return None;
+    };
+    if tokens.next() != Some(Ok(Token::LParen)) {
+        return None;
+    }
+    let mut params = Vec::new();
+    loop {
+        match tokens.next()? {
+            Ok(Token::Ident(param)) => params.push(param),
+            Ok(Token::RParen) if params.is_empty() => break,
+            _ => return None,
+        }
+        match tokens.next()? {
+            Ok(Token::Comma) => continue,
+            Ok(Token::RParen) => break,
+            _ => return None,
+        }
+    }
+    tokens.next().is_none().then_some((name, params))
+}
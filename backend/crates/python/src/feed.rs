@@ -0,0 +1,85 @@
+//! Change feed for the variables panel: which names changed since a version,
+//! and their display strings, formatted once per value.
+
+use std::collections::{HashMap, HashSet, VecDeque};
+use std::sync::Arc;
+
+use neocalc_core::Number;
+
+use crate::metrics::{self, Counter};
+use crate::utils::format_number;
+
+/// Changes kept before the oldest are dropped; older readers get a full listing.
+const LOG_CAPACITY: usize = 4096;
+
+/// Names changed per version. Entries are recorded after the values are
+/// committed, so anything listed here is already visible in a fresh snapshot.
+#[derive(Debug, Default)]
+pub struct ChangeLog {
+    version: u64,
+    entries: VecDeque<(u64, String)>,
+    /* Oldest version whose changes are still complete in the log */
+    floor: u64,
+}
+
+impl ChangeLog {
+    pub fn version(&self) -> u64 {
+        self.version
+    }
+
+    /// Records one change set and returns its version.
+    pub fn record(&mut self, names: impl IntoIterator<Item = String>) -> u64 {
+        self.version += 1;
+        for name in names {
+            self.entries.push_back((self.version, name));
+        }
+        while self.entries.len() > LOG_CAPACITY {
+            if let Some((v, _)) = self.entries.pop_front() {
+                self.floor = v;
+            }
+        }
+        self.version
+    }
+
+    /// Distinct names changed after `version`, or `None` if the log no longer
+    /// reaches back that far.
+    pub fn since(&self, version: u64) -> Option<Vec<String>> {
+        if version < self.floor {
+            return None;
+        }
+        let start = self.entries.partition_point(|(v, _)| *v <= version);
+        let mut seen = HashSet::new();
+        Some(
+            self.entries
+                .range(start..)
+                .filter(|(_, name)| seen.insert(name.as_str()))
+                .map(|(_, name)| name.clone())
+                .collect(),
+        )
+    }
+}
+
+/// Display strings by variable, reformatted only when the value itself changes.
+#[derive(Debug, Default)]
+pub struct FormatCache {
+    entries: HashMap<String, (Arc<Number>, String)>,
+}
+
+impl FormatCache {
+    pub fn format(&mut self, name: &str, value: &Arc<Number>) -> String {
+        if let Some((cached, text)) = self.entries.get(name) {
+            if Arc::ptr_eq(cached, value) {
+                metrics::count(Counter::FormatCacheHit, 1);
+                return text.clone();
+            }
+        }
+        metrics::count(Counter::FormatCacheMiss, 1);
+        let text = format_number((**value).clone());
+        self.entries.insert(name.to_string(), (value.clone(), text.clone()));
+        text
+    }
+
+    pub fn forget(&mut self, name: &str) {
+        self.entries.remove(name);
+    }
+}
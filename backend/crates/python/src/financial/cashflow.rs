@@ -0,0 +1,134 @@
+use super::solver::{self, SolverError};
+
+/// Value and derivative (with respect to the rate) of `sum(cf[t] / (1 + rate)^t)`.
+///
+/// Evaluated as a polynomial in `1 / (1 + rate)` with Horner's scheme, so a
+/// 10k-period schedule costs one pass of multiply-adds and no `powf` calls.
+fn discounted(rate: f64, flows: &[f64]) -> (f64, f64) {
+    let x = 1.0 / (1.0 + rate);
+    let (mut value, mut slope) = (0.0, 0.0);
+    for &cf in flows.iter().rev() {
+        slope = slope * x + value;
+        value = value * x + cf;
+    }
+    /* d/d(rate) = p'(x) * dx/d(rate) = p'(x) * -x^2 */
+    (value, -slope * x * x)
+}
+
+fn check_flows(flows: &[f64]) -> Result<(), SolverError> {
+    if flows.is_empty() {
+        return Err(SolverError::InvalidInput("no cash flows"));
+    }
+    if flows.iter().any(|cf| !cf.is_finite()) {
+        return Err(SolverError::InvalidInput("cash flows must be finite"));
+    }
+    Ok(())
+}
+
+/// Net present value with the first flow discounted by one period (spreadsheet convention).
+pub fn npv(rate: f64, flows: &[f64]) -> Result<f64, SolverError> {
+    check_flows(flows)?;
+    if rate <= -1.0 {
+        return Err(SolverError::InvalidInput("rate must be greater than -100%"));
+    }
+    Ok(discounted(rate, flows).0 / (1.0 + rate))
+}
+
+/// Internal rate of return: the rate at which the flows (from period 0) have zero NPV.
+pub fn irr(flows: &[f64], guess: Option<f64>) -> Result<f64, SolverError> {
+    check_flows(flows)?;
+    let has_positive = flows.iter().any(|&cf| cf > 0.0);
+    let has_negative = flows.iter().any(|&cf| cf < 0.0);
+    if !(has_positive && has_negative) {
+        return Err(SolverError::NoSignChange);
+    }
+    solver::solve(|rate| discounted(rate, flows), guess)
+}
+
+/// Time value of money residual `pv*(1+r)^n + pmt*(1+r*when)*((1+r)^n-1)/r + fv`
+/// and its derivative with respect to `r`.
+fn tvm(rate: f64, nper: f64, pmt: f64, pv: f64, fv: f64, when: f64) -> (f64, f64) {
+    if rate.abs() < 1e-10 {
+        /* Series expansion around zero avoids 0/0 */
+        let value = pv + pmt * nper + fv;
+        let slope = pv * nper + pmt * (when * nper + nper * (nper - 1.0) / 2.0);
+        return (value, slope);
+    }
+    let growth = (1.0 + rate).powf(nper);
+    let d_growth = nper * (1.0 + rate).powf(nper - 1.0);
+    let annuity = (growth - 1.0) / rate;
+    let d_annuity = (d_growth * rate - (growth - 1.0)) / (rate * rate);
+    let factor = 1.0 + rate * when;
+
+    let value = pv * growth + pmt * factor * annuity + fv;
+    let slope = pv * d_growth + pmt * (when * annuity + factor * d_annuity);
+    (value, slope)
+}
+
+/// Periodic interest rate of an annuity. `when` is 0 for payments at the end of
+/// each period and 1 for payments at the beginning.
+pub fn rate(
+    nper: f64,
+    pmt: f64,
+    pv: f64,
+    fv: f64,
+    when: f64,
+    guess: Option<f64>,
+) -> Result<f64, SolverError> {
+    if !(nper > 0.0) || !nper.is_finite() {
+        return Err(SolverError::InvalidInput("number of periods must be positive"));
+    }
+    solver::solve(|r| tvm(r, nper, pmt, pv, fv, when), guess)
+}
+
+/// Number of periods of an annuity, in closed form.
+pub fn nper(rate: f64, pmt: f64, pv: f64, fv: f64, when: f64) -> Result<f64, SolverError> {
+    if rate <= -1.0 {
+        return Err(SolverError::InvalidInput("rate must be greater than -100%"));
+    }
+    if rate == 0.0 {
+        if pmt == 0.0 {
+            return Err(SolverError::InvalidInput("payment cannot be zero at a zero rate"));
+        }
+        return Ok(-(pv + fv) / pmt);
+    }
+    let z = pmt * (1.0 + rate * when) / rate;
+    let ratio = (z - fv) / (z + pv);
+    if !(ratio > 0.0) || !ratio.is_finite() {
+        return Err(SolverError::InvalidInput("payments can never reach the target value"));
+    }
+    Ok(ratio.ln() / rate.ln_1p())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const FLOWS: [f64; 5] = [-100.0, 39.0, 59.0, 55.0, 20.0];
+
+    #[test]
+    fn irr_zeroes_the_npv() {
+        for guess in [None, Some(-0.5), Some(0.28), Some(100.0)] {
+            let r = irr(&FLOWS, guess).unwrap();
+            assert!((r - 0.28094842116).abs() < 1e-9, "{guess:?}: {r}");
+            assert!(npv(r, &FLOWS).unwrap().abs() < 1e-9);
+        }
+    }
+
+    #[test]
+    fn rate_matches_the_closed_form() {
+        /* 3500 growing to 10000 over 10 periods */
+        let r = rate(10.0, 0.0, -3500.0, 10000.0, 0.0, None).unwrap();
+        assert!((r - (10000.0f64 / 3500.0).powf(0.1) + 1.0).abs() < 1e-12, "{r}");
+        let n = nper(r, 0.0, -3500.0, 10000.0, 0.0).unwrap();
+        assert!((n - 10.0).abs() < 1e-9, "{n}");
+    }
+
+    #[test]
+    fn rejects_flows_without_a_root() {
+        assert_eq!(irr(&[1.0, 2.0], None), Err(SolverError::NoSignChange));
+        assert_eq!(irr(&[], None), Err(SolverError::InvalidInput("no cash flows")));
+        assert!(matches!(irr(&[-1.0, f64::INFINITY], None), Err(SolverError::InvalidInput(_))));
+        assert!(rate(0.0, -1.0, 1.0, 0.0, 0.0, None).is_err());
+    }
+}
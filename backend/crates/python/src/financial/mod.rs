@@ -0,0 +1,77 @@
+//! Numerical solvers for the financial functions.
+
+pub mod cashflow;
+pub mod solver;
+
+use std::sync::Arc;
+
+use neocalc_core::{Context, Number};
+use num::ToPrimitive;
+
+use crate::dataset::Datasets;
+use crate::error::BackendError;
+use crate::expr::{Expr, UnaryOp};
+use crate::utils::lookup_variable;
+
+pub use cashflow::{irr, nper, npv, rate};
+pub use solver::SolverError;
+
+/// Last solutions, reused as the starting point of the next solve.
+#[derive(Debug, Clone, Copy, Default)]
+pub struct WarmStart {
+    pub irr: Option<f64>,
+    pub rate: Option<f64>,
+}
+
+fn scalar(expr: &Expr<'_>, context: &Context) -> Option<f64> {
+    match expr {
+        Expr::Number(text) => text.parse().ok(),
+        Expr::Ident(name) => match lookup_variable(context, name)? {
+            Number::Float(f) => Some(*f),
+            Number::Integer(i) => i.to_f64(),
+        },
+        Expr::Unary(UnaryOp::Neg, inner) => scalar(inner, context).map(|v| -v),
+        _ => None,
+    }
+}
+
+/// Evaluates `irr(flows)`, `irr(flows, guess)` and `npv(rate, flows)` when `flows`
+/// names a dataset, handing the stored values to the solver without re-parsing.
+///
+/// Returns `None` when the expression is anything else so the engine can take it.
+pub fn evaluate_call(
+    expr: &Expr<'_>,
+    datasets: &Datasets,
+    context: &Context,
+    warm: &mut WarmStart,
+) -> Option<Result<f64, BackendError>> {
+    let Expr::Call(name, args) = expr else {
+        return None;
+    };
+    let series = |arg: &Expr<'_>| -> Option<Result<Arc<[f64]>, BackendError>> {
+        match arg {
+            Expr::Ident(id) => Some(datasets.get(*id)?.values().map_err(Into::into)),
+            _ => None,
+        }
+    };
+
+    let res = match (*name, *args) {
+        ("irr", [flows]) | ("irr", [flows, _]) => {
+            let guess = match args.get(1) {
+                Some(g) => Some(scalar(g, context)?),
+                None => warm.irr,
+            };
+            series(flows)?.and_then(|flows| {
+                let root = irr(&flows, guess)?;
+                warm.irr = Some(root);
+                Ok(root)
+            })
+        }
+        ("npv", [rate, flows]) => {
+            let rate = scalar(rate, context)?;
+            series(flows)?.and_then(|flows| Ok(npv(rate, &flows)?))
+        }
+        _ => return None,
+    };
+    Some(res)
+}
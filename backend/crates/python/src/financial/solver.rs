@@ -0,0 +1,249 @@
+use thiserror::Error;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum SolverError {
+    #[error("No solution: cash flows never change sign")]
+    NoSignChange,
+    #[error("No solution found between {lo} and {hi}")]
+    NoBracket { lo: f64, hi: f64 },
+    #[error("Solver did not converge after {0} iterations")]
+    NoConvergence(usize),
+    #[error("Invalid input: {0}")]
+    InvalidInput(&'static str),
+}
+
+/// Rates are solved on (-1, MAX_RATE]; -100% or below has no financial meaning.
+pub const MIN_RATE: f64 = -1.0 + 1e-9;
+pub const MAX_RATE: f64 = 1e6;
+
+const TOLERANCE: f64 = 1e-12;
+const MAX_ITERATIONS: usize = 200;
+const DEFAULT_GUESS: f64 = 0.1;
+
+/// Evaluates `f` at `x`, pulling `x` back toward `anchor` while the value overflows.
+fn finite_probe(f: &mut impl FnMut(f64) -> f64, anchor: f64, mut x: f64) -> Option<(f64, f64)> {
+    for _ in 0..64 {
+        let v = f(x);
+        if v.is_finite() {
+            return Some((x, v));
+        }
+        if v.is_nan() {
+            return None;
+        }
+        x = 0.5 * (x + anchor);
+    }
+    None
+}
+
+/// Grows an interval around `guess` until `f` changes sign across it.
+fn bracket(f: &mut impl FnMut(f64) -> f64, guess: f64) -> Result<(f64, f64), SolverError> {
+    let guess = guess.clamp(MIN_RATE, MAX_RATE);
+    let Some((guess, f_guess)) = finite_probe(f, DEFAULT_GUESS, guess) else {
+        return Err(SolverError::NoBracket { lo: guess, hi: guess });
+    };
+    if f_guess == 0.0 {
+        return Ok((guess, guess));
+    }
+
+    let mut step = 0.05_f64.max(guess.abs() * 0.5);
+    let (mut lo, mut hi) = (guess, guess);
+    for _ in 0..MAX_ITERATIONS {
+        /* Approach -100% by halving the gap so no region near it is skipped */
+        let next_lo = if lo - step > MIN_RATE { lo - step } else { 0.5 * (lo + MIN_RATE) };
+        let next_hi = (hi + step).min(MAX_RATE);
+
+        if lo - MIN_RATE > f64::EPSILON {
+            match finite_probe(f, lo, next_lo) {
+                Some((x, v)) if v.signum() != f_guess.signum() => return Ok((x, lo)),
+                Some((x, _)) if x < lo => lo = x,
+                _ => lo = next_lo,
+            }
+        }
+        if next_hi > hi {
+            match finite_probe(f, hi, next_hi) {
+                Some((x, v)) if v.signum() != f_guess.signum() => return Ok((hi, x)),
+                Some((x, _)) if x > hi => hi = x,
+                _ => hi = next_hi,
+            }
+        }
+        if lo - MIN_RATE <= f64::EPSILON && hi >= MAX_RATE {
+            break;
+        }
+        step *= 2.0;
+    }
+    Err(SolverError::NoBracket { lo, hi })
+}
+
+/// Brent's method on a bracket known to contain a sign change.
+fn brent(f: &mut impl FnMut(f64) -> f64, lo: f64, hi: f64) -> Result<f64, SolverError> {
+    let (mut a, mut b) = (lo, hi);
+    let (mut fa, mut fb) = (f(a), f(b));
+    if fa == 0.0 {
+        return Ok(a);
+    }
+    if fb == 0.0 {
+        return Ok(b);
+    }
+
+    let (mut c, mut fc) = (a, fa);
+    let mut d = b - a;
+    let mut e = d;
+
+    for _ in 0..MAX_ITERATIONS {
+        if fb.signum() == fc.signum() {
+            c = a;
+            fc = fa;
+            d = b - a;
+            e = d;
+        }
+        if fc.abs() < fb.abs() {
+            a = b;
+            b = c;
+            c = a;
+            fa = fb;
+            fb = fc;
+            fc = fa;
+        }
+
+        let tol = 2.0 * f64::EPSILON * b.abs() + 0.5 * TOLERANCE;
+        let m = 0.5 * (c - b);
+        if m.abs() <= tol || fb == 0.0 {
+            return Ok(b);
+        }
+
+        if e.abs() >= tol && fa.abs() > fb.abs() {
+            /* Secant or inverse quadratic interpolation */
+            let s = fb / fa;
+            let (mut p, mut q);
+            if a == c {
+                p = 2.0 * m * s;
+                q = 1.0 - s;
+            } else {
+                let q0 = fa / fc;
+                let r = fb / fc;
+                p = s * (2.0 * m * q0 * (q0 - r) - (b - a) * (r - 1.0));
+                q = (q0 - 1.0) * (r - 1.0) * (s - 1.0);
+            }
+            if p > 0.0 {
+                q = -q;
+            } else {
+                p = -p;
+            }
+            if 2.0 * p < (3.0 * m * q - (tol * q).abs()).min((e * q).abs()) {
+                e = d;
+                d = p / q;
+            } else {
+                d = m;
+                e = m;
+            }
+        } else {
+            d = m;
+            e = m;
+        }
+
+        a = b;
+        fa = fb;
+        b += if d.abs() > tol { d } else { tol.copysign(m) };
+        fb = f(b);
+    }
+    Err(SolverError::NoConvergence(MAX_ITERATIONS))
+}
+
+/// Finds a root of `f`, given a function returning `(f(x), f'(x))`.
+///
+/// Newton steps are taken from `guess` (typically the previous solution) as long
+/// as they stay inside the current sign-change bracket and keep shrinking the
+/// residual; otherwise the solver hands the bracket over to Brent's method, which
+/// always converges. Either the root is returned or a descriptive error.
+pub fn solve(
+    mut f_df: impl FnMut(f64) -> (f64, f64),
+    guess: Option<f64>,
+) -> Result<f64, SolverError> {
+    let guess = guess.filter(|g| g.is_finite()).unwrap_or(DEFAULT_GUESS);
+    let (mut lo, mut hi) = bracket(&mut |x| f_df(x).0, guess)?;
+    if lo == hi {
+        return Ok(lo);
+    }
+
+    let mut f_lo = f_df(lo).0;
+    let mut x = guess.clamp(lo, hi);
+    let mut last_residual = f64::INFINITY;
+
+    for _ in 0..MAX_ITERATIONS {
+        let (fx, dfx) = f_df(x);
+        if fx == 0.0 {
+            return Ok(x);
+        }
+        if !fx.is_finite() || fx.abs() > 0.5 * last_residual {
+            break;
+        }
+        last_residual = fx.abs();
+
+        /* Keep the bracket tight as Newton moves */
+        if fx.signum() == f_lo.signum() {
+            lo = x;
+            f_lo = fx;
+        } else {
+            hi = x;
+        }
+
+        let next = x - fx / dfx;
+        if !next.is_finite() || next <= lo || next >= hi {
+            break;
+        }
+        if (next - x).abs() <= TOLERANCE * (1.0 + x.abs()) {
+            return Ok(next);
+        }
+        x = next;
+    }
+
+    brent(&mut |x| f_df(x).0, lo, hi)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn newton_converges_from_a_close_guess() {
+        let mut calls = 0;
+        let root = solve(
+            |x| {
+                calls += 1;
+                (x * x - 2.0, 2.0 * x)
+            },
+            Some(1.4),
+        )
+        .unwrap();
+        assert!((root - 2f64.sqrt()).abs() < 1e-12, "{root}");
+        /* Quadratic convergence: a handful of steps past the bracket search */
+        assert!(calls < 20, "{calls} evaluations");
+    }
+
+    #[test]
+    fn brent_takes_over_from_a_bad_derivative() {
+        /* A derivative with the wrong sign sends every Newton step out of the bracket */
+        let root = solve(|x| (x.powi(3) - 0.5, -1.0), Some(0.1)).unwrap();
+        assert!((root - 0.5f64.cbrt()).abs() < 1e-10, "{root}");
+        let root = solve(|x| ((x - 0.3).tanh(), 0.0), None).unwrap();
+        assert!((root - 0.3).abs() < 1e-10, "{root}");
+    }
+
+    #[test]
+    fn brent_converges_on_a_bracket() {
+        let root = brent(&mut |x| x.cos() - x, 0.0, 1.0).unwrap();
+        assert!((root.cos() - root).abs() < 1e-12, "{root}");
+        assert_eq!(brent(&mut |x| x, 0.0, 1.0), Ok(0.0));
+    }
+
+    #[test]
+    fn reports_missing_roots() {
+        assert!(matches!(solve(|x| (x * x + 1.0, 2.0 * x), None), Err(SolverError::NoBracket { .. })));
+        assert!(matches!(solve(|_| (f64::NAN, 0.0), None), Err(SolverError::NoBracket { .. })));
+    }
+
+    #[test]
+    fn exact_guess_is_returned() {
+        assert_eq!(solve(|x| (x - 0.25, 1.0), Some(0.25)), Ok(0.25));
+    }
+}
@@ -0,0 +1,192 @@
+//! Big integer kernels: range products by binary splitting, split across
+//! threads once the halves are large, and sliding-window powers.
+
+use num::{BigInt, BigUint, One, Signed, ToPrimitive, Zero};
+
+use super::{IntegerError, Interrupt};
+
+/// Factors a leaf multiplies one machine word at a time.
+const LEAF: u64 = 64;
+/// Fewer factors than this are not worth a thread.
+const PARALLEL_MIN: u64 = 1 << 12;
+/// Results beyond this many bits are refused rather than attempted, unless the
+/// interrupt sets a lower limit.
+pub const MAX_BITS: u64 = 1 << 32;
+
+fn workers() -> usize {
+    std::thread::available_parallelism().map_or(1, |n| n.get())
+}
+
+/// Trailing zero bits of `m!`, which is `m` minus its number of set bits.
+fn twos_in_factorial(m: u64) -> u64 {
+    m - u64::from(m.count_ones())
+}
+
+/// Product of the odd parts of `lo..=hi`, packing factors into a word until it
+/// would overflow.
+fn leaf(lo: u64, hi: u64) -> BigUint {
+    let mut acc = BigUint::one();
+    let mut word = 1u64;
+    for i in lo..=hi {
+        let odd = i >> i.trailing_zeros();
+        match word.checked_mul(odd) {
+            Some(w) => word = w,
+            None => {
+                acc *= word;
+                word = odd;
+            }
+        }
+    }
+    acc * word
+}
+
+/// Binary splitting over `lo..=hi`, so both operands of every multiplication
+/// are about the same size. The halves of large ranges run on their own
+/// threads while `threads` allows.
+fn split(lo: u64, hi: u64, threads: usize, interrupt: &Interrupt) -> Result<BigUint, IntegerError> {
+    if hi < lo {
+        return Ok(BigUint::one());
+    }
+    let count = hi - lo + 1;
+    if count <= LEAF {
+        return Ok(leaf(lo, hi));
+    }
+    interrupt.check()?;
+    let mid = lo + count / 2;
+    let (low, high) = if threads > 1 && count >= PARALLEL_MIN {
+        std::thread::scope(|scope| {
+            let high = scope.spawn(|| split(mid, hi, threads / 2, interrupt));
+            let low = split(lo, mid - 1, threads - threads / 2, interrupt);
+            (low, high.join().expect("product worker panicked"))
+        })
+    } else {
+        (split(lo, mid - 1, 1, interrupt), split(mid, hi, 1, interrupt))
+    };
+    let (low, high) = (low?, high?);
+    interrupt.check()?;
+    Ok(low * high)
+}
+
+/// `lo * (lo + 1) * ... * hi`, or 1 for an empty range.
+pub fn range_product(lo: u64, hi: u64, interrupt: &Interrupt) -> Result<BigUint, IntegerError> {
+    if hi < lo {
+        return Ok(BigUint::one());
+    }
+    if lo == 0 {
+        return Ok(BigUint::zero());
+    }
+    /* Powers of two are stripped from every factor and shifted back in once */
+    let shift = twos_in_factorial(hi) - twos_in_factorial(lo - 1);
+    Ok(split(lo, hi, workers(), interrupt)? << shift)
+}
+
+pub fn factorial(n: u64, interrupt: &Interrupt) -> Result<BigUint, IntegerError> {
+    /* log2(n!) < n * log2(n) */
+    if n.saturating_mul(64 - u64::from(n.leading_zeros())) > interrupt.max_bits() {
+        return Err(IntegerError::TooLarge);
+    }
+    range_product(2, n, interrupt)
+}
+
+pub fn binomial(n: u64, k: u64, interrupt: &Interrupt) -> Result<BigUint, IntegerError> {
+    if k > n {
+        return Ok(BigUint::zero());
+    }
+    let k = k.min(n - k);
+    if k.saturating_mul(64 - u64::from(n.leading_zeros())) > interrupt.max_bits() {
+        return Err(IntegerError::TooLarge);
+    }
+    let numerator = range_product(n - k + 1, n, interrupt)?;
+    let denominator = range_product(2, k, interrupt)?;
+    interrupt.check()?;
+    Ok(numerator / denominator)
+}
+
+/// Product of every integer in `lo..=hi`, which may be negative.
+pub fn signed_range_product(lo: &BigInt, hi: &BigInt, interrupt: &Interrupt) -> Result<BigInt, IntegerError> {
+    if hi < lo {
+        return Ok(BigInt::one());
+    }
+    if !lo.is_positive() && !hi.is_negative() {
+        return Ok(BigInt::zero());
+    }
+    let (from, to) = match (lo.magnitude().to_u64(), hi.magnitude().to_u64()) {
+        (Some(a), Some(b)) => (a.min(b), a.max(b)),
+        _ => return Err(IntegerError::TooLarge),
+    };
+    let bits = (to - from + 1).saturating_mul(64 - u64::from(to.leading_zeros()));
+    if bits > interrupt.max_bits() {
+        return Err(IntegerError::TooLarge);
+    }
+    let magnitude = BigInt::from(range_product(from, to, interrupt)?);
+    /* An odd number of negative factors leaves the product negative */
+    Ok(if hi.is_negative() && (to - from) % 2 == 0 { -magnitude } else { magnitude })
+}
+
+/// Window width for an exponent of `bits` bits, trading the table of odd
+/// powers against the multiplications it saves.
+fn window(bits: u64) -> u32 {
+    match bits {
+        0..=8 => 1,
+        9..=24 => 2,
+        25..=80 => 3,
+        81..=240 => 4,
+        _ => 5,
+    }
+}
+
+/// `base^exp` by left-to-right sliding-window exponentiation.
+pub fn pow(base: &BigInt, exp: u64, interrupt: &Interrupt) -> Result<BigInt, IntegerError> {
+    if exp == 0 {
+        return Ok(BigInt::one());
+    }
+    if base.is_zero() || base.magnitude().is_one() {
+        let negative = base.is_negative() && exp % 2 == 1;
+        return Ok(if negative { -BigInt::one() } else { base.abs() });
+    }
+    if base.bits().saturating_mul(exp) > interrupt.max_bits() {
+        return Err(IntegerError::TooLarge);
+    }
+    let negative = base.is_negative() && exp % 2 == 1;
+
+    /* A power of two is a single shift */
+    let magnitude = base.magnitude();
+    if magnitude.count_ones() == 1 {
+        let shifted = BigInt::one() << (magnitude.trailing_zeros().unwrap_or(0) * exp);
+        return Ok(if negative { -shifted } else { shifted });
+    }
+
+    let bits = 64 - u64::from(exp.leading_zeros());
+    let k = window(bits);
+    /* Odd powers base^1, base^3, ..., base^(2^k - 1) */
+    let square = magnitude * magnitude;
+    let mut odd = vec![magnitude.clone()];
+    for i in 1..1usize << (k - 1) {
+        odd.push(&odd[i - 1] * &square);
+    }
+
+    let mut result = BigUint::one();
+    let mut i = bits as i64 - 1;
+    while i >= 0 {
+        if exp >> i & 1 == 0 {
+            result = &result * &result;
+            i -= 1;
+            continue;
+        }
+        /* The longest window of at most k bits that ends in a set bit */
+        let mut low = (i - i64::from(k) + 1).max(0);
+        while exp >> low & 1 == 0 {
+            low += 1;
+        }
+        let width = i - low + 1;
+        for _ in 0..width {
+            result = &result * &result;
+        }
+        let value = (exp >> low) & ((1 << width) - 1);
+        result *= &odd[(value >> 1) as usize];
+        i = low - 1;
+        interrupt.check()?;
+    }
+    let result = BigInt::from(result);
+    Ok(if negative { -result } else { result })
+}
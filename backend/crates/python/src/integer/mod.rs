@@ -0,0 +1,190 @@
+//! Exact integer evaluation for the operations that make the engine stall:
+//! factorials, binomials, products over ranges and large powers.
+
+pub mod kernels;
+
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+
+use neocalc_core::{Context, Number};
+use num::{BigInt, Signed, ToPrimitive};
+use thiserror::Error;
+
+use crate::expr::{self, Arena, BinaryOp, Expr, UnaryOp};
+use crate::utils::lookup_variable;
+
+/// Powers with an exponent literal at least this large go to the kernels.
+const POW_MIN: u64 = 512;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum IntegerError {
+    #[error("Calculation cancelled")]
+    Cancelled,
+    #[error("{0} is not defined for negative numbers")]
+    Negative(&'static str),
+    #[error("Result is too large")]
+    TooLarge,
+    /// The expression uses something outside the integer subset; callers fall back to the engine.
+    #[error("Expression not supported by the integer kernels")]
+    Unsupported,
+}
+
+/// Checked between the steps of a long computation. It trips when the
+/// generation it was taken from moves on, or when its deadline passes. It
+/// also bounds how large a result the kernels will attempt.
+#[derive(Debug, Clone)]
+pub struct Interrupt {
+    generation: Arc<AtomicU64>,
+    started: u64,
+    deadline: Option<Instant>,
+    max_bits: u64,
+}
+
+impl Interrupt {
+    pub fn new(generation: &Arc<AtomicU64>) -> Self {
+        Interrupt {
+            generation: generation.clone(),
+            started: generation.load(Ordering::Relaxed),
+            deadline: None,
+            max_bits: kernels::MAX_BITS,
+        }
+    }
+
+    pub fn with_budget(mut self, budget: Duration) -> Self {
+        self.deadline = Some(Instant::now() + budget);
+        self
+    }
+
+    /// Refuses results larger than `bits` (at most `kernels::MAX_BITS`), for
+    /// callers that must also format the result quickly.
+    pub fn with_max_bits(mut self, bits: u64) -> Self {
+        self.max_bits = bits.min(kernels::MAX_BITS);
+        self
+    }
+
+    pub fn max_bits(&self) -> u64 {
+        self.max_bits
+    }
+
+    /// True when there is a deadline, as for a preview. Work that cannot stop
+    /// part-way, such as reading a whole file, should not start under one.
+    pub fn has_budget(&self) -> bool {
+        self.deadline.is_some()
+    }
+
+    pub fn check(&self) -> Result<(), IntegerError> {
+        if self.generation.load(Ordering::Relaxed) != self.started {
+            return Err(IntegerError::Cancelled);
+        }
+        match self.deadline {
+            Some(deadline) if Instant::now() >= deadline => Err(IntegerError::Cancelled),
+            _ => Ok(()),
+        }
+    }
+}
+
+/// True if `expr` contains an operation only the kernels do well.
+fn needs_kernel(expr: &Expr<'_>) -> bool {
+    match expr {
+        Expr::Unary(UnaryOp::Factorial, _) => true,
+        Expr::Call("factorial" | "binomial" | "product", _) => true,
+        Expr::Binary(BinaryOp::Pow, base, Expr::Number(text)) => {
+            text.parse::<u64>().is_ok_and(|e| e >= POW_MIN) || needs_kernel(base)
+        }
+        Expr::Unary(_, inner) => needs_kernel(inner),
+        Expr::Binary(_, lhs, rhs) => needs_kernel(lhs) || needs_kernel(rhs),
+        Expr::Call(_, args) => args.iter().any(needs_kernel),
+        Expr::Number(_) | Expr::Ident(_) | Expr::List(_) => false,
+    }
+}
+
+/// Cheap test on the raw text, so most input is never parsed here: anything
+/// `needs_kernel` accepts contains one of these.
+fn may_need_kernel(input: &str) -> bool {
+    if input.contains('!') || input.contains("factorial") || input.contains("binomial") || input.contains("product") {
+        return true;
+    }
+    input.match_indices('^').any(|(i, _)| {
+        let exponent = input[i + 1..].trim_start();
+        let digits = exponent.bytes().take_while(u8::is_ascii_digit).count();
+        exponent[..digits].parse::<u64>().map_or(digits > 0, |e| e >= POW_MIN)
+    })
+}
+
+fn literal(text: &str) -> Result<BigInt, IntegerError> {
+    let (digits, radix) = match text.get(..2) {
+        Some("0x") | Some("0X") => (&text[2..], 16),
+        Some("0b") | Some("0B") => (&text[2..], 2),
+        Some("0o") | Some("0O") => (&text[2..], 8),
+        _ => (text, 10),
+    };
+    /* Fractions and exponents belong to the engine */
+    BigInt::parse_bytes(digits.as_bytes(), radix).ok_or(IntegerError::Unsupported)
+}
+
+fn count(value: &BigInt, what: &'static str) -> Result<u64, IntegerError> {
+    if value.is_negative() {
+        return Err(IntegerError::Negative(what));
+    }
+    value.to_u64().ok_or(IntegerError::TooLarge)
+}
+
+fn eval(expr: &Expr<'_>, context: &Context, interrupt: &Interrupt) -> Result<BigInt, IntegerError> {
+    let eval = |e: &Expr<'_>| eval(e, context, interrupt);
+    match expr {
+        Expr::Number(text) => literal(text),
+        Expr::Ident(name) => match lookup_variable(context, name) {
+            Some(Number::Integer(i)) => Ok(i.clone()),
+            _ => Err(IntegerError::Unsupported),
+        },
+        Expr::Unary(UnaryOp::Neg, inner) => Ok(-eval(inner)?),
+        Expr::Unary(UnaryOp::Factorial, inner) => {
+            Ok(kernels::factorial(count(&eval(inner)?, "factorial")?, interrupt)?.into())
+        }
+        Expr::Binary(op, lhs, rhs) => {
+            let a = eval(lhs)?;
+            let b = eval(rhs)?;
+            match op {
+                BinaryOp::Add => Ok(a + b),
+                BinaryOp::Sub => Ok(a - b),
+                BinaryOp::Mul => Ok(a * b),
+                /* Negative exponents give fractions, which the engine handles */
+                BinaryOp::Pow if b.is_negative() => Err(IntegerError::Unsupported),
+                BinaryOp::Pow => kernels::pow(&a, b.to_u64().ok_or(IntegerError::TooLarge)?, interrupt),
+                /* Division may not be exact and the engine decides how to show it */
+                BinaryOp::Div | BinaryOp::Rem => Err(IntegerError::Unsupported),
+            }
+        }
+        Expr::Call(name, args) => match (*name, *args) {
+            ("factorial", [n]) => Ok(kernels::factorial(count(&eval(n)?, "factorial")?, interrupt)?.into()),
+            ("binomial", [n, k]) => {
+                let n = count(&eval(n)?, "binomial")?;
+                let k = count(&eval(k)?, "binomial")?;
+                Ok(kernels::binomial(n, k, interrupt)?.into())
+            }
+            ("product", [lo, hi]) => kernels::signed_range_product(&eval(lo)?, &eval(hi)?, interrupt),
+            _ => Err(IntegerError::Unsupported),
+        },
+        Expr::List(_) => Err(IntegerError::Unsupported),
+    }
+}
+
+/// Evaluates `input` exactly when it uses a factorial, binomial, range product
+/// or large power and is otherwise integer arithmetic.
+///
+/// Returns `None` for anything else so the engine can take it.
+pub fn evaluate(input: &str, context: &Context, interrupt: &Interrupt) -> Option<Result<BigInt, IntegerError>> {
+    if !may_need_kernel(input) {
+        return None;
+    }
+    let arena = Arena::new();
+    let parsed = expr::parse(&arena, input).ok()?;
+    if !needs_kernel(&parsed) {
+        return None;
+    }
+    match eval(&parsed, context, interrupt) {
+        Err(IntegerError::Unsupported) => None,
+        res => Some(res),
+    }
+}
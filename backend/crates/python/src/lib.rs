@@ -3,13 +3,45 @@ use pyo3::types::PyModule;
 use pyo3::Bound;
 
 mod calculator;
+pub mod dataset;
+mod diagnostics;
+mod error;
+mod events;
+mod expr;
+mod feed;
+pub mod financial;
+mod integer;
+mod linalg;
 mod managers;
+mod metrics;
+mod persistence;
+mod programming;
+mod reactive;
+mod session;
+mod state;
+pub mod stats;
 mod utils;
+mod vm;
+
+/* Re-exported for the benchmarks, which drive it without a Python interpreter */
+pub use calculator::Calculator;
 
 #[pymodule]
 pub fn neocalc_backend(m: &Bound<PyModule>) -> PyResult<()> {
     m.add_class::<calculator::Calculator>()?;
     m.add_class::<managers::DisplayManager>()?;
     m.add_class::<managers::CalculatorManager>()?;
+    m.add_class::<persistence::SessionStore>()?;
+    m.add_function(wrap_pyfunction!(diagnostics::set_stats_enabled, m)?)?;
+    m.add_function(wrap_pyfunction!(diagnostics::get_stats, m)?)?;
+    m.add_function(wrap_pyfunction!(diagnostics::reset_stats, m)?)?;
+    m.add_function(wrap_pyfunction!(diagnostics::dump_trace, m)?)?;
+
+    /* NEOCALC_STATS=1 collects from startup; NEOCALC_STATS=trace also keeps spans */
+    match std::env::var("NEOCALC_STATS").as_deref() {
+        Ok("1") => metrics::set_enabled(true, false),
+        Ok("trace") => metrics::set_enabled(true, true),
+        _ => {}
+    }
     Ok(())
 }
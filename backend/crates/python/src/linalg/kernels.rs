@@ -0,0 +1,287 @@
+//! Dense kernels over row-major slices. Every inner loop walks contiguous rows
+//! so it vectorizes, and problems with enough arithmetic to pay for a thread
+//! are split by rows across threads.
+
+use super::LinalgError;
+use crate::integer::Interrupt;
+
+/// Side of the square tiles `matmul` works in; three tiles stay in L1/L2.
+const BLOCK: usize = 64;
+/// Columns `lu` factors at a time before updating the rest of the matrix.
+const PANEL: usize = 64;
+/// Floating-point operations a thread must have to be worth starting, about
+/// half a millisecond of work against tens of microseconds to spawn.
+const THREAD_FLOPS: usize = 1 << 20;
+
+/// Threads for `flops` of work split by `rows`; 1 means run on the caller's.
+fn workers(rows: usize, flops: usize) -> usize {
+    let wanted = flops / THREAD_FLOPS;
+    if wanted < 2 {
+        return 1;
+    }
+    std::thread::available_parallelism().map_or(1, |n| n.get()).min(rows).min(wanted).max(1)
+}
+
+fn check(interrupt: &Interrupt) -> Result<(), LinalgError> {
+    interrupt.check().map_err(|_| LinalgError::Cancelled)
+}
+
+/// `y += alpha * x`, the step every kernel here is made of.
+#[inline]
+fn axpy(y: &mut [f64], alpha: f64, x: &[f64]) {
+    for (y, x) in y.iter_mut().zip(x) {
+        *y += alpha * x;
+    }
+}
+
+pub fn dot(a: &[f64], b: &[f64]) -> f64 {
+    /* Four partial sums break the dependency chain of a single accumulator */
+    let mut acc = [0.0; 4];
+    let (a4, a_rest) = a.split_at(a.len() / 4 * 4);
+    let (b4, b_rest) = b.split_at(a4.len());
+    for (x, y) in a4.chunks_exact(4).zip(b4.chunks_exact(4)) {
+        for k in 0..4 {
+            acc[k] += x[k] * y[k];
+        }
+    }
+    let tail: f64 = a_rest.iter().zip(b_rest).map(|(x, y)| x * y).sum();
+    (acc[0] + acc[1]) + (acc[2] + acc[3]) + tail
+}
+
+/// Rows of `c` (n x m) from `a` (n x k) times `b` (k x m), tile by tile.
+fn matmul_rows(a: &[f64], k: usize, b: &[f64], m: usize, c: &mut [f64], interrupt: &Interrupt) -> Result<(), LinalgError> {
+    let n = c.len() / m.max(1);
+    for ii in (0..n).step_by(BLOCK) {
+        check(interrupt)?;
+        let i_end = (ii + BLOCK).min(n);
+        for pp in (0..k).step_by(BLOCK) {
+            let p_end = (pp + BLOCK).min(k);
+            for jj in (0..m).step_by(BLOCK) {
+                let j_end = (jj + BLOCK).min(m);
+                for i in ii..i_end {
+                    let c_row = &mut c[i * m + jj..i * m + j_end];
+                    for p in pp..p_end {
+                        axpy(c_row, a[i * k + p], &b[p * m + jj..p * m + j_end]);
+                    }
+                }
+            }
+        }
+    }
+    Ok(())
+}
+
+/// `a` (n x k) times `b` (k x m), row-major.
+pub fn matmul(a: &[f64], n: usize, k: usize, b: &[f64], m: usize, interrupt: &Interrupt) -> Result<Vec<f64>, LinalgError> {
+    let mut c = vec![0.0; n * m];
+    if m == 0 {
+        return Ok(c);
+    }
+    let threads = workers(n, 2 * n * m * k);
+    if threads == 1 {
+        matmul_rows(a, k, b, m, &mut c, interrupt)?;
+        return Ok(c);
+    }
+    let rows_per = n.div_ceil(threads);
+    std::thread::scope(|scope| {
+        let parts: Vec<_> = c
+            .chunks_mut(rows_per * m)
+            .enumerate()
+            .map(|(t, c_part)| {
+                let a_part = &a[t * rows_per * k..];
+                scope.spawn(move || matmul_rows(a_part, k, b, m, c_part, interrupt))
+            })
+            .collect();
+        parts.into_iter().try_for_each(|part| part.join().expect("matmul worker panicked"))
+    })?;
+    Ok(c)
+}
+
+/// In-place LU factorization with partial pivoting of the n x n matrix `a`.
+/// Returns the row permutation and whether it is odd.
+///
+/// Right-looking and blocked: a panel of `PANEL` columns is factored, then the
+/// rows right of it are solved, and the rest of the matrix gets one rank-`PANEL`
+/// update. Only that update is large enough to share out, so threads are
+/// started once per panel rather than once per column.
+pub fn lu(a: &mut [f64], n: usize, interrupt: &Interrupt) -> Result<(Vec<usize>, bool), LinalgError> {
+    let mut perm: Vec<usize> = (0..n).collect();
+    let mut odd = false;
+    for kb in (0..n).step_by(PANEL) {
+        let kend = (kb + PANEL).min(n);
+
+        /* Factor the panel, applying each row swap to whole rows */
+        for k in kb..kend {
+            check(interrupt)?;
+            let pivot = (k..n).max_by(|&i, &j| a[i * n + k].abs().total_cmp(&a[j * n + k].abs())).expect("k < n");
+            if a[pivot * n + k] == 0.0 {
+                return Err(LinalgError::Singular);
+            }
+            if pivot != k {
+                for j in 0..n {
+                    a.swap(k * n + j, pivot * n + j);
+                }
+                perm.swap(k, pivot);
+                odd = !odd;
+            }
+            let (top, below) = a.split_at_mut((k + 1) * n);
+            let pivot_row = &top[k * n..];
+            for row in below.chunks_exact_mut(n) {
+                let factor = row[k] / pivot_row[k];
+                row[k] = factor;
+                axpy(&mut row[k + 1..kend], -factor, &pivot_row[k + 1..kend]);
+            }
+        }
+        if kend == n {
+            break;
+        }
+
+        /* The panel's rows right of it, by forward substitution with its unit lower triangle */
+        for k in kb..kend {
+            let (top, below) = a.split_at_mut((k + 1) * n);
+            let pivot_row = &top[k * n + kend..(k + 1) * n];
+            for row in below[..(kend - k - 1) * n].chunks_exact_mut(n) {
+                let factor = row[k];
+                axpy(&mut row[kend..], -factor, pivot_row);
+            }
+        }
+
+        /* Everything below and right of the panel, less the panel's contribution */
+        let (top, below) = a.split_at_mut(kend * n);
+        let top = &top[kb * n..];
+        let remaining = n - kend;
+        let update = |rows: &mut [f64]| {
+            for row in rows.chunks_exact_mut(n) {
+                check(interrupt)?;
+                let (factors, rest) = row.split_at_mut(kend);
+                for (p, u) in top.chunks_exact(n).enumerate() {
+                    axpy(rest, -factors[kb + p], &u[kend..]);
+                }
+            }
+            Ok(())
+        };
+        let threads = workers(remaining, 2 * remaining * remaining * (kend - kb));
+        if threads == 1 {
+            update(below)?;
+        } else {
+            let rows_per = remaining.div_ceil(threads);
+            let update = &update;
+            std::thread::scope(|scope| {
+                let parts: Vec<_> = below.chunks_mut(rows_per * n).map(|part| scope.spawn(move || update(part))).collect();
+                parts.into_iter().try_for_each(|part| part.join().expect("lu worker panicked"))
+            })?;
+        }
+    }
+    Ok((perm, odd))
+}
+
+pub fn det(a: &[f64], n: usize, interrupt: &Interrupt) -> Result<f64, LinalgError> {
+    let mut lu_a = a.to_vec();
+    match lu(&mut lu_a, n, interrupt) {
+        Ok((_, odd)) => {
+            let d: f64 = (0..n).map(|i| lu_a[i * n + i]).product();
+            Ok(if odd { -d } else { d })
+        }
+        Err(LinalgError::Singular) => Ok(0.0),
+        Err(e) => Err(e),
+    }
+}
+
+/// Solves `a x = b` for the n x n `a` and the n x m right-hand sides `b`.
+pub fn solve(a: &[f64], n: usize, b: &[f64], m: usize, interrupt: &Interrupt) -> Result<Vec<f64>, LinalgError> {
+    let mut lu_a = a.to_vec();
+    let (perm, _) = lu(&mut lu_a, n, interrupt)?;
+    let mut x: Vec<f64> = perm.iter().flat_map(|&p| b[p * m..(p + 1) * m].iter().copied()).collect();
+
+    /* Forward substitution with the unit lower triangle, one row at a time */
+    for i in 1..n {
+        let (done, rest) = x.split_at_mut(i * m);
+        let row = &mut rest[..m];
+        for j in 0..i {
+            axpy(row, -lu_a[i * n + j], &done[j * m..(j + 1) * m]);
+        }
+    }
+    /* Back substitution with the upper triangle */
+    for i in (0..n).rev() {
+        let (head, tail) = x.split_at_mut((i + 1) * m);
+        let row = &mut head[i * m..];
+        for j in i + 1..n {
+            axpy(row, -lu_a[i * n + j], &tail[(j - i - 1) * m..(j - i) * m]);
+        }
+        let pivot = lu_a[i * n + i];
+        row.iter_mut().for_each(|v| *v /= pivot);
+    }
+    Ok(x)
+}
+
+#[cfg(test)]
+mod tests {
+    use std::sync::Arc;
+    use std::sync::atomic::AtomicU64;
+
+    use super::*;
+
+    fn interrupt() -> Interrupt {
+        Interrupt::new(&Arc::new(AtomicU64::new(0)))
+    }
+
+    /// A pseudo-random n x n matrix with entries in -0.5..0.5, plus 2 on the
+    /// diagonal, so it is far from singular and its determinant stays in range.
+    fn matrix(n: usize) -> Vec<f64> {
+        let mut state = 7u64;
+        let mut a: Vec<f64> = (0..n * n)
+            .map(|_| {
+                state = state.wrapping_mul(6364136223846793005).wrapping_add(1442695040888963407);
+                (state >> 11) as f64 / (1u64 << 53) as f64 - 0.5
+            })
+            .collect();
+        for i in 0..n {
+            a[i * n + i] += 2.0;
+        }
+        a
+    }
+
+    #[test]
+    fn det_small() {
+        let det = |a: &[f64], n| super::det(a, n, &interrupt()).unwrap();
+        assert_eq!(det(&[3.0], 1), 3.0);
+        assert!((det(&[1.0, 2.0, 3.0, 4.0], 2) - -2.0).abs() < 1e-12);
+        /* A row swap flips the sign */
+        assert!((det(&[0.0, 1.0, 1.0, 0.0], 2) - -1.0).abs() < 1e-12);
+        assert!((det(&[2.0, 1.0, 1.0, 1.0, 3.0, 2.0, 1.0, 0.0, 0.0], 3) - -1.0).abs() < 1e-12);
+        assert_eq!(det(&[1.0, 2.0, 2.0, 4.0], 2), 0.0);
+    }
+
+    #[test]
+    fn det_of_product() {
+        /* Larger than one panel, so the blocked update is exercised */
+        let n = 150;
+        let a = matrix(n);
+        let aa = matmul(&a, n, n, &a, n, &interrupt()).unwrap();
+        let d = det(&a, n, &interrupt()).unwrap();
+        let d2 = det(&aa, n, &interrupt()).unwrap();
+        assert!((d2 / (d * d) - 1.0).abs() < 1e-9, "{} {}", d, d2);
+    }
+
+    #[test]
+    fn solve_recovers_right_hand_sides() {
+        let n = 130;
+        let a = matrix(n);
+        let b: Vec<f64> = (0..n * 2).map(|i| i as f64 - n as f64).collect();
+        let x = solve(&a, n, &b, 2, &interrupt()).unwrap();
+        let back = matmul(&a, n, n, &x, 2, &interrupt()).unwrap();
+        for (got, want) in back.iter().zip(&b) {
+            assert!((got - want).abs() < 1e-9, "{} {}", got, want);
+        }
+        assert_eq!(solve(&[1.0, 2.0, 2.0, 4.0], 2, &[1.0, 1.0], 1, &interrupt()), Err(LinalgError::Singular));
+    }
+
+    #[test]
+    fn cancelled() {
+        let generation = Arc::new(AtomicU64::new(0));
+        let interrupt = Interrupt::new(&generation);
+        generation.fetch_add(1, std::sync::atomic::Ordering::Relaxed);
+        let a = matrix(4);
+        assert_eq!(det(&a, 4, &interrupt), Err(LinalgError::Cancelled));
+        assert_eq!(matmul(&a, 4, 4, &a, 4, &interrupt), Err(LinalgError::Cancelled));
+    }
+}
@@ -0,0 +1,173 @@
+use std::borrow::Cow;
+use std::ops::Range;
+use std::sync::Arc;
+
+use super::LinalgError;
+
+/// A dense matrix of `f64`, or a view into one. Values are shared, so slicing
+/// and transposing only change the offset and strides and never copy.
+/// A vector is a matrix with one column.
+#[derive(Debug, Clone)]
+pub struct Matrix {
+    data: Arc<[f64]>,
+    offset: usize,
+    rows: usize,
+    cols: usize,
+    row_stride: usize,
+    col_stride: usize,
+}
+
+impl Matrix {
+    /// A matrix over row-major `data`.
+    pub fn new(rows: usize, cols: usize, data: impl Into<Arc<[f64]>>) -> Result<Matrix, LinalgError> {
+        let data = data.into();
+        if rows.checked_mul(cols) != Some(data.len()) {
+            return Err(LinalgError::Ragged);
+        }
+        Ok(Matrix { data, offset: 0, rows, cols, row_stride: cols, col_stride: 1 })
+    }
+
+    pub fn from_rows(rows: &[Vec<f64>]) -> Result<Matrix, LinalgError> {
+        let cols = rows.first().map_or(0, Vec::len);
+        if rows.iter().any(|r| r.len() != cols) {
+            return Err(LinalgError::Ragged);
+        }
+        Matrix::new(rows.len(), cols, rows.concat())
+    }
+
+    /// A column vector sharing `values`, such as a dataset.
+    pub fn column(values: Arc<[f64]>) -> Matrix {
+        let rows = values.len();
+        Matrix { data: values, offset: 0, rows, cols: 1, row_stride: 1, col_stride: 1 }
+    }
+
+    pub fn rows(&self) -> usize {
+        self.rows
+    }
+
+    pub fn cols(&self) -> usize {
+        self.cols
+    }
+
+    pub fn shape(&self) -> (usize, usize) {
+        (self.rows, self.cols)
+    }
+
+    pub fn len(&self) -> usize {
+        self.rows * self.cols
+    }
+
+    pub fn is_vector(&self) -> bool {
+        self.rows == 1 || self.cols == 1
+    }
+
+    #[inline]
+    pub fn get(&self, row: usize, col: usize) -> f64 {
+        self.data[self.offset + row * self.row_stride + col * self.col_stride]
+    }
+
+    /// The values in row-major order, borrowed when the view is already laid out that way.
+    pub fn values(&self) -> Cow<'_, [f64]> {
+        let len = self.len();
+        let row_major = self.col_stride == 1 && (self.row_stride == self.cols || self.rows == 1);
+        if len <= 1 || row_major || (self.cols == 1 && self.row_stride == 1) {
+            return Cow::Borrowed(&self.data[self.offset..self.offset + len]);
+        }
+        let mut out = Vec::with_capacity(len);
+        for i in 0..self.rows {
+            let start = self.offset + i * self.row_stride;
+            if self.col_stride == 1 {
+                out.extend_from_slice(&self.data[start..start + self.cols]);
+            } else {
+                out.extend((0..self.cols).map(|j| self.data[start + j * self.col_stride]));
+            }
+        }
+        Cow::Owned(out)
+    }
+
+    pub fn to_rows(&self) -> Vec<Vec<f64>> {
+        let values = self.values();
+        values.chunks(self.cols.max(1)).take(self.rows).map(<[f64]>::to_vec).collect()
+    }
+
+    pub fn transpose(&self) -> Matrix {
+        Matrix {
+            rows: self.cols,
+            cols: self.rows,
+            row_stride: self.col_stride,
+            col_stride: self.row_stride,
+            ..self.clone()
+        }
+    }
+
+    /// Rows `range` of this matrix, as a view.
+    pub fn slice_rows(&self, range: Range<usize>) -> Result<Matrix, LinalgError> {
+        if range.start > range.end || range.end > self.rows {
+            return Err(LinalgError::Index);
+        }
+        Ok(Matrix { offset: self.offset + range.start * self.row_stride, rows: range.len(), ..self.clone() })
+    }
+
+    /// Columns `range` of this matrix, as a view.
+    pub fn slice_cols(&self, range: Range<usize>) -> Result<Matrix, LinalgError> {
+        if range.start > range.end || range.end > self.cols {
+            return Err(LinalgError::Index);
+        }
+        Ok(Matrix { offset: self.offset + range.start * self.col_stride, cols: range.len(), ..self.clone() })
+    }
+
+    pub fn map(&self, f: impl Fn(f64) -> f64) -> Matrix {
+        let data: Vec<f64> = self.values().iter().map(|&x| f(x)).collect();
+        Matrix::new(self.rows, self.cols, data).expect("same shape")
+    }
+
+    /// Element-wise `f(self, other)`; the shapes must match.
+    pub fn zip(&self, other: &Matrix, op: &'static str, f: impl Fn(f64, f64) -> f64) -> Result<Matrix, LinalgError> {
+        if self.shape() != other.shape() {
+            return Err(LinalgError::Shape { op, left: self.shape(), right: other.shape() });
+        }
+        let (a, b) = (self.values(), other.values());
+        let data: Vec<f64> = a.iter().zip(b.iter()).map(|(&x, &y)| f(x, y)).collect();
+        Matrix::new(self.rows, self.cols, data)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use std::borrow::Cow;
+
+    use super::*;
+
+    /// 3 x 4 with values 0..12.
+    fn matrix() -> Matrix {
+        Matrix::new(3, 4, (0..12).map(f64::from).collect::<Vec<_>>()).unwrap()
+    }
+
+    #[test]
+    fn contiguous_views_borrow() {
+        let m = matrix();
+        assert!(matches!(m.values(), Cow::Borrowed(_)));
+        let rows = m.slice_rows(1..3).unwrap();
+        assert!(matches!(rows.values(), Cow::Borrowed(_)));
+        assert_eq!(&*rows.values(), &[4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0]);
+        /* A row of the transpose is a column of the original */
+        let t = m.transpose();
+        assert_eq!(t.shape(), (4, 3));
+        assert!(matches!(t.slice_cols(1..2).unwrap().transpose().values(), Cow::Borrowed(_)));
+    }
+
+    #[test]
+    fn strided_views_copy_in_row_major_order() {
+        let m = matrix();
+        let cols = m.slice_cols(1..3).unwrap();
+        assert_eq!(&*cols.values(), &[1.0, 2.0, 5.0, 6.0, 9.0, 10.0]);
+        let col = m.slice_cols(2..3).unwrap();
+        assert_eq!(&*col.values(), &[2.0, 6.0, 10.0]);
+        let t = m.transpose();
+        assert_eq!(&*t.values(), &[0.0, 4.0, 8.0, 1.0, 5.0, 9.0, 2.0, 6.0, 10.0, 3.0, 7.0, 11.0]);
+        let inner = t.slice_rows(1..3).unwrap().slice_cols(1..3).unwrap();
+        assert_eq!(inner.to_rows(), vec![vec![5.0, 9.0], vec![6.0, 10.0]]);
+        assert_eq!(inner.get(1, 0), 6.0);
+        assert_eq!(Matrix::from_rows(&[vec![1.0], vec![2.0, 3.0]]).unwrap_err(), LinalgError::Ragged);
+    }
+}
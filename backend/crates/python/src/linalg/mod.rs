@@ -0,0 +1,369 @@
+//! Vectors and matrices next to a calculator's variables: element-wise
+//! arithmetic, dot and matrix products, determinants and linear solves.
+//!
+//! Values are stored contiguously and row-major; slices and transposes are
+//! views over the same storage. Matrices are typed as `[[1, 2], [3, 4]]`, one
+//! list per row, and vectors as `[1, 2, 3]`.
+
+pub mod kernels;
+pub mod matrix;
+
+use std::collections::HashMap;
+
+use neocalc_core::{Context, Number};
+use num::ToPrimitive;
+use thiserror::Error;
+
+use crate::dataset::Datasets;
+use crate::expr::{self, Arena, BinaryOp, Expr, UnaryOp};
+use crate::integer::Interrupt;
+use crate::utils::{format_number, lookup_variable};
+use crate::vm::bytecode::MathFn;
+
+pub use matrix::Matrix;
+
+pub type Matrices = HashMap<String, Matrix>;
+
+/// Functions that take or return matrices. User functions cannot take these names.
+pub const FUNCTIONS: &[&str] = &["dot", "matmul", "det", "solve", "transpose", "rows", "cols", "row", "col", "at"];
+
+/// Matrices with more elements than this are shown by their shape only.
+const DISPLAY_MAX: usize = 100;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum LinalgError {
+    #[error("Cannot {op} a {}x{} and a {}x{} matrix", .left.0, .left.1, .right.0, .right.1)]
+    Shape { op: &'static str, left: (usize, usize), right: (usize, usize) },
+    #[error("Rows must all have the same length")]
+    Ragged,
+    #[error("Matrix must be square")]
+    NotSquare,
+    #[error("Matrix is singular")]
+    Singular,
+    #[error("Index out of range")]
+    Index,
+    #[error("{name} expects {expected} argument(s)")]
+    Arity { name: &'static str, expected: usize },
+    #[error("Result is a matrix, not a number")]
+    NotScalar,
+    #[error("Calculation cancelled")]
+    Cancelled,
+    #[error("Could not read dataset: {0}")]
+    Dataset(String),
+    /// Something outside the matrix subset; callers fall back to the engine.
+    #[error("Expression not supported for matrices")]
+    Unsupported,
+}
+
+#[derive(Debug, Clone)]
+pub enum Value {
+    Scalar(f64),
+    Matrix(Matrix),
+}
+
+impl Value {
+    fn matrix(self) -> Result<Matrix, LinalgError> {
+        match self {
+            Value::Matrix(m) => Ok(m),
+            Value::Scalar(x) => Matrix::new(1, 1, vec![x]),
+        }
+    }
+
+    fn scalar(self) -> Result<f64, LinalgError> {
+        match self {
+            Value::Scalar(x) => Ok(x),
+            Value::Matrix(m) if m.len() == 1 => Ok(m.get(0, 0)),
+            Value::Matrix(_) => Err(LinalgError::NotScalar),
+        }
+    }
+}
+
+/// Where names are looked up: matrices first, then variables, then datasets
+/// as column vectors. Products and factorizations stop when `interrupt` trips.
+pub struct Scope<'a> {
+    pub matrices: &'a Matrices,
+    pub datasets: &'a Datasets,
+    pub context: &'a Context,
+    pub interrupt: &'a Interrupt,
+}
+
+/// True if `expr` names a matrix, calls a matrix function or is a matrix literal.
+fn uses_matrices(expr: &Expr<'_>, matrices: &Matrices) -> bool {
+    match expr {
+        Expr::List(_) => true,
+        Expr::Ident(name) => matrices.contains_key(*name),
+        Expr::Number(_) => false,
+        Expr::Unary(_, inner) => uses_matrices(inner, matrices),
+        Expr::Binary(_, lhs, rhs) => uses_matrices(lhs, matrices) || uses_matrices(rhs, matrices),
+        Expr::Call(name, args) => FUNCTIONS.contains(name) || args.iter().any(|a| uses_matrices(a, matrices)),
+    }
+}
+
+fn arity<'e, 'a, const N: usize>(name: &'static str, args: &'e [Expr<'a>]) -> Result<&'e [Expr<'a>; N], LinalgError> {
+    args.try_into().map_err(|_| LinalgError::Arity { name, expected: N })
+}
+
+/// A 1-based position argument, as typed.
+fn position(value: Value) -> Result<usize, LinalgError> {
+    let x = value.scalar()?;
+    if x.fract() != 0.0 || x < 1.0 {
+        return Err(LinalgError::Index);
+    }
+    Ok(x as usize - 1)
+}
+
+fn square(m: &Matrix) -> Result<usize, LinalgError> {
+    if m.rows() != m.cols() {
+        return Err(LinalgError::NotSquare);
+    }
+    Ok(m.rows())
+}
+
+/// Element-wise `f`, broadcasting a scalar over a matrix.
+fn elementwise(op: &'static str, a: Value, b: Value, f: impl Fn(f64, f64) -> f64) -> Result<Value, LinalgError> {
+    Ok(match (a, b) {
+        (Value::Scalar(x), Value::Scalar(y)) => Value::Scalar(f(x, y)),
+        (Value::Matrix(m), Value::Scalar(y)) => Value::Matrix(m.map(|x| f(x, y))),
+        (Value::Scalar(x), Value::Matrix(m)) => Value::Matrix(m.map(|y| f(x, y))),
+        (Value::Matrix(a), Value::Matrix(b)) => Value::Matrix(a.zip(&b, op, f)?),
+    })
+}
+
+fn call(name: &str, args: &[Expr<'_>], scope: &Scope<'_>) -> Result<Value, LinalgError> {
+    let eval = |e: &Expr<'_>| eval(e, scope);
+    let value = match name {
+        "dot" => {
+            let [a, b] = arity::<2>("dot", args)?;
+            let (a, b) = (eval(a)?.matrix()?, eval(b)?.matrix()?);
+            if !(a.is_vector() && b.is_vector() && a.len() == b.len()) {
+                return Err(LinalgError::Shape { op: "dot", left: a.shape(), right: b.shape() });
+            }
+            Value::Scalar(kernels::dot(&a.values(), &b.values()))
+        }
+        "matmul" => {
+            let [a, b] = arity::<2>("matmul", args)?;
+            let (a, b) = (eval(a)?.matrix()?, eval(b)?.matrix()?);
+            if a.cols() != b.rows() {
+                return Err(LinalgError::Shape { op: "multiply", left: a.shape(), right: b.shape() });
+            }
+            let c = kernels::matmul(&a.values(), a.rows(), a.cols(), &b.values(), b.cols(), scope.interrupt)?;
+            Value::Matrix(Matrix::new(a.rows(), b.cols(), c)?)
+        }
+        "det" => {
+            let [a] = arity::<1>("det", args)?;
+            let a = eval(a)?.matrix()?;
+            Value::Scalar(kernels::det(&a.values(), square(&a)?, scope.interrupt)?)
+        }
+        "solve" => {
+            let [a, b] = arity::<2>("solve", args)?;
+            let (a, b) = (eval(a)?.matrix()?, eval(b)?.matrix()?);
+            let n = square(&a)?;
+            if b.rows() != n {
+                return Err(LinalgError::Shape { op: "solve", left: a.shape(), right: b.shape() });
+            }
+            let x = kernels::solve(&a.values(), n, &b.values(), b.cols(), scope.interrupt)?;
+            Value::Matrix(Matrix::new(n, b.cols(), x)?)
+        }
+        "transpose" => {
+            let [a] = arity::<1>("transpose", args)?;
+            Value::Matrix(eval(a)?.matrix()?.transpose())
+        }
+        /* Slices count from 1 and include both ends, as typed */
+        "rows" | "cols" => {
+            let [a, from, to] = arity::<3>(if name == "rows" { "rows" } else { "cols" }, args)?;
+            let a = eval(a)?.matrix()?;
+            let (from, to) = (position(eval(from)?)?, position(eval(to)?)? + 1);
+            let view = if name == "rows" { a.slice_rows(from..to) } else { a.slice_cols(from..to) };
+            Value::Matrix(view?)
+        }
+        "row" | "col" => {
+            let [a, i] = arity::<2>(if name == "row" { "row" } else { "col" }, args)?;
+            let a = eval(a)?.matrix()?;
+            let i = position(eval(i)?)?;
+            let view = if name == "row" { a.slice_rows(i..i + 1) } else { a.slice_cols(i..i + 1) };
+            Value::Matrix(view?)
+        }
+        "at" => {
+            let [a, i, j] = arity::<3>("at", args)?;
+            let a = eval(a)?.matrix()?;
+            let (i, j) = (position(eval(i)?)?, position(eval(j)?)?);
+            if i >= a.rows() || j >= a.cols() {
+                return Err(LinalgError::Index);
+            }
+            Value::Scalar(a.get(i, j))
+        }
+        _ => {
+            let math = MathFn::from_name(name).ok_or(LinalgError::Unsupported)?;
+            let [a] = args else {
+                return Err(LinalgError::Unsupported);
+            };
+            match eval(a)? {
+                Value::Scalar(x) => Value::Scalar(math.apply(x)),
+                Value::Matrix(m) => Value::Matrix(m.map(|x| math.apply(x))),
+            }
+        }
+    };
+    Ok(value)
+}
+
+fn eval(expr: &Expr<'_>, scope: &Scope<'_>) -> Result<Value, LinalgError> {
+    match expr {
+        Expr::Number(text) => text.parse().map(Value::Scalar).map_err(|_| LinalgError::Unsupported),
+        Expr::Ident(name) => {
+            if let Some(m) = scope.matrices.get(*name) {
+                return Ok(Value::Matrix(m.clone()));
+            }
+            match lookup_variable(scope.context, name) {
+                Some(Number::Float(f)) => return Ok(Value::Scalar(*f)),
+                Some(Number::Integer(i)) => return Ok(Value::Scalar(i.to_f64().unwrap_or(f64::NAN))),
+                None => {}
+            }
+            match (*name, scope.datasets.get(*name)) {
+                (_, Some(ds)) => {
+                    let values = ds.values().map_err(|e| LinalgError::Dataset(e.to_string()))?;
+                    Ok(Value::Matrix(Matrix::column(values)))
+                }
+                ("pi", None) => Ok(Value::Scalar(std::f64::consts::PI)),
+                ("e", None) => Ok(Value::Scalar(std::f64::consts::E)),
+                _ => Err(LinalgError::Unsupported),
+            }
+        }
+        Expr::Unary(UnaryOp::Neg, inner) => Ok(match eval(inner, scope)? {
+            Value::Scalar(x) => Value::Scalar(-x),
+            Value::Matrix(m) => Value::Matrix(m.map(|x| -x)),
+        }),
+        Expr::Unary(UnaryOp::Factorial, _) => Err(LinalgError::Unsupported),
+        Expr::Binary(op, lhs, rhs) => {
+            let (a, b) = (eval(lhs, scope)?, eval(rhs, scope)?);
+            match op {
+                BinaryOp::Add => elementwise("add", a, b, |x, y| x + y),
+                BinaryOp::Sub => elementwise("subtract", a, b, |x, y| x - y),
+                BinaryOp::Mul => elementwise("multiply", a, b, |x, y| x * y),
+                BinaryOp::Div => elementwise("divide", a, b, |x, y| x / y),
+                BinaryOp::Rem => elementwise("divide", a, b, |x, y| x % y),
+                BinaryOp::Pow => elementwise("raise", a, b, f64::powf),
+            }
+        }
+        Expr::Call(name, args) => call(name, args, scope),
+        Expr::List(items) => literal(items, scope).map(Value::Matrix),
+    }
+}
+
+/// `[[a, b], [c, d]]` row by row, or `[a, b, c]` as a column vector.
+fn literal(items: &[Expr<'_>], scope: &Scope<'_>) -> Result<Matrix, LinalgError> {
+    let numbers = |items: &[Expr<'_>]| -> Result<Vec<f64>, LinalgError> {
+        items.iter().map(|item| eval(item, scope)?.scalar()).collect()
+    };
+    let rows: Option<Vec<&[Expr<'_>]>> = items
+        .iter()
+        .map(|item| match item {
+            Expr::List(row) => Some(*row),
+            _ => None,
+        })
+        .collect();
+    match rows {
+        Some(rows) if !rows.is_empty() => {
+            let rows = rows.into_iter().map(numbers).collect::<Result<Vec<_>, _>>()?;
+            Matrix::from_rows(&rows)
+        }
+        _ => Ok(Matrix::column(numbers(items)?.into())),
+    }
+}
+
+/// Evaluates `input` when it involves a matrix.
+///
+/// Returns `None` for anything else so the engine can take it.
+pub fn evaluate(input: &str, scope: &Scope<'_>) -> Option<Result<Value, LinalgError>> {
+    let arena = Arena::new();
+    let parsed = expr::parse(&arena, input).ok()?;
+    if !uses_matrices(&parsed, scope.matrices) {
+        return None;
+    }
+    match eval(&parsed, scope) {
+        Err(LinalgError::Unsupported) => None,
+        res => Some(res),
+    }
+}
+
+/// `[[1, 2], [3, 4]]`, or just the shape for large matrices.
+pub fn format(m: &Matrix) -> String {
+    if m.len() > DISPLAY_MAX {
+        return format!("[{}x{} matrix]", m.rows(), m.cols());
+    }
+    let rows: Vec<String> = m
+        .to_rows()
+        .into_iter()
+        .map(|row| {
+            let cells: Vec<String> = row.into_iter().map(|x| format_number(Number::Float(x))).collect();
+            format!("[{}]", cells.join(", "))
+        })
+        .collect();
+    format!("[{}]", rows.join(", "))
+}
+
+#[cfg(test)]
+mod tests {
+    use std::sync::Arc;
+    use std::sync::atomic::AtomicU64;
+
+    use super::*;
+
+    fn evaluate_with(input: &str, matrices: &Matrices) -> Option<Result<Value, LinalgError>> {
+        let interrupt = Interrupt::new(&Arc::new(AtomicU64::new(0)));
+        let (datasets, context) = (Datasets::new(), Context::new());
+        evaluate(input, &Scope { matrices, datasets: &datasets, context: &context, interrupt: &interrupt })
+    }
+
+    fn rows(input: &str) -> Vec<Vec<f64>> {
+        match evaluate_with(input, &Matrices::new()) {
+            Some(Ok(Value::Matrix(m))) => m.to_rows(),
+            other => panic!("{}: {:?}", input, other),
+        }
+    }
+
+    fn scalar(input: &str) -> f64 {
+        match evaluate_with(input, &Matrices::new()) {
+            Some(Ok(Value::Scalar(x))) => x,
+            other => panic!("{}: {:?}", input, other),
+        }
+    }
+
+    #[test]
+    fn literals() {
+        assert_eq!(rows("[[1, 2], [3, 4]]"), vec![vec![1.0, 2.0], vec![3.0, 4.0]]);
+        assert_eq!(rows("[1, 2 + 1, -3]"), vec![vec![1.0], vec![3.0], vec![-3.0]]);
+        assert_eq!(rows("2 * [[1, 2]]"), vec![vec![2.0, 4.0]]);
+        assert!(matches!(evaluate_with("[[1, 2], [3]]", &Matrices::new()), Some(Err(LinalgError::Ragged))));
+        assert!(evaluate_with("1 + 2", &Matrices::new()).is_none());
+    }
+
+    #[test]
+    fn det_and_solve() {
+        assert!((scalar("det([[2, 1, 1], [1, 3, 2], [1, 0, 0]])") - -1.0).abs() < 1e-12);
+        assert_eq!(scalar("det([[1, 2], [2, 4]])"), 0.0);
+        let x = rows("solve([[2, 1], [1, 3]], [3, 5])");
+        assert!((x[0][0] - 0.8).abs() < 1e-12 && (x[1][0] - 1.4).abs() < 1e-12, "{:?}", x);
+        assert!(matches!(
+            evaluate_with("solve([[1, 2], [2, 4]], [1, 1])", &Matrices::new()),
+            Some(Err(LinalgError::Singular))
+        ));
+        assert!(matches!(
+            evaluate_with("solve([[1, 2], [3, 4]], [1, 2, 3])", &Matrices::new()),
+            Some(Err(LinalgError::Shape { .. }))
+        ));
+    }
+
+    #[test]
+    fn views_of_stored_matrices() {
+        let mut matrices = Matrices::new();
+        matrices.insert("A".to_string(), Matrix::from_rows(&[vec![1.0, 2.0, 3.0], vec![4.0, 5.0, 6.0]]).unwrap());
+        let get = |input: &str| match evaluate_with(input, &matrices) {
+            Some(Ok(Value::Matrix(m))) => m.to_rows(),
+            other => panic!("{}: {:?}", input, other),
+        };
+        assert_eq!(get("col(A, 2)"), vec![vec![2.0], vec![5.0]]);
+        assert_eq!(get("cols(transpose(A), 1, 2)"), vec![vec![1.0, 4.0], vec![2.0, 5.0], vec![3.0, 6.0]]);
+        assert_eq!(get("row(transpose(A), 3)"), vec![vec![3.0, 6.0]]);
+        assert!(matches!(evaluate_with("dot(col(A, 1), col(A, 3))", &matrices), Some(Ok(Value::Scalar(x))) if x == 27.0));
+    }
+}
@@ -2,9 +2,8 @@ pub const ATTR_CALC_WIDGET: &str = "calc_widget";
 pub const ATTR_CALC_NAME: &str = "calc_name";
 pub const ATTR_CALC_NUMBER: &str = "calc_number";
 pub const ATTR_LOGIC: &str = "logic";
-pub const ATTR_PREVIEW_LABEL: &str = "preview_label";
-pub const ATTR_TITLE_LABEL: &str = "title_label";
-pub const ATTR_SIDEBAR_LIST: &str = "sidebar_list";
+pub const ATTR_CALCULATOR: &str = "calculator";
+pub const ATTR_TITLE: &str = "title";
 pub const ATTR_PARENT_WINDOW: &str = "parent_window";
 
 pub const METHOD_GET_N_PAGES: &str = "get_n_pages";
@@ -15,15 +14,21 @@ pub const METHOD_SET_TITLE: &str = "set_title";
 pub const METHOD_SET_INDICATOR: &str = "set_indicator_icon";
 pub const METHOD_SET_SELECTED_PAGE: &str = "set_selected_page";
 pub const METHOD_GET_SELECTED_PAGE: &str = "get_selected_page";
-pub const METHOD_GET_HISTORY: &str = "get_history";
+pub const METHOD_GET_PAGE: &str = "get_page";
 pub const METHOD_GRAB_FOCUS: &str = "grab_focus";
 pub const METHOD_SWITCH_DISPLAY: &str = "switch_display_for";
-pub const METHOD_ADD_ROW: &str = "add_row";
-pub const METHOD_SELECT_ROW: &str = "select_row";
-pub const METHOD_REMOVE: &str = "remove";
+pub const METHOD_ADD_ITEM: &str = "add_item";
+pub const METHOD_ADD_ITEMS: &str = "add_items";
+pub const METHOD_REMOVE_ITEMS: &str = "remove_items";
+pub const METHOD_SELECT_ITEM: &str = "select_item";
+pub const METHOD_REMOVE_ITEM: &str = "remove_item";
+pub const METHOD_FIND_ITEM: &str = "find_item";
+pub const METHOD_GET_SELECTED_ITEM: &str = "get_selected_item";
+pub const METHOD_SHOW_EXPRESSION: &str = "show_expression";
 pub const METHOD_CONNECT: &str = "connect";
-pub const METHOD_GET_ROW_AT_INDEX: &str = "get_row_at_index";
-pub const METHOD_SET_LABEL: &str = "set_label";
+pub const METHOD_FREEZE_NOTIFY: &str = "freeze_notify";
+pub const METHOD_THAW_NOTIFY: &str = "thaw_notify";
+pub const METHOD_SYNC_SIDEBAR: &str = "sync_sidebar";
 
 pub const EVENT_NOTIFY_SELECTED_PAGE: &str = "notify::selected-page";
 pub const EVENT_CLOSE_PAGE: &str = "close-page";
@@ -1,19 +1,26 @@
-use pyo3::exceptions::PyRuntimeError;
 use pyo3::prelude::*;
 use pyo3::types::PyDict;
 
 use super::constants::*;
+use crate::calculator::Calculator;
 
 pub use crate::utils::lock_mutex;
 
-pub fn create_calculator_widget(py: Python<'_>, parent_window: &Py<PyAny>) -> PyResult<Py<PyAny>> {
+/// Creates a widget, around an existing backend calculator when one is given
+/// (as a session restore does).
+pub fn create_calculator_widget(
+    py: Python<'_>,
+    parent_window: &Py<PyAny>,
+    calculator: Option<&Py<PyAny>>,
+    mode: Option<&str>,
+) -> PyResult<Py<PyAny>> {
     let view_mod = py.import("neocalc.ui.widgets.calculator")?;
     let calc_widget_class = view_mod.getattr("CalculatorWidget")?;
 
-    let locals = PyDict::new(py);
-    locals.set_item("CalculatorWidget", &calc_widget_class)?;
-    let code = std::ffi::CString::new("CalculatorWidget()").map_err(|e| PyRuntimeError::new_err(e.to_string()))?;
-    let calc_widget = py.eval(&code, None, Some(&locals))?.unbind();
+    let kwargs = PyDict::new(py);
+    kwargs.set_item("calculator", calculator)?;
+    kwargs.set_item("mode", mode)?;
+    let calc_widget = calc_widget_class.call((), Some(&kwargs))?.unbind();
 
     calc_widget
         .bind(py)
@@ -21,6 +28,14 @@ pub fn create_calculator_widget(py: Python<'_>, parent_window: &Py<PyAny>) -> Py
     Ok(calc_widget)
 }
 
+/// The latest history entry of a widget's calculator, read without copying
+/// the whole history into Python.
+pub fn last_entry(py: Python<'_>, calc_widget: &Py<PyAny>) -> PyResult<Option<String>> {
+    let calculator = calc_widget.getattr(py, ATTR_LOGIC)?.getattr(py, ATTR_CALCULATOR)?;
+    let calculator: PyRef<'_, Calculator> = calculator.extract(py)?;
+    Ok(calculator.last_entry())
+}
+
 pub fn add_to_tab_view(
     py: Python<'_>,
     tab_view: &Py<PyAny>,
@@ -50,17 +65,11 @@ pub fn connect_widget_signals(
     calc_widget: &Py<PyAny>,
     row: &Py<PyAny>,
 ) -> PyResult<()> {
-    let row_preview_label = row.bind(py).getattr(ATTR_PREVIEW_LABEL)?;
-
-    let locals = PyDict::new(py);
-    locals.set_item("preview_label", &row_preview_label)?;
-    let code = std::ffi::CString::new("lambda text, pl=preview_label: pl.set_text(text or '0')")
-        .map_err(|e| PyRuntimeError::new_err(e.to_string()))?;
-    let lambda = py.eval(&code, None, Some(&locals))?;
-
+    /* The item's bound property updates whichever row currently shows it */
+    let show_expression = row.bind(py).getattr(METHOD_SHOW_EXPRESSION)?;
     calc_widget
         .bind(py)
-        .setattr("on_expression_changed", lambda)?;
+        .setattr("on_expression_changed", show_expression)?;
     Ok(())
 }
 
@@ -87,23 +96,8 @@ pub fn find_sidebar_row_by_widget(
     sidebar_view: &Py<PyAny>,
     target_widget: &Py<PyAny>,
 ) -> PyResult<Option<Py<PyAny>>> {
-    let sidebar_list = sidebar_view.getattr(py, ATTR_SIDEBAR_LIST)?;
-    let mut i = 0;
-    loop {
-        let row = sidebar_list.call_method1(py, METHOD_GET_ROW_AT_INDEX, (i,))?;
-        if row.is_none(py) {
-            break;
-        }
-
-        if row.bind(py).hasattr(ATTR_CALC_WIDGET)? {
-            let row_cw = row.getattr(py, ATTR_CALC_WIDGET)?;
-            if row_cw.is(target_widget) {
-                return Ok(Some(row));
-            }
-        }
-        i += 1;
-    }
-    Ok(None)
+    let item = sidebar_view.call_method1(py, METHOD_FIND_ITEM, (target_widget,))?;
+    Ok(if item.is_none(py) { None } else { Some(item) })
 }
 
 pub fn format_title(history_entry: &str) -> String {
@@ -133,11 +127,9 @@ pub fn renumber_instances(
         page.setattr(py, ATTR_CALC_NUMBER, new_number)?;
 
         let calc_widget = page.getattr(py, ATTR_CALC_WIDGET)?;
-        let logic = calc_widget.getattr(py, ATTR_LOGIC)?;
-        let history: Vec<String> = logic.call_method0(py, METHOD_GET_HISTORY)?.extract(py)?;
 
-        let title = if let Some(last) = history.last() {
-            format_title(last)
+        let title = if let Some(last) = last_entry(py, &calc_widget)? {
+            format_title(&last)
         } else {
             format!("{} {}", gettextrs::gettext("Calculator"), new_number)
         };
@@ -146,10 +138,7 @@ pub fn renumber_instances(
 
         if let Some(row) = find_sidebar_row_by_widget(py, sidebar_view, &calc_widget)? {
             row.setattr(py, ATTR_CALC_NUMBER, new_number)?;
-            if row.bind(py).hasattr(ATTR_TITLE_LABEL)? {
-                let tl = row.getattr(py, ATTR_TITLE_LABEL)?;
-                tl.call_method1(py, METHOD_SET_LABEL, (&title,))?;
-            }
+            row.setattr(py, ATTR_TITLE, &title)?;
         }
     }
     Ok(())
@@ -1,4 +1,3 @@
-pub mod ui;
 pub mod constants;
 pub mod helpers;
 
@@ -7,6 +6,7 @@ use std::sync::{Arc, Mutex};
 use pyo3::exceptions::PyRuntimeError;
 
 use constants::*;
+use crate::calculator::Calculator;
 use gettextrs::gettext;
 
 /// Manages calculator instances, sidebar rows, and tab pages.
@@ -19,6 +19,8 @@ pub struct CalculatorManager {
 
     instance_count: Arc<Mutex<i32>>,
     calculator_widgets: Arc<Mutex<Vec<Py<PyAny>>>>,
+    /* Sidebar items of pages closed during a bulk close, removed together at the end */
+    detached_items: Mutex<Option<Vec<Py<PyAny>>>>,
 
     _rt: tokio::runtime::Runtime,
 }
@@ -44,6 +46,7 @@ impl CalculatorManager {
             display_manager,
             instance_count: Arc::new(Mutex::new(0)),
             calculator_widgets: Arc::new(Mutex::new(Vec::new())),
+            detached_items: Mutex::new(None),
             _rt: rt,
         })
     }
@@ -62,37 +65,73 @@ impl CalculatorManager {
     }
 
     fn add_calculator_instance(&self, py: Python<'_>) -> PyResult<()> {
-        let n_pages: i32 = self.tab_view.bind(py).call_method0(METHOD_GET_N_PAGES)?.extract()?;
-        let new_count = n_pages + 1;
+        self.add_calculator_instances(py, 1)
+    }
 
-        {
-            let mut count = helpers::lock_mutex(&self.instance_count)?;
-            *count = new_count;
+    /// Opens `n` new calculators in one pass and selects the last one.
+    fn add_calculator_instances(&self, py: Python<'_>, n: usize) -> PyResult<()> {
+        let mut widgets = Vec::with_capacity(n);
+        for _ in 0..n {
+            widgets.push((helpers::create_calculator_widget(py, &self.window, None, None)?, None));
         }
+        self.add_widgets(py, widgets, n.saturating_sub(1))
+    }
 
-        let title = format!("{} {}", gettext("Calculator"), new_count);
-        let name = format!("calc_{}", new_count);
-
-        let calc_widget = helpers::create_calculator_widget(py, &self.window)?;
-
-        let page = helpers::add_to_tab_view(py, &self.tab_view, &calc_widget, &title, &name, new_count)?;
-
-        let row = ui::create_sidebar_row(py, &title, &name, calc_widget.clone_ref(py), new_count)?;
-        self.sidebar_view.bind(py).call_method1(METHOD_ADD_ROW, (&row,))?;
-
-        {
-            let mut widgets = helpers::lock_mutex(&self.calculator_widgets)?;
-            widgets.push(calc_widget.clone_ref(py));
+    /// Adds a tab for each restored calculator, selecting `selected` once at the
+    /// end. Widgets build their keypads when first shown.
+    fn restore_calculator_instances(
+        &self,
+        py: Python<'_>,
+        calculators: Vec<Py<Calculator>>,
+        modes: Vec<String>,
+        selected: usize,
+    ) -> PyResult<()> {
+        if calculators.is_empty() {
+            return self.add_calculator_instance(py);
         }
+        let mut widgets = Vec::with_capacity(calculators.len());
+        for (i, calculator) in calculators.into_iter().enumerate() {
+            let title = calculator.borrow(py).last_entry().map(|last| helpers::format_title(&last));
+            let mode = modes.get(i).map(String::as_str);
+            let calc_widget = helpers::create_calculator_widget(py, &self.window, Some(calculator.as_any()), mode)?;
+            widgets.push((calc_widget, title));
+        }
+        self.add_widgets(py, widgets, selected)
+    }
 
-        self.sidebar_view.bind(py).call_method1(METHOD_SELECT_ROW, (&row,))?;
-        self.tab_view.bind(py).call_method1(METHOD_SET_SELECTED_PAGE, (&page,))?;
-
-        helpers::connect_widget_signals(py, &calc_widget, &row)?;
-
-        self.display_manager.bind(py).call_method1(METHOD_SWITCH_DISPLAY, (&calc_widget,))?;
-
-        Ok(())
+    /// Closes the given calculators in one pass. The last open one is kept.
+    fn close_calculator_instances(&self, py: Python<'_>, calc_widgets: Vec<Py<PyAny>>) -> PyResult<()> {
+        let tab_view = self.tab_view.bind(py);
+        let mut remaining: i32 = tab_view.call_method0(METHOD_GET_N_PAGES)?.extract()?;
+
+        /* Detached pages leave their sidebar items here, and selection changes
+           are reported once at the end rather than once per closed page */
+        *helpers::lock_mutex(&self.detached_items)? = Some(Vec::new());
+        tab_view.call_method0(METHOD_FREEZE_NOTIFY)?;
+        let closed = (|| -> PyResult<()> {
+            for calc_widget in &calc_widgets {
+                if remaining <= 1 {
+                    break;
+                }
+                let page = tab_view.call_method1(METHOD_GET_PAGE, (calc_widget,))?;
+                if !page.is_none() {
+                    tab_view.call_method1(METHOD_CLOSE_PAGE, (&page,))?;
+                    remaining -= 1;
+                }
+            }
+            Ok(())
+        })();
+        let finished = closed.and_then(|_| {
+            let items = helpers::lock_mutex(&self.detached_items)?.take().unwrap_or_default();
+            self.sidebar_view.call_method1(py, METHOD_REMOVE_ITEMS, (items,))?;
+            helpers::renumber_instances(py, &self.tab_view, &self.sidebar_view)?;
+            *helpers::lock_mutex(&self.instance_count)? = tab_view.call_method0(METHOD_GET_N_PAGES)?.extract()?;
+            Ok(())
+        });
+        /* Never leave per-page handling switched off, even after an error */
+        helpers::lock_mutex(&self.detached_items)?.take();
+        tab_view.call_method0(METHOD_THAW_NOTIFY)?;
+        finished
     }
 
     fn on_close_calculator_from_sidebar(&self, py: Python<'_>, calc_widget: Py<PyAny>) -> PyResult<()> {
@@ -123,9 +162,14 @@ impl CalculatorManager {
             }
         }
 
-        if let Some(row) = helpers::find_sidebar_row_by_widget(py, &self.sidebar_view, &calc_widget)? {
-             let sidebar_list = self.sidebar_view.getattr(py, ATTR_SIDEBAR_LIST)?;
-             sidebar_list.call_method1(py, METHOD_REMOVE, (row,))?;
+        let row = helpers::find_sidebar_row_by_widget(py, &self.sidebar_view, &calc_widget)?;
+        if let Some(detached) = helpers::lock_mutex(&self.detached_items)?.as_mut() {
+            /* A bulk close finishes the sidebar and the numbering itself */
+            detached.extend(row);
+            return Ok(());
+        }
+        if let Some(row) = row {
+             self.sidebar_view.call_method1(py, METHOD_REMOVE_ITEM, (row,))?;
         }
 
         helpers::renumber_instances(py, &self.tab_view, &self.sidebar_view)?;
@@ -141,24 +185,26 @@ impl CalculatorManager {
         Ok(())
     }
 
-    fn update_calculator_name(&self, py: Python<'_>, calc_widget: Py<PyAny>) -> PyResult<()> {
-        let logic = calc_widget.getattr(py, ATTR_LOGIC)?;
-        let history: Vec<String> = logic.call_method0(py, METHOD_GET_HISTORY)?.extract(py)?;
-
-        if history.is_empty() { return Ok(()); }
-
-        if let Some((_, page)) = helpers::find_page_by_widget(py, &self.tab_view, &calc_widget)? {
-
-            if let Some(last) = history.last() {
-                let title = helpers::format_title(last);
-                page.call_method1(py, METHOD_SET_TITLE, (&title,))?;
-
-                if let Some(row) = helpers::find_sidebar_row_by_widget(py, &self.sidebar_view, &calc_widget)? {
-                    if row.bind(py).hasattr(ATTR_TITLE_LABEL)? {
-                         let tl = row.getattr(py, ATTR_TITLE_LABEL)?;
-                         tl.call_method1(py, METHOD_SET_LABEL, (&title,))?;
-                    }
-                }
+    /// Names the tab after its latest history entry. Callers that were just
+    /// told the entry pass it in, which saves reading it back.
+    #[pyo3(signature = (calc_widget, entry=None))]
+    fn update_calculator_name(&self, py: Python<'_>, calc_widget: Py<PyAny>, entry: Option<String>) -> PyResult<()> {
+        let last = match entry {
+            Some(entry) => entry,
+            None => match helpers::last_entry(py, &calc_widget)? {
+                Some(last) => last,
+                None => return Ok(()),
+            },
+        };
+
+        /* The tab view looks the page up directly, no need to walk the pages */
+        let page = self.tab_view.call_method1(py, METHOD_GET_PAGE, (&calc_widget,))?;
+        if !page.is_none(py) {
+            let title = helpers::format_title(&last);
+            page.call_method1(py, METHOD_SET_TITLE, (&title,))?;
+
+            if let Some(row) = helpers::find_sidebar_row_by_widget(py, &self.sidebar_view, &calc_widget)? {
+                row.setattr(py, ATTR_TITLE, &title)?;
             }
         }
         Ok(())
@@ -172,11 +218,10 @@ impl CalculatorManager {
              calc_widget.call_method0(py, METHOD_GRAB_FOCUS)?;
 
              if let Some(row) = helpers::find_sidebar_row_by_widget(py, &self.sidebar_view, &calc_widget)? {
-                 let sidebar_list = self.sidebar_view.getattr(py, ATTR_SIDEBAR_LIST)?;
-                 let selected_row = sidebar_list.call_method0(py, "get_selected_row")?;
+                 let selected_row = self.sidebar_view.call_method0(py, METHOD_GET_SELECTED_ITEM)?;
 
                  if selected_row.is_none(py) || !selected_row.is(&row) {
-                     sidebar_list.call_method1(py, METHOD_SELECT_ROW, (&row,))?;
+                     self.sidebar_view.call_method1(py, METHOD_SELECT_ITEM, (&row,))?;
                  }
              }
         }
@@ -193,3 +238,51 @@ impl CalculatorManager {
         Ok(())
     }
 }
+
+impl CalculatorManager {
+    /// Adds pages and sidebar items for new widgets in one pass, then selects
+    /// `selected` and switches the display once. Widgets without a title are
+    /// named after their number.
+    fn add_widgets(&self, py: Python<'_>, widgets: Vec<(Py<PyAny>, Option<String>)>, selected: usize) -> PyResult<()> {
+        let tab_view = self.tab_view.bind(py);
+        let n_pages: i32 = tab_view.call_method0(METHOD_GET_N_PAGES)?.extract()?;
+        let mut entries = Vec::with_capacity(widgets.len());
+        let mut pages = Vec::with_capacity(widgets.len());
+
+        /* The first page added selects itself; report that only after the last */
+        tab_view.call_method0(METHOD_FREEZE_NOTIFY)?;
+        let added = (|| -> PyResult<()> {
+            for (i, (calc_widget, title)) in widgets.into_iter().enumerate() {
+                let number = n_pages + i as i32 + 1;
+                let name = format!("calc_{}", number);
+                let title = title.unwrap_or_else(|| format!("{} {}", gettext("Calculator"), number));
+                pages.push(helpers::add_to_tab_view(py, &self.tab_view, &calc_widget, &title, &name, number)?);
+                helpers::lock_mutex(&self.calculator_widgets)?.push(calc_widget.clone_ref(py));
+                entries.push((title, name, calc_widget, number));
+            }
+            Ok(())
+        })();
+
+        /* One model change for the whole sidebar */
+        let calc_widgets: Vec<Py<PyAny>> = entries.iter().map(|(_, _, w, _)| w.clone_ref(py)).collect();
+        let items: PyResult<Vec<Py<PyAny>>> =
+            self.sidebar_view.call_method1(py, METHOD_ADD_ITEMS, (entries,)).and_then(|items| items.extract(py));
+        tab_view.call_method0(METHOD_THAW_NOTIFY)?;
+        added?;
+        let items = items?;
+
+        for (calc_widget, item) in calc_widgets.iter().zip(&items) {
+            helpers::connect_widget_signals(py, calc_widget, item)?;
+            calc_widget.call_method0(py, METHOD_SYNC_SIDEBAR)?;
+        }
+
+        *helpers::lock_mutex(&self.instance_count)? = tab_view.call_method0(METHOD_GET_N_PAGES)?.extract()?;
+
+        if let (Some(calc_widget), Some(page), Some(item)) = (calc_widgets.get(selected), pages.get(selected), items.get(selected)) {
+            self.sidebar_view.bind(py).call_method1(METHOD_SELECT_ITEM, (item,))?;
+            tab_view.call_method1(METHOD_SET_SELECTED_PAGE, (page,))?;
+            self.display_manager.bind(py).call_method1(METHOD_SWITCH_DISPLAY, (calc_widget,))?;
+        }
+        Ok(())
+    }
+}
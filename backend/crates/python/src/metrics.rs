@@ -0,0 +1,333 @@
+//! Process-wide timings and counters for the backend, read from Python with
+//! `neocalc_backend.get_stats()` (see `diagnostics`).
+//!
+//! Everything is off until `set_stats_enabled(True)` (or `NEOCALC_STATS=1`);
+//! while off, a span or counter costs one relaxed atomic load. With tracing on,
+//! the most recent spans are also kept and can be written out with
+//! `dump_trace(path)` in the Chrome trace-event format (chrome://tracing, Perfetto).
+
+use std::collections::VecDeque;
+use std::fmt::Write as _;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::{Mutex, OnceLock, PoisonError};
+use std::time::Instant;
+
+static ENABLED: AtomicBool = AtomicBool::new(false);
+static TRACING: AtomicBool = AtomicBool::new(false);
+
+/// Spans kept for `dump_trace`; older ones are dropped first.
+const TRACE_CAPACITY: usize = 65_536;
+
+/// Timed sections. Lock waits are recorded by `Shared` for the variables.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Timer {
+    Evaluate,
+    Preview,
+    GetHistory,
+    EvaluateBatch,
+    /* Inside the calls above */
+    Engine,
+    Function,
+    Integer,
+    Matrix,
+    Format,
+    VariablesRead,
+    VariablesWrite,
+}
+
+impl Timer {
+    const ALL: [Timer; 11] = [
+        Timer::Evaluate,
+        Timer::Preview,
+        Timer::GetHistory,
+        Timer::EvaluateBatch,
+        Timer::Engine,
+        Timer::Function,
+        Timer::Integer,
+        Timer::Matrix,
+        Timer::Format,
+        Timer::VariablesRead,
+        Timer::VariablesWrite,
+    ];
+
+    pub fn name(self) -> &'static str {
+        match self {
+            Timer::Evaluate => "evaluate",
+            Timer::Preview => "preview",
+            Timer::GetHistory => "get_history",
+            Timer::EvaluateBatch => "evaluate_batch",
+            Timer::Engine => "engine",
+            Timer::Function => "function",
+            Timer::Integer => "integer",
+            Timer::Matrix => "matrix",
+            Timer::Format => "format",
+            Timer::VariablesRead => "variables_read_wait",
+            Timer::VariablesWrite => "variables_write_wait",
+        }
+    }
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Counter {
+    ProgramCacheHit,
+    ProgramCacheMiss,
+    FormatCacheHit,
+    FormatCacheMiss,
+    /* Scratch contexts that fell back to a full copy of the variables */
+    FullContextCopy,
+    BytesToPython,
+}
+
+impl Counter {
+    const ALL: [Counter; 6] = [
+        Counter::ProgramCacheHit,
+        Counter::ProgramCacheMiss,
+        Counter::FormatCacheHit,
+        Counter::FormatCacheMiss,
+        Counter::FullContextCopy,
+        Counter::BytesToPython,
+    ];
+
+    pub fn name(self) -> &'static str {
+        match self {
+            Counter::ProgramCacheHit => "program_cache_hits",
+            Counter::ProgramCacheMiss => "program_cache_misses",
+            Counter::FormatCacheHit => "format_cache_hits",
+            Counter::FormatCacheMiss => "format_cache_misses",
+            Counter::FullContextCopy => "full_context_copies",
+            Counter::BytesToPython => "bytes_to_python",
+        }
+    }
+}
+
+/// Sub-buckets per power of two: percentiles are exact to within 1/8.
+const SUB_BITS: u32 = 3;
+const SUB: u64 = 1 << SUB_BITS;
+const BUCKETS: usize = ((64 - SUB_BITS as usize) + 1) * SUB as usize;
+
+/// Latency histogram in nanoseconds with log-linear buckets.
+struct Histogram {
+    buckets: [AtomicU64; BUCKETS],
+    total: AtomicU64,
+    max: AtomicU64,
+}
+
+fn bucket(ns: u64) -> usize {
+    if ns < SUB {
+        return ns as usize;
+    }
+    let exp = 63 - ns.leading_zeros();
+    let sub = (ns >> (exp - SUB_BITS)) & (SUB - 1);
+    ((exp - SUB_BITS + 1) as u64 * SUB + sub) as usize
+}
+
+/// Largest value that falls in bucket `index`.
+fn bucket_limit(index: usize) -> u64 {
+    let index = index as u64;
+    if index < SUB {
+        return index;
+    }
+    let exp = (index / SUB) as u32 + SUB_BITS - 1;
+    let sub = index % SUB;
+    let width = 1u64 << (exp - SUB_BITS);
+    ((SUB + sub) << (exp - SUB_BITS)).saturating_add(width - 1)
+}
+
+impl Histogram {
+    const fn new() -> Self {
+        Histogram {
+            buckets: [const { AtomicU64::new(0) }; BUCKETS],
+            total: AtomicU64::new(0),
+            max: AtomicU64::new(0),
+        }
+    }
+
+    fn record(&self, ns: u64) {
+        self.buckets[bucket(ns)].fetch_add(1, Ordering::Relaxed);
+        self.total.fetch_add(ns, Ordering::Relaxed);
+        self.max.fetch_max(ns, Ordering::Relaxed);
+    }
+
+    fn percentile(&self, counts: &[u64], count: u64, p: f64) -> u64 {
+        let rank = ((count as f64) * p).ceil().max(1.0) as u64;
+        let mut seen = 0;
+        for (i, n) in counts.iter().enumerate() {
+            seen += n;
+            if seen >= rank {
+                return bucket_limit(i).min(self.max.load(Ordering::Relaxed));
+            }
+        }
+        0
+    }
+
+    fn reset(&self) {
+        for b in &self.buckets {
+            b.store(0, Ordering::Relaxed);
+        }
+        for v in [&self.total, &self.max] {
+            v.store(0, Ordering::Relaxed);
+        }
+    }
+}
+
+static TIMERS: [Histogram; Timer::ALL.len()] = [const { Histogram::new() }; Timer::ALL.len()];
+static COUNTERS: [AtomicU64; Counter::ALL.len()] = [const { AtomicU64::new(0) }; Counter::ALL.len()];
+
+struct TraceEvent {
+    timer: Timer,
+    start_ns: u64,
+    duration_ns: u64,
+    thread: u64,
+}
+
+static TRACE: Mutex<VecDeque<TraceEvent>> = Mutex::new(VecDeque::new());
+
+fn epoch() -> Instant {
+    static EPOCH: OnceLock<Instant> = OnceLock::new();
+    *EPOCH.get_or_init(Instant::now)
+}
+
+fn thread_number() -> u64 {
+    static NEXT: AtomicU64 = AtomicU64::new(1);
+    thread_local! {
+        static NUMBER: u64 = NEXT.fetch_add(1, Ordering::Relaxed);
+    }
+    NUMBER.with(|n| *n)
+}
+
+pub fn enabled() -> bool {
+    ENABLED.load(Ordering::Relaxed)
+}
+
+/// Records a duration measured elsewhere, such as a lock wait.
+pub fn record(timer: Timer, start: Instant) {
+    if !enabled() {
+        return;
+    }
+    let duration_ns = start.elapsed().as_nanos() as u64;
+    TIMERS[timer as usize].record(duration_ns);
+    if TRACING.load(Ordering::Relaxed) {
+        let start_ns = start.saturating_duration_since(epoch()).as_nanos() as u64;
+        let mut trace = TRACE.lock().unwrap_or_else(PoisonError::into_inner);
+        if trace.len() == TRACE_CAPACITY {
+            trace.pop_front();
+        }
+        trace.push_back(TraceEvent { timer, start_ns, duration_ns, thread: thread_number() });
+    }
+}
+
+pub fn count(counter: Counter, n: u64) {
+    if enabled() {
+        COUNTERS[counter as usize].fetch_add(n, Ordering::Relaxed);
+    }
+}
+
+/// Counts a string about to be handed to Python, and passes it through.
+pub fn returned(text: String) -> String {
+    count(Counter::BytesToPython, text.len() as u64);
+    text
+}
+
+/// Times the enclosing scope. `None` while stats are off, so nothing is measured.
+pub struct Span {
+    timer: Timer,
+    start: Instant,
+}
+
+pub fn span(timer: Timer) -> Option<Span> {
+    enabled().then(|| Span { timer, start: Instant::now() })
+}
+
+impl Drop for Span {
+    fn drop(&mut self) {
+        record(self.timer, self.start);
+    }
+}
+
+pub fn set_enabled(stats: bool, trace: bool) {
+    if stats {
+        epoch();
+    }
+    ENABLED.store(stats, Ordering::Relaxed);
+    TRACING.store(stats && trace, Ordering::Relaxed);
+}
+
+pub fn tracing() -> bool {
+    TRACING.load(Ordering::Relaxed)
+}
+
+/// Summary of one timer, in nanoseconds.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub struct TimerStats {
+    pub count: u64,
+    pub total_ns: u64,
+    pub max_ns: u64,
+    pub p50_ns: u64,
+    pub p90_ns: u64,
+    pub p99_ns: u64,
+}
+
+/// Every timer that recorded something since the last reset.
+pub fn timers() -> Vec<(&'static str, TimerStats)> {
+    Timer::ALL
+        .iter()
+        .filter_map(|&timer| {
+            let histogram = &TIMERS[timer as usize];
+            let counts: Vec<u64> = histogram.buckets.iter().map(|b| b.load(Ordering::Relaxed)).collect();
+            let count: u64 = counts.iter().sum();
+            (count > 0).then(|| {
+                let stats = TimerStats {
+                    count,
+                    total_ns: histogram.total.load(Ordering::Relaxed),
+                    max_ns: histogram.max.load(Ordering::Relaxed),
+                    p50_ns: histogram.percentile(&counts, count, 0.5),
+                    p90_ns: histogram.percentile(&counts, count, 0.9),
+                    p99_ns: histogram.percentile(&counts, count, 0.99),
+                };
+                (timer.name(), stats)
+            })
+        })
+        .collect()
+}
+
+pub fn counters() -> Vec<(&'static str, u64)> {
+    Counter::ALL.iter().map(|&c| (c.name(), COUNTERS[c as usize].load(Ordering::Relaxed))).collect()
+}
+
+/// Share of lookups that hit, or `None` before the first lookup.
+pub fn hit_rate(hits: Counter, misses: Counter) -> Option<f64> {
+    let hits = COUNTERS[hits as usize].load(Ordering::Relaxed);
+    let total = hits + COUNTERS[misses as usize].load(Ordering::Relaxed);
+    (total > 0).then(|| hits as f64 / total as f64)
+}
+
+pub fn reset() {
+    for histogram in &TIMERS {
+        histogram.reset();
+    }
+    for counter in &COUNTERS {
+        counter.store(0, Ordering::Relaxed);
+    }
+    TRACE.lock().unwrap_or_else(PoisonError::into_inner).clear();
+}
+
+/// The recorded spans as a Chrome trace-event document, and how many there are.
+pub fn trace_json() -> (usize, String) {
+    let trace = TRACE.lock().unwrap_or_else(PoisonError::into_inner);
+    let mut json = String::from("{\"traceEvents\":[\n");
+    for (i, e) in trace.iter().enumerate() {
+        if i > 0 {
+            json.push_str(",\n");
+        }
+        let _ = write!(
+            json,
+            r#"{{"name":"{}","ph":"X","pid":1,"tid":{},"ts":{:.3},"dur":{:.3}}}"#,
+            e.timer.name(),
+            e.thread,
+            e.start_ns as f64 / 1000.0,
+            e.duration_ns as f64 / 1000.0
+        );
+    }
+    json.push_str("\n]}\n");
+    (trace.len(), json)
+}
@@ -0,0 +1,156 @@
+//! `SessionStore`: saves every open calculator in the background and restores
+//! them all at startup, in the format of `session`.
+
+use pyo3::prelude::*;
+use pyo3::exceptions::{PyOSError, PyValueError};
+use std::collections::HashMap;
+use std::path::{Path, PathBuf};
+use std::sync::{Arc, Mutex, PoisonError};
+use std::thread::JoinHandle;
+
+use crate::calculator::Calculator;
+use crate::session::{self, TabState};
+
+/// Encoded tabs by calculator identity, reused while their stamp is unchanged.
+#[derive(Default)]
+struct Encoded {
+    tabs: HashMap<usize, ([u64; 5], String, Arc<[u8]>)>,
+    /* What the file on disk currently holds, to skip identical rewrites */
+    written: Option<(usize, Vec<(usize, [u64; 5], String)>)>,
+    error: Option<String>,
+}
+
+#[pyclass]
+pub struct SessionStore {
+    path: PathBuf,
+    encoded: Arc<Mutex<Encoded>>,
+    /* The latest background save; each one waits for the one before it */
+    pending: Mutex<Option<JoinHandle<()>>>,
+}
+
+impl SessionStore {
+    fn write(path: &Path, encoded: &Mutex<Encoded>, tabs: Vec<(Calculator, String)>, selected: usize) {
+        let mut encoded = encoded.lock().unwrap_or_else(PoisonError::into_inner);
+        let layout: Vec<(usize, [u64; 5], String)> =
+            tabs.iter().map(|(calc, mode)| (calc.identity(), calc.state_stamp(), mode.clone())).collect();
+        if encoded.written.as_ref().is_some_and(|(s, l)| *s == selected && *l == layout) {
+            return;
+        }
+
+        /* Only tabs that changed since the last save are encoded again */
+        let mut blobs = Vec::with_capacity(tabs.len());
+        let mut kept = HashMap::with_capacity(tabs.len());
+        for ((calc, mode), (id, stamp, _)) in tabs.into_iter().zip(&layout) {
+            let blob = match encoded.tabs.remove(id) {
+                Some((s, m, blob)) if s == *stamp && m == mode => blob,
+                _ => Arc::from(calc.to_state(mode.clone()).encode()),
+            };
+            blobs.push(blob.clone());
+            kept.insert(*id, (*stamp, mode, blob));
+        }
+        encoded.tabs = kept;
+
+        let data = session::encode_file(selected, blobs.iter().map(|b| &b[..]));
+        /* Write beside the target and rename, so a crash never leaves half a session */
+        let tmp = path.with_extension("tmp");
+        let res = path
+            .parent()
+            .map_or(Ok(()), std::fs::create_dir_all)
+            .and_then(|_| std::fs::write(&tmp, &data))
+            .and_then(|_| std::fs::rename(&tmp, path));
+        match res {
+            Ok(()) => {
+                encoded.written = Some((selected, layout));
+                encoded.error = None;
+            }
+            Err(e) => encoded.error = Some(format!("{}: {}", path.display(), e)),
+        }
+    }
+}
+
+#[pymethods]
+impl SessionStore {
+    #[new]
+    fn new(path: PathBuf) -> Self {
+        SessionStore { path, encoded: Arc::new(Mutex::new(Encoded::default())), pending: Mutex::new(None) }
+    }
+
+    /// Saves the calculators, in tab order, on a background thread and returns
+    /// at once. `modes` is stored with each tab; `selected` is the active tab.
+    fn save(&self, calculators: Vec<PyRef<'_, Calculator>>, modes: Vec<String>, selected: usize) {
+        let tabs: Vec<(Calculator, String)> = calculators
+            .iter()
+            .map(|c| Calculator::clone(c))
+            .zip(modes.into_iter().chain(std::iter::repeat(String::new())))
+            .collect();
+        let path = self.path.clone();
+        let encoded = self.encoded.clone();
+        let mut pending = self.pending.lock().unwrap_or_else(PoisonError::into_inner);
+        let previous = pending.take();
+        *pending = Some(std::thread::spawn(move || {
+            if let Some(previous) = previous {
+                let _ = previous.join();
+            }
+            Self::write(&path, &encoded, tabs, selected);
+        }));
+    }
+
+    /// Waits for the last save to reach the disk. Raises if it failed.
+    fn flush(&self, py: Python<'_>) -> PyResult<()> {
+        let handle = self.pending.lock().unwrap_or_else(PoisonError::into_inner).take();
+        if let Some(handle) = handle {
+            let _ = py.detach(|| handle.join());
+        }
+        match self.encoded.lock().unwrap_or_else(PoisonError::into_inner).error.take() {
+            Some(e) => Err(PyOSError::new_err(e)),
+            None => Ok(()),
+        }
+    }
+
+    /// The saved calculators, their modes, the selected index and the saved
+    /// definitions that could not be restored. An empty list if there is no
+    /// session yet.
+    fn load(&self, py: Python<'_>) -> PyResult<(Vec<Calculator>, Vec<String>, usize, Vec<String>)> {
+        let path = self.path.clone();
+        let decoded = py.detach(|| -> Result<Option<(usize, Vec<TabState>)>, String> {
+            let data = match std::fs::read(&path) {
+                Ok(data) => data,
+                Err(e) if e.kind() == std::io::ErrorKind::NotFound => return Ok(None),
+                Err(e) => return Err(format!("{}: {}", path.display(), e)),
+            };
+            let (selected, tabs) = session::decode_file(&data).map_err(|e| e.to_string())?;
+
+            /* Tabs are independent, so they are decoded in parallel */
+            let workers = std::thread::available_parallelism().map_or(1, |n| n.get());
+            let chunk_len = tabs.len().div_ceil(workers).max(1);
+            let states = std::thread::scope(|scope| {
+                let handles: Vec<_> = tabs
+                    .chunks(chunk_len)
+                    .map(|chunk| {
+                        scope.spawn(move || chunk.iter().map(|t| TabState::decode(t)).collect::<Result<Vec<_>, _>>())
+                    })
+                    .collect();
+                handles
+                    .into_iter()
+                    .map(|h| h.join().expect("session decoder panicked"))
+                    .collect::<Result<Vec<Vec<TabState>>, _>>()
+            })
+            .map_err(|e| e.to_string())?;
+            Ok(Some((selected, states.into_iter().flatten().collect())))
+        });
+
+        let Some((selected, states)) = decoded.map_err(PyValueError::new_err)? else {
+            return Ok((Vec::new(), Vec::new(), 0, Vec::new()));
+        };
+        let modes: Vec<String> = states.iter().map(|s| s.mode.clone()).collect();
+        let (calculators, dropped): (Vec<Calculator>, Vec<Vec<String>>) =
+            py.detach(|| states.into_iter().map(Calculator::from_state).unzip());
+
+        /* What was just loaded is what is on disk, so an untouched session is not rewritten */
+        let layout = calculators.iter().zip(&modes).map(|(c, m)| (c.identity(), c.state_stamp(), m.clone())).collect();
+        let mut encoded = self.encoded.lock().unwrap_or_else(PoisonError::into_inner);
+        encoded.written = Some((selected, layout));
+        encoded.tabs.clear();
+        Ok((calculators, modes, selected, dropped.concat()))
+    }
+}
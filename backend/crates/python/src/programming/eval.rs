@@ -0,0 +1,86 @@
+use neocalc_core::Context;
+
+use super::word::{WordError, WordSize, WordValue};
+use crate::expr::{self, Arena, BinaryOp, Expr, UnaryOp};
+use crate::utils::lookup_variable;
+
+/// Parses an integer literal (decimal, `0x`, `0b` or `0o`) straight into a word.
+fn parse_literal(text: &str, size: WordSize) -> Result<u128, WordError> {
+    let (digits, radix) = match text.get(..2) {
+        Some("0x") | Some("0X") => (&text[2..], 16),
+        Some("0b") | Some("0B") => (&text[2..], 2),
+        Some("0o") | Some("0O") => (&text[2..], 8),
+        _ => (text, 10),
+    };
+
+    let mut acc: u128 = 0;
+    for c in digits.chars() {
+        /* Fractions and exponents belong to the engine */
+        let digit = c.to_digit(radix).ok_or(WordError::Unsupported)?;
+        acc = acc.wrapping_mul(radix as u128).wrapping_add(digit as u128);
+    }
+    Ok(size.wrap(acc))
+}
+
+fn expect_args(name: &str, args: &[Expr<'_>], expected: usize) -> Result<(), WordError> {
+    if args.len() != expected {
+        return Err(WordError::Arity { name: name.to_string(), expected });
+    }
+    Ok(())
+}
+
+fn eval(expr: &Expr<'_>, size: WordSize, context: &Context) -> Result<u128, WordError> {
+    match expr {
+        Expr::Number(text) => parse_literal(text, size),
+        Expr::Ident(name) => lookup_variable(context, name)
+            .map(|n| size.from_number(n))
+            .ok_or(WordError::Unsupported),
+        Expr::Unary(UnaryOp::Neg, inner) => Ok(size.neg(eval(inner, size, context)?)),
+        Expr::Unary(UnaryOp::Factorial, inner) => size.factorial(eval(inner, size, context)?),
+        Expr::Binary(op, lhs, rhs) => {
+            let a = eval(lhs, size, context)?;
+            let b = eval(rhs, size, context)?;
+            match op {
+                BinaryOp::Add => Ok(size.add(a, b)),
+                BinaryOp::Sub => Ok(size.sub(a, b)),
+                BinaryOp::Mul => Ok(size.mul(a, b)),
+                BinaryOp::Div => size.div(a, b),
+                BinaryOp::Rem => size.rem(a, b),
+                BinaryOp::Pow => size.pow(a, b),
+            }
+        }
+        Expr::Call(name, args) => {
+            let arity = match *name {
+                "bnot" => 1,
+                "band" | "bor" | "bxor" | "lsh" | "rsh" | "rol" | "ror" => 2,
+                _ => return Err(WordError::Unsupported),
+            };
+            expect_args(name, args, arity)?;
+            let a = eval(&args[0], size, context)?;
+            if arity == 1 {
+                return Ok(size.not(a));
+            }
+            let b = eval(&args[1], size, context)?;
+            match *name {
+                "band" => Ok(a & b),
+                "bor" => Ok(a | b),
+                "bxor" => Ok(a ^ b),
+                "lsh" => size.shl(a, b),
+                "rsh" => size.shr(a, b),
+                "rol" => Ok(size.rotl(a, b)),
+                _ => Ok(size.rotr(a, b)),
+            }
+        }
+        Expr::List(_) => Err(WordError::Unsupported),
+    }
+}
+
+/// Evaluates `input` entirely in native fixed-width arithmetic.
+///
+/// Returns [`WordError::Unsupported`] when the expression needs the full engine
+/// (assignments, fractions, unknown names or functions).
+pub fn evaluate(input: &str, size: WordSize, context: &Context) -> Result<WordValue, WordError> {
+    let arena = Arena::new();
+    let parsed = expr::parse(&arena, input).map_err(|_| WordError::Unsupported)?;
+    eval(&parsed, size, context).map(|raw| size.value(raw))
+}
@@ -0,0 +1,7 @@
+//! Fixed-width integer arithmetic for the programming mode.
+
+pub mod eval;
+pub mod word;
+
+pub use eval::evaluate;
+pub use word::{WordError, WordSize, WordValue};
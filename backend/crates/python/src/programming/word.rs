@@ -0,0 +1,327 @@
+use neocalc_core::Number;
+use num::bigint::Sign;
+use num::BigInt;
+use thiserror::Error;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum WordError {
+    #[error("Unsupported word size: {0} bits")]
+    UnsupportedSize(u32),
+    #[error("Division by zero")]
+    DivisionByZero,
+    #[error("Negative exponent in integer mode")]
+    NegativeExponent,
+    #[error("Negative shift amount")]
+    NegativeShift,
+    #[error("Factorial of a negative number")]
+    NegativeFactorial,
+    #[error("{name} expects {expected} argument(s)")]
+    Arity { name: String, expected: usize },
+    /// The expression uses something outside the native subset; callers fall back to the engine.
+    #[error("Expression not supported in word mode")]
+    Unsupported,
+}
+
+/// A fixed machine word. Values are carried as raw `u128` bit patterns that are
+/// always masked to `bits`, and every operation wraps like the hardware would.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct WordSize {
+    bits: u32,
+    signed: bool,
+}
+
+impl WordSize {
+    pub const SUPPORTED_BITS: [u32; 5] = [8, 16, 32, 64, 128];
+
+    pub fn new(bits: u32, signed: bool) -> Result<Self, WordError> {
+        if !Self::SUPPORTED_BITS.contains(&bits) {
+            return Err(WordError::UnsupportedSize(bits));
+        }
+        Ok(WordSize { bits, signed })
+    }
+
+    pub fn bits(self) -> u32 {
+        self.bits
+    }
+
+    pub fn signed(self) -> bool {
+        self.signed
+    }
+
+    fn mask(self) -> u128 {
+        if self.bits == 128 { u128::MAX } else { (1u128 << self.bits) - 1 }
+    }
+
+    pub fn wrap(self, raw: u128) -> u128 {
+        raw & self.mask()
+    }
+
+    /// Sign-extends a raw word when the size is signed.
+    pub fn to_i128(self, raw: u128) -> i128 {
+        if self.signed && self.bits < 128 && raw >> (self.bits - 1) & 1 == 1 {
+            (raw | !self.mask()) as i128
+        } else {
+            raw as i128
+        }
+    }
+
+    pub fn is_negative(self, raw: u128) -> bool {
+        self.signed && self.to_i128(raw) < 0
+    }
+
+    pub fn from_number(self, number: &Number) -> u128 {
+        match number {
+            Number::Integer(i) => {
+                /* Two's complement truncation of an arbitrary precision integer */
+                let fill = if i.sign() == Sign::Minus { 0xFF } else { 0x00 };
+                let mut buf = [fill; 16];
+                let bytes = i.to_signed_bytes_le();
+                let n = bytes.len().min(16);
+                buf[..n].copy_from_slice(&bytes[..n]);
+                self.wrap(u128::from_le_bytes(buf))
+            }
+            Number::Float(f) => self.wrap(f.trunc() as i128 as u128),
+        }
+    }
+
+    pub fn add(self, a: u128, b: u128) -> u128 {
+        self.wrap(a.wrapping_add(b))
+    }
+
+    pub fn sub(self, a: u128, b: u128) -> u128 {
+        self.wrap(a.wrapping_sub(b))
+    }
+
+    pub fn mul(self, a: u128, b: u128) -> u128 {
+        self.wrap(a.wrapping_mul(b))
+    }
+
+    pub fn neg(self, a: u128) -> u128 {
+        self.wrap(a.wrapping_neg())
+    }
+
+    pub fn not(self, a: u128) -> u128 {
+        self.wrap(!a)
+    }
+
+    pub fn div(self, a: u128, b: u128) -> Result<u128, WordError> {
+        if b == 0 {
+            return Err(WordError::DivisionByZero);
+        }
+        if self.signed {
+            Ok(self.wrap(self.to_i128(a).wrapping_div(self.to_i128(b)) as u128))
+        } else {
+            Ok(a / b)
+        }
+    }
+
+    pub fn rem(self, a: u128, b: u128) -> Result<u128, WordError> {
+        if b == 0 {
+            return Err(WordError::DivisionByZero);
+        }
+        if self.signed {
+            Ok(self.wrap(self.to_i128(a).wrapping_rem(self.to_i128(b)) as u128))
+        } else {
+            Ok(a % b)
+        }
+    }
+
+    pub fn pow(self, base: u128, exponent: u128) -> Result<u128, WordError> {
+        if self.is_negative(exponent) {
+            return Err(WordError::NegativeExponent);
+        }
+        /* Square and multiply; wrapping keeps every step inside the word */
+        let (mut result, mut base, mut exponent) = (1u128, base, exponent);
+        while exponent > 0 {
+            if exponent & 1 == 1 {
+                result = result.wrapping_mul(base);
+            }
+            base = base.wrapping_mul(base);
+            exponent >>= 1;
+        }
+        Ok(self.wrap(result))
+    }
+
+    pub fn factorial(self, n: u128) -> Result<u128, WordError> {
+        if self.is_negative(n) {
+            return Err(WordError::NegativeFactorial);
+        }
+        /* From 2 * bits on the product has at least `bits` factors of two */
+        if n >= 2 * self.bits as u128 {
+            return Ok(0);
+        }
+        Ok(self.wrap((2..=n).fold(1u128, |acc, i| acc.wrapping_mul(i))))
+    }
+
+    fn shift_amount(self, n: u128) -> Result<u128, WordError> {
+        if self.is_negative(n) {
+            return Err(WordError::NegativeShift);
+        }
+        Ok(n)
+    }
+
+    pub fn shl(self, a: u128, n: u128) -> Result<u128, WordError> {
+        let n = self.shift_amount(n)?;
+        if n >= self.bits as u128 {
+            return Ok(0);
+        }
+        Ok(self.wrap(a << n))
+    }
+
+    /// Arithmetic shift for signed words, logical shift for unsigned ones.
+    pub fn shr(self, a: u128, n: u128) -> Result<u128, WordError> {
+        let n = self.shift_amount(n)?;
+        let negative = self.is_negative(a);
+        if n >= self.bits as u128 {
+            return Ok(if negative { self.mask() } else { 0 });
+        }
+        if self.signed {
+            Ok(self.wrap((self.to_i128(a) >> n) as u128))
+        } else {
+            Ok(a >> n)
+        }
+    }
+
+    pub fn rotl(self, a: u128, n: u128) -> u128 {
+        let n = (n % self.bits as u128) as u32;
+        if n == 0 {
+            return a;
+        }
+        self.wrap((a << n) | (a >> (self.bits - n)))
+    }
+
+    pub fn rotr(self, a: u128, n: u128) -> u128 {
+        let n = (n % self.bits as u128) as u32;
+        if n == 0 {
+            return a;
+        }
+        self.wrap((a >> n) | (a << (self.bits - n)))
+    }
+
+    pub fn value(self, raw: u128) -> WordValue {
+        WordValue { raw: self.wrap(raw), size: self }
+    }
+}
+
+/// A word together with its size, ready to be shown in any base.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct WordValue {
+    pub raw: u128,
+    pub size: WordSize,
+}
+
+impl WordValue {
+    pub fn to_hex(&self) -> String {
+        format!("0x{:X}", self.raw)
+    }
+
+    pub fn to_dec(&self) -> String {
+        if self.size.signed {
+            self.size.to_i128(self.raw).to_string()
+        } else {
+            self.raw.to_string()
+        }
+    }
+
+    pub fn to_oct(&self) -> String {
+        format!("0o{:o}", self.raw)
+    }
+
+    pub fn to_bin(&self) -> String {
+        format!("0b{:b}", self.raw)
+    }
+
+    pub fn to_radix(&self, radix: u32) -> String {
+        match radix {
+            2 => self.to_bin(),
+            8 => self.to_oct(),
+            16 => self.to_hex(),
+            _ => self.to_dec(),
+        }
+    }
+
+    pub fn to_number(&self) -> Number {
+        if self.size.signed {
+            Number::Integer(BigInt::from(self.size.to_i128(self.raw)))
+        } else {
+            Number::Integer(BigInt::from(self.raw))
+        }
+    }
+}
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn sizes() -> impl Iterator<Item = (WordSize, WordSize)> {
+        WordSize::SUPPORTED_BITS
+            .iter()
+            .map(|&bits| (WordSize::new(bits, false).unwrap(), WordSize::new(bits, true).unwrap()))
+    }
+
+    #[test]
+    fn rejects_unsupported_sizes() {
+        assert_eq!(WordSize::new(12, true), Err(WordError::UnsupportedSize(12)));
+    }
+
+    #[test]
+    fn unsigned_wraps_at_every_width() {
+        for (unsigned, _) in sizes() {
+            let max = unsigned.mask();
+            assert_eq!(unsigned.add(max, 1), 0, "{} bits", unsigned.bits());
+            assert_eq!(unsigned.sub(0, 1), max, "{} bits", unsigned.bits());
+            assert_eq!(unsigned.value(max).to_dec(), max.to_string());
+            assert!(!unsigned.is_negative(max));
+        }
+    }
+
+    #[test]
+    fn signed_wraps_at_every_width() {
+        for (_, signed) in sizes() {
+            let bits = signed.bits();
+            let min = (signed.mask() >> 1) + 1;
+            assert_eq!(signed.add(min - 1, 1), min, "{} bits", bits);
+            assert_eq!(signed.to_i128(min), i128::MIN >> (128 - bits), "{} bits", bits);
+            assert_eq!(signed.value(signed.sub(0, 1)).to_dec(), "-1");
+            assert_eq!(signed.neg(min), min, "{} bits", bits);
+            assert_eq!(signed.div(min, signed.neg(1)), Ok(min), "{} bits", bits);
+        }
+    }
+
+    #[test]
+    fn signedness_changes_division_and_shifts() {
+        for (unsigned, signed) in sizes() {
+            let minus_eight = signed.neg(8);
+            let width = signed.bits() as u128;
+            assert_eq!(signed.to_i128(signed.div(minus_eight, 2).unwrap()), -4);
+            assert_eq!(signed.to_i128(signed.shr(minus_eight, 1).unwrap()), -4);
+            assert_eq!(unsigned.shr(minus_eight, 1).unwrap(), minus_eight >> 1);
+            assert_eq!(signed.shr(minus_eight, width).unwrap(), signed.mask());
+            assert_eq!(unsigned.shr(minus_eight, width).unwrap(), 0);
+        }
+    }
+
+    #[test]
+    fn numbers_truncate_into_the_word() {
+        for (unsigned, signed) in sizes() {
+            let minus_one = Number::Integer(BigInt::from(-1i128));
+            assert_eq!(unsigned.from_number(&minus_one), unsigned.mask());
+            assert_eq!(signed.value(signed.from_number(&minus_one)).to_dec(), "-1");
+            assert_eq!(unsigned.from_number(&Number::Float(-2.9)), unsigned.wrap(-2i128 as u128));
+            assert_eq!(signed.value(signed.from_number(&Number::Float(-2.9))).to_dec(), "-2");
+        }
+        let byte = WordSize::new(8, false).unwrap();
+        assert_eq!(byte.from_number(&Number::Integer(BigInt::from(0x1234i128))), 0x34);
+    }
+
+    #[test]
+    fn rejects_negative_operands() {
+        let signed = WordSize::new(8, true).unwrap();
+        let minus_one = signed.neg(1);
+        assert_eq!(signed.pow(2, minus_one), Err(WordError::NegativeExponent));
+        assert_eq!(signed.factorial(minus_one), Err(WordError::NegativeFactorial));
+        assert_eq!(signed.shl(1, minus_one), Err(WordError::NegativeShift));
+        assert_eq!(signed.rem(1, 0), Err(WordError::DivisionByZero));
+    }
+}
@@ -0,0 +1,239 @@
+//! Spreadsheet-style formulas: `total := price * qty` keeps `total` up to date.
+//!
+//! Each formula records the variables it reads. When one of them is reassigned
+//! only the formulas downstream of it are recomputed, inputs before outputs.
+
+use std::collections::{HashMap, HashSet, VecDeque};
+
+use thiserror::Error;
+
+use crate::expr::{self, Arena, ParseError};
+use crate::vm::FunctionTable;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum ReactiveError {
+    #[error("Circular reference: {}", .0.join(" -> "))]
+    Cycle(Vec<String>),
+    #[error(transparent)]
+    Parse(#[from] ParseError),
+}
+
+/// Splits `name := expression`. Returns `None` for anything else.
+pub fn parse_formula(input: &str) -> Option<(&str, &str)> {
+    let (head, body) = input.split_once(":=")?;
+    Some((expr::identifier(head)?, body.trim()))
+}
+
+/// Target and right-hand side of a plain assignment such as `x = 5`. An `=`
+/// that is part of `==`, `<=`, `>=`, `!=` or `:=` is a comparison or a
+/// formula, not an assignment.
+pub fn assignment(input: &str) -> Option<(&str, &str)> {
+    let at = input.find('=')?;
+    let before = input[..at].chars().next_back();
+    if matches!(before, Some('<' | '>' | '!' | ':')) || input[at + 1..].starts_with('=') {
+        return None;
+    }
+    Some((expr::identifier(&input[..at])?, &input[at + 1..]))
+}
+
+/// Target of a plain assignment such as `x = 5`.
+pub fn assigned_name(input: &str) -> Option<&str> {
+    assignment(input).map(|(name, _)| name)
+}
+
+#[derive(Debug, Clone)]
+pub struct Formula {
+    pub text: String,
+    pub reads: Vec<String>,
+}
+
+/// Formulas by name, with the reverse edges kept up to date on every change.
+#[derive(Debug, Clone, Default)]
+pub struct FormulaGraph {
+    formulas: HashMap<String, Formula>,
+    /* Variable name to the formulas that read it */
+    readers: HashMap<String, HashSet<String>>,
+}
+
+impl FormulaGraph {
+    pub fn get(&self, name: &str) -> Option<&Formula> {
+        self.formulas.get(name)
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.formulas.is_empty()
+    }
+
+    pub fn iter(&self) -> impl Iterator<Item = (&String, &Formula)> {
+        self.formulas.iter()
+    }
+
+    /// Path `from -> ... -> to` along reader edges, if there is one.
+    fn path(&self, from: &str, to: &HashSet<&str>) -> Option<Vec<String>> {
+        let mut parent: HashMap<&str, &str> = HashMap::new();
+        let mut queue = VecDeque::from([from]);
+        while let Some(node) = queue.pop_front() {
+            if to.contains(node) {
+                let mut path = vec![node.to_string()];
+                let mut cur = node;
+                while let Some(p) = parent.get(cur) {
+                    path.push(p.to_string());
+                    cur = p;
+                }
+                path.reverse();
+                return Some(path);
+            }
+            for reader in self.readers.get(node).into_iter().flatten() {
+                if reader != from && !parent.contains_key(reader.as_str()) {
+                    parent.insert(reader, node);
+                    queue.push_back(reader);
+                }
+            }
+        }
+        None
+    }
+
+    /// Adds or replaces the formula for `name`. Only the edges of `name` change.
+    pub fn set(&mut self, name: &str, text: &str, functions: &FunctionTable) -> Result<(), ReactiveError> {
+        let arena = Arena::new();
+        let reads = functions.free_variables(&expr::parse(&arena, text)?);
+
+        let targets: HashSet<&str> = reads.iter().map(String::as_str).collect();
+        if targets.contains(name) {
+            return Err(ReactiveError::Cycle(vec![name.to_string(), name.to_string()]));
+        }
+        if let Some(mut path) = self.path(name, &targets) {
+            path.push(name.to_string());
+            return Err(ReactiveError::Cycle(path));
+        }
+
+        self.unlink(name);
+        for read in &reads {
+            self.readers.entry(read.clone()).or_default().insert(name.to_string());
+        }
+        self.formulas.insert(name.to_string(), Formula { text: text.to_string(), reads });
+        Ok(())
+    }
+
+    fn unlink(&mut self, name: &str) {
+        let Some(old) = self.formulas.remove(name) else {
+            return;
+        };
+        for read in &old.reads {
+            if let Some(readers) = self.readers.get_mut(read) {
+                readers.remove(name);
+                if readers.is_empty() {
+                    self.readers.remove(read);
+                }
+            }
+        }
+    }
+
+    /// Drops a formula. The variable keeps its last value.
+    pub fn remove(&mut self, name: &str) -> bool {
+        let existed = self.formulas.contains_key(name);
+        self.unlink(name);
+        existed
+    }
+
+    /// Formulas affected by a change to `changed`, in an order where every
+    /// formula comes after the formulas it reads (Kahn's algorithm on the
+    /// affected part of the graph only).
+    pub fn affected(&self, changed: &str) -> Vec<String> {
+        let mut reached: HashSet<&str> = HashSet::new();
+        let mut stack = vec![changed];
+        while let Some(node) = stack.pop() {
+            for reader in self.readers.get(node).into_iter().flatten() {
+                if reached.insert(reader) {
+                    stack.push(reader);
+                }
+            }
+        }
+
+        let mut pending: HashMap<&str, usize> = reached
+            .iter()
+            .map(|&n| {
+                let inputs = self.formulas[n].reads.iter().filter(|r| reached.contains(r.as_str()));
+                (n, inputs.count())
+            })
+            .collect();
+        let mut ready: VecDeque<&str> = pending.iter().filter(|(_, c)| **c == 0).map(|(n, _)| *n).collect();
+        let mut order = Vec::with_capacity(reached.len());
+        while let Some(node) = ready.pop_front() {
+            order.push(node.to_string());
+            for reader in self.readers.get(node).into_iter().flatten() {
+                if let Some(count) = pending.get_mut(reader.as_str()) {
+                    *count -= 1;
+                    if *count == 0 {
+                        ready.push_back(reader);
+                    }
+                }
+            }
+        }
+        order
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn graph(formulas: &[(&str, &str)]) -> FormulaGraph {
+        let functions = FunctionTable::default();
+        let mut graph = FormulaGraph::default();
+        for (name, text) in formulas {
+            graph.set(name, text, &functions).unwrap();
+        }
+        graph
+    }
+
+    fn position(order: &[String], name: &str) -> usize {
+        order.iter().position(|n| n == name).unwrap_or_else(|| panic!("{name} not in {order:?}"))
+    }
+
+    #[test]
+    fn splits_formulas_and_assignments() {
+        assert_eq!(parse_formula("total := price * qty"), Some(("total", "price * qty")));
+        assert_eq!(assignment("x = 5"), Some(("x", " 5")));
+        for comparison in ["x == 5", "x <= 5", "x >= 5", "x != 5", "x := 5"] {
+            assert_eq!(assignment(comparison), None, "{comparison}");
+        }
+    }
+
+    #[test]
+    fn rejects_cycles_and_keeps_the_graph() {
+        let functions = FunctionTable::default();
+        let mut graph = graph(&[("b", "a + 1"), ("c", "b * 2")]);
+        assert_eq!(graph.set("a", "a + 1", &functions), Err(ReactiveError::Cycle(vec!["a".into(), "a".into()])));
+        assert_eq!(
+            graph.set("a", "c - 1", &functions),
+            Err(ReactiveError::Cycle(vec!["a".into(), "b".into(), "c".into(), "a".into()]))
+        );
+        assert!(graph.get("a").is_none());
+        assert_eq!(graph.affected("a"), vec!["b".to_string(), "c".to_string()]);
+    }
+
+    #[test]
+    fn recomputes_inputs_before_outputs() {
+        /* A diamond with a shortcut: d reads b and c, and c reads b too */
+        let graph = graph(&[("d", "b + c"), ("c", "b * a"), ("b", "a + 1"), ("e", "z")]);
+        let order = graph.affected("a");
+        assert_eq!(order.len(), 3, "{order:?}");
+        assert!(position(&order, "b") < position(&order, "c"));
+        assert!(position(&order, "c") < position(&order, "d"));
+        assert_eq!(graph.affected("c"), vec!["d".to_string()]);
+        assert!(graph.affected("d").is_empty());
+    }
+
+    #[test]
+    fn replacing_a_formula_moves_its_edges() {
+        let functions = FunctionTable::default();
+        let mut graph = graph(&[("b", "a + 1")]);
+        graph.set("b", "z * 2", &functions).unwrap();
+        assert!(graph.affected("a").is_empty());
+        assert_eq!(graph.affected("z"), vec!["b".to_string()]);
+        assert!(graph.remove("b"));
+        assert!(graph.affected("z").is_empty());
+        assert!(!graph.remove("b"));
+    }
+}
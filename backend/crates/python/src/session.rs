@@ -0,0 +1,289 @@
+//! Binary session format: every open calculator, restorable in one read.
+//!
+//! ```text
+//! file := "NCSS" version:u8 selected:varint count:varint (len:varint tab)*
+//! tab  := mode:str buffer:str history:list<str> variables:list<(str, number)>
+//!         functions:list<str> formulas:list<(str, str)> word:u8 [bits:varint signed:u8]
+//! str  := len:varint utf8
+//! ```
+//!
+//! Tabs are length-prefixed so they can be encoded once and reused while
+//! unchanged, and decoded in parallel.
+
+use num::BigInt;
+use thiserror::Error;
+
+use neocalc_core::Number;
+
+const MAGIC: &[u8; 4] = b"NCSS";
+const VERSION: u8 = 1;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum SessionError {
+    #[error("Not a session file")]
+    BadMagic,
+    #[error("Unsupported session version {0}")]
+    Version(u8),
+    #[error("Session file is truncated")]
+    Truncated,
+    #[error("Session file contains invalid text")]
+    InvalidText,
+    #[error("Unknown value tag {0} in session file")]
+    InvalidTag(u8),
+}
+
+/// Everything needed to rebuild one calculator.
+#[derive(Debug, Clone, Default)]
+pub struct TabState {
+    /// Keypad shown in the tab, chosen by the UI.
+    pub mode: String,
+    pub buffer: String,
+    pub history: Vec<String>,
+    pub variables: Vec<(String, Number)>,
+    /// Function definitions as typed, such as `f(x) = x^2`, callees first.
+    pub functions: Vec<String>,
+    pub formulas: Vec<(String, String)>,
+    pub word_size: Option<(u32, bool)>,
+}
+
+struct Writer(Vec<u8>);
+
+impl Writer {
+    fn varint(&mut self, mut n: u64) {
+        while n >= 0x80 {
+            self.0.push((n as u8) | 0x80);
+            n >>= 7;
+        }
+        self.0.push(n as u8);
+    }
+
+    fn bytes(&mut self, b: &[u8]) {
+        self.varint(b.len() as u64);
+        self.0.extend_from_slice(b);
+    }
+
+    fn str(&mut self, s: &str) {
+        self.bytes(s.as_bytes());
+    }
+
+    fn number(&mut self, n: &Number) {
+        match n {
+            Number::Integer(i) => {
+                self.0.push(0);
+                self.bytes(&i.to_signed_bytes_le());
+            }
+            Number::Float(f) => {
+                self.0.push(1);
+                self.0.extend_from_slice(&f.to_le_bytes());
+            }
+        }
+    }
+}
+
+struct Reader<'a> {
+    data: &'a [u8],
+}
+
+impl<'a> Reader<'a> {
+    fn take(&mut self, n: usize) -> Result<&'a [u8], SessionError> {
+        if self.data.len() < n {
+            return Err(SessionError::Truncated);
+        }
+        let (head, rest) = self.data.split_at(n);
+        self.data = rest;
+        Ok(head)
+    }
+
+    fn byte(&mut self) -> Result<u8, SessionError> {
+        Ok(self.take(1)?[0])
+    }
+
+    fn varint(&mut self) -> Result<u64, SessionError> {
+        let mut n = 0u64;
+        for shift in (0..64).step_by(7) {
+            let b = self.byte()?;
+            n |= u64::from(b & 0x7f) << shift;
+            if b & 0x80 == 0 {
+                return Ok(n);
+            }
+        }
+        Err(SessionError::Truncated)
+    }
+
+    fn len(&mut self) -> Result<usize, SessionError> {
+        let n = self.varint()? as usize;
+        /* A length can never exceed what is left; reject before allocating */
+        if n > self.data.len() {
+            return Err(SessionError::Truncated);
+        }
+        Ok(n)
+    }
+
+    fn bytes(&mut self) -> Result<&'a [u8], SessionError> {
+        let n = self.len()?;
+        self.take(n)
+    }
+
+    fn str(&mut self) -> Result<String, SessionError> {
+        let b = self.bytes()?;
+        String::from_utf8(b.to_vec()).map_err(|_| SessionError::InvalidText)
+    }
+
+    fn list<T>(&mut self, mut item: impl FnMut(&mut Self) -> Result<T, SessionError>) -> Result<Vec<T>, SessionError> {
+        let n = self.len()?;
+        (0..n).map(|_| item(self)).collect()
+    }
+
+    fn number(&mut self) -> Result<Number, SessionError> {
+        match self.byte()? {
+            0 => Ok(Number::Integer(BigInt::from_signed_bytes_le(self.bytes()?))),
+            1 => {
+                let b = self.take(8)?;
+                Ok(Number::Float(f64::from_le_bytes(b.try_into().expect("8 bytes"))))
+            }
+            tag => Err(SessionError::InvalidTag(tag)),
+        }
+    }
+}
+
+impl TabState {
+    pub fn encode(&self) -> Vec<u8> {
+        let mut w = Writer(Vec::with_capacity(256));
+        w.str(&self.mode);
+        w.str(&self.buffer);
+        w.varint(self.history.len() as u64);
+        self.history.iter().for_each(|h| w.str(h));
+        w.varint(self.variables.len() as u64);
+        for (name, value) in &self.variables {
+            w.str(name);
+            w.number(value);
+        }
+        w.varint(self.functions.len() as u64);
+        self.functions.iter().for_each(|f| w.str(f));
+        w.varint(self.formulas.len() as u64);
+        for (name, text) in &self.formulas {
+            w.str(name);
+            w.str(text);
+        }
+        match self.word_size {
+            Some((bits, signed)) => {
+                w.0.push(1);
+                w.varint(u64::from(bits));
+                w.0.push(u8::from(signed));
+            }
+            None => w.0.push(0),
+        }
+        w.0
+    }
+
+    pub fn decode(data: &[u8]) -> Result<TabState, SessionError> {
+        let mut r = Reader { data };
+        Ok(TabState {
+            mode: r.str()?,
+            buffer: r.str()?,
+            history: r.list(Reader::str)?,
+            variables: r.list(|r| Ok((r.str()?, r.number()?)))?,
+            functions: r.list(Reader::str)?,
+            formulas: r.list(|r| Ok((r.str()?, r.str()?)))?,
+            word_size: match r.byte()? {
+                0 => None,
+                _ => Some((r.varint()? as u32, r.byte()? != 0)),
+            },
+        })
+    }
+}
+
+/// Assembles a session file from already encoded tabs.
+pub fn encode_file<'a>(selected: usize, tabs: impl ExactSizeIterator<Item = &'a [u8]>) -> Vec<u8> {
+    let mut w = Writer(MAGIC.to_vec());
+    w.0.push(VERSION);
+    w.varint(selected as u64);
+    w.varint(tabs.len() as u64);
+    for tab in tabs {
+        w.bytes(tab);
+    }
+    w.0
+}
+
+/// Splits a session file into its selected index and the encoded tabs.
+pub fn decode_file(data: &[u8]) -> Result<(usize, Vec<&[u8]>), SessionError> {
+    let mut r = Reader { data };
+    if r.take(MAGIC.len()).map_err(|_| SessionError::BadMagic)? != MAGIC {
+        return Err(SessionError::BadMagic);
+    }
+    match r.byte()? {
+        VERSION => {}
+        v => return Err(SessionError::Version(v)),
+    }
+    let selected = r.varint()? as usize;
+    let tabs = r.list(Reader::bytes)?;
+    Ok((selected, tabs))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn tab() -> TabState {
+        TabState {
+            mode: "scientific".into(),
+            buffer: "sin(π)".into(),
+            history: vec!["1+1 = 2".into(), "x = -5".into()],
+            variables: vec![
+                ("x".into(), Number::Integer(BigInt::from(-5i128))),
+                ("big".into(), Number::Integer(BigInt::from(u128::MAX))),
+                ("y".into(), Number::Float(0.25)),
+            ],
+            functions: vec!["f(x) = x^2".into()],
+            formulas: vec![("t".into(), "f(x) * 2".into())],
+            word_size: Some((32, false)),
+        }
+    }
+
+    #[test]
+    fn tabs_round_trip() {
+        let encoded = tab().encode();
+        let back = TabState::decode(&encoded).unwrap();
+        assert_eq!((back.mode.as_str(), back.buffer.as_str()), ("scientific", "sin(π)"));
+        assert_eq!(back.history, tab().history);
+        assert_eq!(back.functions, tab().functions);
+        assert_eq!(back.formulas, tab().formulas);
+        assert_eq!(back.word_size, Some((32, false)));
+        let names: Vec<&str> = back.variables.iter().map(|(name, _)| name.as_str()).collect();
+        assert_eq!(names, ["x", "big", "y"]);
+        assert!(matches!(back.variables[2].1, Number::Float(f) if f == 0.25));
+        /* Numbers included, decoding loses nothing */
+        assert_eq!(back.encode(), encoded);
+        assert!(TabState::decode(&TabState::default().encode()).unwrap().word_size.is_none());
+    }
+
+    #[test]
+    fn files_round_trip() {
+        let tabs = [tab().encode(), TabState::default().encode()];
+        let file = encode_file(1, tabs.iter().map(Vec::as_slice));
+        let (selected, decoded) = decode_file(&file).unwrap();
+        assert_eq!(selected, 1);
+        assert_eq!(decoded, [tabs[0].as_slice(), tabs[1].as_slice()]);
+    }
+
+    #[test]
+    fn rejects_damaged_files() {
+        let file = encode_file(0, [tab().encode().as_slice()].into_iter());
+        for cut in 0..file.len() {
+            assert!(decode_file(&file[..cut]).is_err(), "cut at {cut}");
+        }
+        assert_eq!(decode_file(b"XXXX\x01"), Err(SessionError::BadMagic));
+        let mut future = file.clone();
+        future[MAGIC.len()] = VERSION + 1;
+        assert_eq!(decode_file(&future), Err(SessionError::Version(VERSION + 1)));
+        /* Empty mode, buffer and history, then one variable with an unknown tag */
+        let mut bad_tag = Writer(Vec::new());
+        bad_tag.str("");
+        bad_tag.str("");
+        bad_tag.varint(0);
+        bad_tag.varint(1);
+        bad_tag.str("x");
+        bad_tag.0.push(7);
+        assert_eq!(TabState::decode(&bad_tag.0).err(), Some(SessionError::InvalidTag(7)));
+    }
+}
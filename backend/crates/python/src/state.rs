@@ -0,0 +1,147 @@
+//! Versioned shared state for `Calculator`.
+//!
+//! Readers take an `Arc` of the current version and work on it without holding
+//! any lock, so they never wait for an evaluation. Writers prepare their result
+//! outside the lock and only the final commit is serialized; the commit copies
+//! the value only if some reader still holds the old version.
+
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, PoisonError, RwLock};
+use std::time::Instant;
+
+use crate::metrics::{self, Timer};
+
+/// How often and how long callers waited to acquire a lock.
+#[derive(Debug, Default)]
+pub struct LockStats {
+    reads: AtomicU64,
+    writes: AtomicU64,
+    read_wait_ns: AtomicU64,
+    write_wait_ns: AtomicU64,
+    max_wait_ns: AtomicU64,
+}
+
+/// Plain copy of [`LockStats`] at one point in time.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub struct LockStatsSnapshot {
+    pub reads: u64,
+    pub writes: u64,
+    pub read_wait_ns: u64,
+    pub write_wait_ns: u64,
+    pub max_wait_ns: u64,
+}
+
+impl LockStats {
+    fn record(&self, write: bool, since: Instant) {
+        let waited = since.elapsed().as_nanos() as u64;
+        let (count, total) = match write {
+            true => (&self.writes, &self.write_wait_ns),
+            false => (&self.reads, &self.read_wait_ns),
+        };
+        count.fetch_add(1, Ordering::Relaxed);
+        total.fetch_add(waited, Ordering::Relaxed);
+        self.max_wait_ns.fetch_max(waited, Ordering::Relaxed);
+    }
+
+    pub fn snapshot(&self) -> LockStatsSnapshot {
+        LockStatsSnapshot {
+            reads: self.reads.load(Ordering::Relaxed),
+            writes: self.writes.load(Ordering::Relaxed),
+            read_wait_ns: self.read_wait_ns.load(Ordering::Relaxed),
+            write_wait_ns: self.write_wait_ns.load(Ordering::Relaxed),
+            max_wait_ns: self.max_wait_ns.load(Ordering::Relaxed),
+        }
+    }
+
+    pub fn reset(&self) {
+        for counter in [&self.reads, &self.writes, &self.read_wait_ns, &self.write_wait_ns, &self.max_wait_ns] {
+            counter.store(0, Ordering::Relaxed);
+        }
+    }
+}
+
+/// A value published in versions. See the module documentation.
+#[derive(Debug, Default)]
+pub struct Shared<T> {
+    current: RwLock<Arc<T>>,
+    version: AtomicU64,
+    stats: LockStats,
+    /* Where lock waits also go in the process-wide metrics, for read and write */
+    timers: Option<(Timer, Timer)>,
+}
+
+impl<T: Clone> Shared<T> {
+    pub fn new(value: T) -> Self {
+        Shared { current: RwLock::new(Arc::new(value)), version: AtomicU64::new(0), stats: LockStats::default(), timers: None }
+    }
+
+    /// Like `new`, also reporting lock waits to `metrics` under the given timers.
+    pub fn timed(value: T, read: Timer, write: Timer) -> Self {
+        Shared { timers: Some((read, write)), ..Shared::new(value) }
+    }
+
+    /// The latest committed version. The read lock is held only to clone the `Arc`.
+    pub fn snapshot(&self) -> Arc<T> {
+        let start = Instant::now();
+        /* A panicked commit leaves at worst a partial update, which is still a usable value */
+        let guard = self.current.read().unwrap_or_else(PoisonError::into_inner);
+        self.stats.record(false, start);
+        if let Some((read, _)) = self.timers {
+            metrics::record(read, start);
+        }
+        guard.clone()
+    }
+
+    /// Like `snapshot`, with the version it is. Pass that to `commit_at` to
+    /// publish a result computed from it.
+    pub fn versioned(&self) -> (Arc<T>, u64) {
+        let start = Instant::now();
+        let guard = self.current.read().unwrap_or_else(PoisonError::into_inner);
+        self.stats.record(false, start);
+        if let Some((read, _)) = self.timers {
+            metrics::record(read, start);
+        }
+        /* Commits bump the version under the write lock, so it matches `guard` */
+        (guard.clone(), self.version.load(Ordering::Acquire))
+    }
+
+    /// Applies `update` to the current value and publishes it as a new version.
+    /// Keep `update` short: it runs under the write lock.
+    pub fn commit<R>(&self, update: impl FnOnce(&mut T) -> R) -> R {
+        let start = Instant::now();
+        let mut guard = self.current.write().unwrap_or_else(PoisonError::into_inner);
+        self.stats.record(true, start);
+        if let Some((_, write)) = self.timers {
+            metrics::record(write, start);
+        }
+        let res = update(Arc::make_mut(&mut guard));
+        self.version.fetch_add(1, Ordering::Release);
+        res
+    }
+
+    /// `commit`, but only if nothing was committed since version `base`.
+    /// `None` means the value moved on and whatever was derived from it is stale.
+    pub fn commit_at<R>(&self, base: u64, update: impl FnOnce(&mut T) -> R) -> Option<R> {
+        let start = Instant::now();
+        let mut guard = self.current.write().unwrap_or_else(PoisonError::into_inner);
+        self.stats.record(true, start);
+        if let Some((_, write)) = self.timers {
+            metrics::record(write, start);
+        }
+        if self.version.load(Ordering::Acquire) != base {
+            return None;
+        }
+        let res = update(Arc::make_mut(&mut guard));
+        self.version.fetch_add(1, Ordering::Release);
+        Some(res)
+    }
+
+    /// Number of commits so far. A reader can compare versions to detect change.
+    pub fn version(&self) -> u64 {
+        self.version.load(Ordering::Acquire)
+    }
+
+    pub fn stats(&self) -> &LockStats {
+        &self.stats
+    }
+}
@@ -0,0 +1,18 @@
+/// Median by selection (introselect via `select_nth_unstable`), O(n) on average.
+///
+/// Reorders `values` in place; callers pass a scratch copy when the order matters.
+pub fn median(values: &mut [f64]) -> Option<f64> {
+    let n = values.len();
+    if n == 0 {
+        return None;
+    }
+    let mid = n / 2;
+    let (lower, upper, _) = values.select_nth_unstable_by(mid, f64::total_cmp);
+    let upper = *upper;
+    if n % 2 == 1 {
+        return Some(upper);
+    }
+    /* Even length: the other middle value is the largest of the lower partition */
+    let lower_max = lower.iter().copied().fold(f64::NEG_INFINITY, f64::max);
+    Some(0.5 * (lower_max + upper))
+}
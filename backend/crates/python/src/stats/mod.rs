@@ -0,0 +1,137 @@
+//! Single-pass statistics over datasets of any size.
+
+pub mod median;
+pub mod moments;
+
+use std::io;
+
+use thiserror::Error;
+
+use crate::dataset::{self, Dataset, Datasets, FileFormat};
+use crate::error::BackendError;
+use crate::expr::Expr;
+
+pub use median::median;
+pub use moments::Moments;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum StatsError {
+    #[error("No values in dataset")]
+    Empty,
+    #[error("At least two values are needed")]
+    TooFew,
+}
+
+/// Below this many values splitting the work across threads costs more than it saves.
+const PARALLEL_THRESHOLD: usize = 1 << 18;
+
+fn worker_count(len: usize) -> usize {
+    let cores = std::thread::available_parallelism().map_or(1, |n| n.get());
+    cores.min(len / PARALLEL_THRESHOLD).max(1)
+}
+
+/// Moments of an in-memory slice, reduced from per-thread partials.
+pub fn moments_of(values: &[f64]) -> Moments {
+    let workers = worker_count(values.len());
+    if workers == 1 {
+        let mut m = Moments::default();
+        m.extend(values);
+        return m;
+    }
+
+    let chunk_len = values.len().div_ceil(workers);
+    std::thread::scope(|scope| {
+        let handles: Vec<_> = values
+            .chunks(chunk_len)
+            .map(|chunk| {
+                scope.spawn(move || {
+                    let mut m = Moments::default();
+                    m.extend(chunk);
+                    m
+                })
+            })
+            .collect();
+
+        let mut total = Moments::default();
+        for handle in handles {
+            total.merge(&handle.join().expect("statistics worker panicked"));
+        }
+        total
+    })
+}
+
+/// Moments of a dataset. Files are streamed in bounded chunks (binary files in
+/// parallel ranges), so the extra memory does not grow with the dataset.
+pub fn dataset_moments(ds: &Dataset) -> io::Result<Moments> {
+    let (path, format) = match ds {
+        Dataset::Memory(values) => return Ok(moments_of(values)),
+        Dataset::File { path, format } => (path, *format),
+    };
+
+    let len = ds.len_hint().unwrap_or(0);
+    let workers = if format == FileFormat::Binary { worker_count(len) } else { 1 };
+    if workers == 1 {
+        let mut m = Moments::default();
+        dataset::for_each_chunk(path, format, 0, u64::MAX, |chunk| m.extend(chunk))?;
+        return Ok(m);
+    }
+
+    let range_len = len.div_ceil(workers) as u64;
+    std::thread::scope(|scope| {
+        let handles: Vec<_> = (0..workers as u64)
+            .map(|i| {
+                scope.spawn(move || {
+                    let mut m = Moments::default();
+                    dataset::for_each_chunk(path, format, i * range_len, range_len, |chunk| {
+                        m.extend(chunk)
+                    })?;
+                    Ok::<_, io::Error>(m)
+                })
+            })
+            .collect();
+
+        let mut total = Moments::default();
+        for handle in handles {
+            total.merge(&handle.join().expect("statistics worker panicked")?);
+        }
+        Ok(total)
+    })
+}
+
+/// Median of a dataset. Selection reorders values, so this works on a copy,
+/// which for a file is the one buffer it is read into.
+pub fn dataset_median(ds: &Dataset) -> Result<f64, BackendError> {
+    let mut scratch = ds.to_vec()?;
+    Ok(median(&mut scratch).ok_or(StatsError::Empty)?)
+}
+
+/// Evaluates `mean`, `var`, `std` or `median` of a single dataset argument.
+///
+/// Returns `None` for any other expression so the engine can take it.
+pub fn evaluate_call(expr: &Expr<'_>, datasets: &Datasets) -> Option<Result<f64, BackendError>> {
+    let Expr::Call(name, args) = expr else {
+        return None;
+    };
+    let [Expr::Ident(id)] = *args else {
+        return None;
+    };
+    if !matches!(*name, "mean" | "var" | "std" | "median") {
+        return None;
+    }
+    let ds = datasets.get(*id)?;
+
+    if *name == "median" {
+        return Some(dataset_median(ds));
+    }
+    let m = match dataset_moments(ds) {
+        Ok(m) => m,
+        Err(e) => return Some(Err(e.into())),
+    };
+    let res = match *name {
+        "mean" if m.count == 0 => Err(StatsError::Empty),
+        "mean" => Ok(m.mean),
+        "var" => m.variance().ok_or(StatsError::TooFew),
+        _ => m.std_dev().ok_or(StatsError::TooFew),
+    };
+    Some(res.map_err(Into::into))
+}
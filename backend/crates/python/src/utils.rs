@@ -2,9 +2,40 @@ use pyo3::prelude::*;
 use pyo3::exceptions::PyRuntimeError;
 use std::sync::{Mutex, MutexGuard};
 
+use neocalc_core::{Context, Number};
+use neocalc_core::utils as core_utils;
+
+use crate::metrics::{self, Timer};
+
 /// Helper to lock a mutex and map poison errors to PyRuntimeError
 pub fn lock_mutex<T>(mutex: &Mutex<T>) -> PyResult<MutexGuard<'_, T>> {
     mutex
         .lock()
         .map_err(|e| PyRuntimeError::new_err(format!("Lock poisoned: {}", e)))
 }
+
+/// `neocalc_core::utils::format_number`, timed as `format` in the metrics.
+pub fn format_number(value: Number) -> String {
+    let _span = metrics::span(Timer::Format);
+    core_utils::format_number(value)
+}
+
+/// Resolves a variable the way the engine does: innermost scope first.
+pub fn lookup_variable<'c>(context: &'c Context, name: &str) -> Option<&'c Number> {
+    context
+        .scopes
+        .iter()
+        .rev()
+        .find_map(|scope| scope.get(name))
+        .map(|v| &**v)
+}
+
+/// Binds a variable in the innermost scope that already has it, or the current one.
+pub fn assign_variable(context: &mut Context, name: &str, value: impl Into<std::sync::Arc<Number>>) {
+    let value = value.into();
+    if let Some(scope) = context.scopes.iter_mut().rev().find(|s| s.contains_key(name)) {
+        scope.insert(name.to_string(), value);
+    } else if let Some(scope) = context.scopes.last_mut() {
+        scope.insert(name.to_string(), value);
+    }
+}
@@ -0,0 +1,124 @@
+use std::sync::Arc;
+
+use super::symbols::Symbol;
+use super::UserFunction;
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum MathFn {
+    Sin,
+    Cos,
+    Tan,
+    Asin,
+    Acos,
+    Atan,
+    Sinh,
+    Cosh,
+    Tanh,
+    Sqrt,
+    Abs,
+    Ln,
+    Log,
+    Exp,
+    Floor,
+    Ceil,
+    Round,
+    Factorial,
+}
+
+impl MathFn {
+    pub fn from_name(name: &str) -> Option<Self> {
+        Some(match name {
+            "sin" => MathFn::Sin,
+            "cos" => MathFn::Cos,
+            "tan" => MathFn::Tan,
+            "asin" => MathFn::Asin,
+            "acos" => MathFn::Acos,
+            "atan" => MathFn::Atan,
+            "sinh" => MathFn::Sinh,
+            "cosh" => MathFn::Cosh,
+            "tanh" => MathFn::Tanh,
+            "sqrt" => MathFn::Sqrt,
+            "abs" => MathFn::Abs,
+            "ln" => MathFn::Ln,
+            "log" => MathFn::Log,
+            "exp" => MathFn::Exp,
+            "floor" => MathFn::Floor,
+            "ceil" => MathFn::Ceil,
+            "round" => MathFn::Round,
+            _ => return None,
+        })
+    }
+
+    #[inline]
+    pub fn apply(self, x: f64) -> f64 {
+        match self {
+            MathFn::Sin => x.sin(),
+            MathFn::Cos => x.cos(),
+            MathFn::Tan => x.tan(),
+            MathFn::Asin => x.asin(),
+            MathFn::Acos => x.acos(),
+            MathFn::Atan => x.atan(),
+            MathFn::Sinh => x.sinh(),
+            MathFn::Cosh => x.cosh(),
+            MathFn::Tanh => x.tanh(),
+            MathFn::Sqrt => x.sqrt(),
+            MathFn::Abs => x.abs(),
+            MathFn::Ln => x.ln(),
+            MathFn::Log => x.log10(),
+            MathFn::Exp => x.exp(),
+            MathFn::Floor => x.floor(),
+            MathFn::Ceil => x.ceil(),
+            MathFn::Round => x.round(),
+            MathFn::Factorial => factorial(x),
+        }
+    }
+}
+
+/// `x!` for whole numbers, NaN otherwise. Infinite past 170!, like `f64`.
+fn factorial(x: f64) -> f64 {
+    if x < 0.0 || x.fract() != 0.0 {
+        return f64::NAN;
+    }
+    if x > 170.0 {
+        return f64::INFINITY;
+    }
+    (2..=x as u32).fold(1.0, |acc, i| acc * f64::from(i))
+}
+
+/// One stack machine instruction. Operands are popped and the result pushed.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum Op {
+    Const(f64),
+    /// Push the n-th argument of the running function.
+    Arg(u8),
+    /// Push a free variable, by index into [`Program::names`].
+    Var(u16),
+    Neg,
+    Add,
+    Sub,
+    Mul,
+    Div,
+    Rem,
+    Pow,
+    Math(MathFn),
+    /// Push a local slot holding an already computed subexpression.
+    Load(u16),
+    /// Copy the top of the stack into a local slot, leaving it in place.
+    Tee(u16),
+    /// Call a user function (index into [`Program::callees`]) with `n` arguments.
+    Call(u16, u8),
+}
+
+/// Compiled code for one expression or function body.
+#[derive(Debug, Clone, Default)]
+pub struct Program {
+    pub code: Vec<Op>,
+    /// Free variables, resolved against the context when executed.
+    pub names: Vec<Symbol>,
+    /// User functions this program calls, linked when it was compiled.
+    pub callees: Vec<Arc<UserFunction>>,
+    /// Local slots for hoisted common subexpressions.
+    pub locals: usize,
+    /// Largest frame the code needs (locals plus operands), excluding arguments.
+    pub max_stack: usize,
+}
@@ -0,0 +1,278 @@
+use std::sync::Arc;
+
+use super::bytecode::{MathFn, Op, Program};
+use super::optimize::{self, Report};
+use super::symbols::Symbol;
+use super::{FunctionError, FunctionTable, UserFunction};
+use crate::expr::{BinaryOp, Expr, UnaryOp};
+
+/// Literal text to `f64`, including the `0x`/`0b`/`0o` integer forms.
+pub fn parse_number(text: &str) -> Option<f64> {
+    let radix = match text.get(..2) {
+        Some("0x") | Some("0X") => 16,
+        Some("0b") | Some("0B") => 2,
+        Some("0o") | Some("0O") => 8,
+        _ => return text.parse().ok(),
+    };
+    u128::from_str_radix(&text[2..], radix).ok().map(|v| v as f64)
+}
+
+/// Expression tree with names resolved, between parsing and code generation.
+/// This is the form the optimizer rewrites.
+#[derive(Debug, Clone)]
+pub enum Node {
+    Const(f64),
+    Arg(u8),
+    Var(Symbol),
+    Neg(Box<Node>),
+    Binary(BinaryOp, Box<Node>, Box<Node>),
+    Math(MathFn, Box<Node>),
+    Call(Arc<UserFunction>, Vec<Node>),
+}
+
+impl Node {
+    /// Structural key, also readable enough to show in optimization reports.
+    /// Nodes that compute different things never share a key: user calls are
+    /// written `@name(...)`, apart from built-ins such as `factorial(...)`, and
+    /// non-finite constants `#inf`, apart from a variable named `inf`.
+    pub fn key(&self) -> String {
+        let mut out = String::new();
+        self.write_key(&mut out);
+        out
+    }
+
+    fn write_key(&self, out: &mut String) {
+        match self {
+            Node::Const(v) if v.is_finite() => out.push_str(&v.to_string()),
+            Node::Const(v) => out.push_str(&format!("#{}", v)),
+            Node::Arg(i) => out.push_str(&format!("${}", i)),
+            Node::Var(name) => out.push_str(&name.name()),
+            Node::Neg(inner) => {
+                out.push('-');
+                inner.write_key(out);
+            }
+            Node::Binary(op, lhs, rhs) => {
+                out.push('(');
+                lhs.write_key(out);
+                out.push(match op {
+                    BinaryOp::Add => '+',
+                    BinaryOp::Sub => '-',
+                    BinaryOp::Mul => '*',
+                    BinaryOp::Div => '/',
+                    BinaryOp::Rem => '%',
+                    BinaryOp::Pow => '^',
+                });
+                rhs.write_key(out);
+                out.push(')');
+            }
+            Node::Math(f, arg) => {
+                out.push_str(&format!("{:?}(", f).to_lowercase());
+                arg.write_key(out);
+                out.push(')');
+            }
+            Node::Call(function, args) => {
+                out.push('@');
+                out.push_str(&function.name);
+                out.push('(');
+                for (i, arg) in args.iter().enumerate() {
+                    if i > 0 {
+                        out.push_str(", ");
+                    }
+                    arg.write_key(out);
+                }
+                out.push(')');
+            }
+        }
+    }
+
+    pub fn is_leaf(&self) -> bool {
+        matches!(self, Node::Const(_) | Node::Arg(_) | Node::Var(_))
+    }
+}
+
+fn check_arity(name: &str, expected: usize, found: usize) -> Result<(), FunctionError> {
+    if expected != found {
+        return Err(FunctionError::Arity { name: name.to_string(), expected, found });
+    }
+    Ok(())
+}
+
+/// Resolves parameters, constants and function names of a parsed expression.
+pub fn lower(
+    expr: &Expr<'_>,
+    params: &[String],
+    functions: &FunctionTable,
+) -> Result<Node, FunctionError> {
+    let lower = |e: &Expr<'_>| lower(e, params, functions);
+    Ok(match expr {
+        Expr::Number(text) => Node::Const(
+            parse_number(text).ok_or_else(|| FunctionError::InvalidNumber(text.to_string()))?,
+        ),
+        Expr::Ident(name) => match params.iter().position(|p| p == name) {
+            Some(i) => Node::Arg(i as u8),
+            None if *name == "pi" => Node::Const(std::f64::consts::PI),
+            None if *name == "e" => Node::Const(std::f64::consts::E),
+            None => Node::Var(Symbol::intern(name)),
+        },
+        Expr::Unary(UnaryOp::Neg, inner) => Node::Neg(Box::new(lower(inner)?)),
+        Expr::Unary(UnaryOp::Factorial, inner) => Node::Math(MathFn::Factorial, Box::new(lower(inner)?)),
+        Expr::Binary(op, lhs, rhs) => Node::Binary(*op, Box::new(lower(lhs)?), Box::new(lower(rhs)?)),
+        Expr::Call(name, args) => {
+            /* The built-in factorial is not reserved: a user function of that name wins */
+            let math = match MathFn::from_name(name) {
+                None if *name == "factorial" && functions.get(name).is_none() => Some(MathFn::Factorial),
+                math => math,
+            };
+            if let Some(math) = math {
+                check_arity(name, 1, args.len())?;
+                return Ok(Node::Math(math, Box::new(lower(&args[0])?)));
+            }
+            let function = functions
+                .get(name)
+                .ok_or_else(|| FunctionError::UnknownFunction(name.to_string()))?
+                .clone();
+            check_arity(name, function.params.len(), args.len())?;
+            let args = args.iter().map(lower).collect::<Result<Vec<_>, _>>()?;
+            Node::Call(function, args)
+        }
+        Expr::List(_) => return Err(FunctionError::Matrix),
+    })
+}
+
+struct Emitter<'a> {
+    program: Program,
+    depth: usize,
+    /* Subtrees computed once into a local slot, and the slot once assigned */
+    shared: &'a [String],
+    slots: Vec<Option<u16>>,
+}
+
+impl Emitter<'_> {
+    fn emit(&mut self, op: Op) {
+        match op {
+            Op::Const(_) | Op::Arg(_) | Op::Var(_) | Op::Load(_) => self.depth += 1,
+            Op::Add | Op::Sub | Op::Mul | Op::Div | Op::Rem | Op::Pow => self.depth -= 1,
+            Op::Call(_, argc) => self.depth = self.depth + 1 - argc as usize,
+            Op::Neg | Op::Math(_) | Op::Tee(_) => {}
+        }
+        self.program.max_stack = self.program.max_stack.max(self.depth);
+        self.program.code.push(op);
+    }
+
+    fn variable(&mut self, name: Symbol) -> u16 {
+        if let Some(i) = self.program.names.iter().position(|n| *n == name) {
+            return i as u16;
+        }
+        self.program.names.push(name);
+        (self.program.names.len() - 1) as u16
+    }
+
+    fn callee(&mut self, function: &Arc<UserFunction>) -> u16 {
+        if let Some(i) = self.program.callees.iter().position(|f| Arc::ptr_eq(f, function)) {
+            return i as u16;
+        }
+        self.program.callees.push(function.clone());
+        (self.program.callees.len() - 1) as u16
+    }
+
+    fn node(&mut self, node: &Node) {
+        let shared = match self.shared.is_empty() || node.is_leaf() {
+            true => None,
+            false => self.shared.iter().position(|k| *k == node.key()),
+        };
+        if let Some(i) = shared {
+            if let Some(slot) = self.slots[i] {
+                self.emit(Op::Load(slot));
+                return;
+            }
+        }
+
+        match node {
+            Node::Const(v) => self.emit(Op::Const(*v)),
+            Node::Arg(i) => self.emit(Op::Arg(*i)),
+            Node::Var(name) => {
+                let index = self.variable(name.clone());
+                self.emit(Op::Var(index));
+            }
+            Node::Neg(inner) => {
+                self.node(inner);
+                self.emit(Op::Neg);
+            }
+            Node::Binary(op, lhs, rhs) => {
+                self.node(lhs);
+                self.node(rhs);
+                self.emit(match op {
+                    BinaryOp::Add => Op::Add,
+                    BinaryOp::Sub => Op::Sub,
+                    BinaryOp::Mul => Op::Mul,
+                    BinaryOp::Div => Op::Div,
+                    BinaryOp::Rem => Op::Rem,
+                    BinaryOp::Pow => Op::Pow,
+                });
+            }
+            Node::Math(f, arg) => {
+                self.node(arg);
+                self.emit(Op::Math(*f));
+            }
+            Node::Call(function, args) => {
+                for arg in args {
+                    self.node(arg);
+                }
+                /* The callee's frame sits on top of its arguments */
+                self.program.max_stack =
+                    self.program.max_stack.max(self.depth + function.program.max_stack);
+                let index = self.callee(function);
+                self.emit(Op::Call(index, args.len() as u8));
+            }
+        }
+
+        if let Some(i) = shared {
+            let slot = self.program.locals as u16;
+            self.program.locals += 1;
+            self.slots[i] = Some(slot);
+            self.emit(Op::Tee(slot));
+        }
+    }
+}
+
+/// Generates code for `node`. Subtrees listed in `shared` are evaluated once,
+/// kept in a local slot and reloaded wherever they appear again.
+pub fn emit(node: &Node, shared: &[String]) -> Program {
+    let mut emitter = Emitter { program: Program::default(), depth: 0, shared, slots: vec![None; shared.len()] };
+    emitter.node(node);
+    let mut program = emitter.program;
+    program.max_stack += program.locals;
+    program
+}
+
+/// Compiles `expr` once into optimized bytecode. `params` become argument slots;
+/// any other name is a free variable looked up in the context when the program runs.
+pub fn compile(
+    expr: &Expr<'_>,
+    params: &[String],
+    functions: &FunctionTable,
+) -> Result<Program, FunctionError> {
+    Ok(compile_with_report(expr, params, functions)?.0)
+}
+
+/// Like [`compile`], also describing what the optimizer removed. With optimization
+/// turned off on the table the tree is emitted as written.
+pub fn compile_with_report(
+    expr: &Expr<'_>,
+    params: &[String],
+    functions: &FunctionTable,
+) -> Result<(Program, Report), FunctionError> {
+    let node = lower(expr, params, functions)?;
+    let plain = emit(&node, &[]);
+    let ops_before = plain.code.len();
+    if !functions.optimizing() {
+        return Ok((plain, Report { ops_before, ops_after: ops_before, ..Report::default() }));
+    }
+
+    let mut report = Report { ops_before, ..Report::default() };
+    let node = optimize::simplify(node, &mut report);
+    report.hoisted = optimize::common_subexpressions(&node);
+    let program = emit(&node, &report.hoisted);
+    report.ops_after = program.code.len();
+    Ok((program, report))
+}
@@ -0,0 +1,126 @@
+use neocalc_core::{Context, Number};
+use num::ToPrimitive;
+
+use super::bytecode::{Op, Program};
+use super::symbols::Symbol;
+use super::FunctionError;
+use crate::utils::lookup_variable;
+
+/// Variable values already looked up in the context, one slot per entry of
+/// `program.names`, plus the same for each of its callees once they are called.
+#[derive(Debug)]
+struct Slots {
+    values: Vec<Option<f64>>,
+    callees: Vec<Option<Slots>>,
+}
+
+impl Slots {
+    fn new(program: &Program) -> Self {
+        Slots { values: vec![None; program.names.len()], callees: program.callees.iter().map(|_| None).collect() }
+    }
+
+    #[inline]
+    fn get(&mut self, program: &Program, i: usize, context: &Context) -> Result<f64, FunctionError> {
+        if let Some(value) = self.values[i] {
+            return Ok(value);
+        }
+        let value = resolve(&program.names[i], context)?;
+        self.values[i] = Some(value);
+        Ok(value)
+    }
+}
+
+/// The slow path: a walk over the scopes, hashing the name.
+fn resolve(symbol: &Symbol, context: &Context) -> Result<f64, FunctionError> {
+    let name = symbol.name();
+    match lookup_variable(context, &name) {
+        Some(Number::Float(f)) => Ok(*f),
+        Some(Number::Integer(i)) => Ok(i.to_f64().unwrap_or(f64::NAN)),
+        None => Err(FunctionError::UnknownVariable(name.to_string())),
+    }
+}
+
+#[inline]
+fn binary(stack: &mut Vec<f64>, f: impl Fn(f64, f64) -> f64) {
+    let b = stack.pop().expect("stack underflow");
+    let a = stack.last_mut().expect("stack underflow");
+    *a = f(*a, b);
+}
+
+/// Runs `program` with its arguments already on the stack at `base..`.
+/// Locals follow the arguments. Nested user calls reuse the same stack, so a
+/// call allocates nothing.
+fn exec(
+    program: &Program,
+    base: usize,
+    stack: &mut Vec<f64>,
+    slots: &mut Slots,
+    context: &Context,
+) -> Result<f64, FunctionError> {
+    let locals = stack.len();
+    stack.resize(locals + program.locals, 0.0);
+    for op in &program.code {
+        match *op {
+            Op::Const(v) => stack.push(v),
+            Op::Arg(i) => stack.push(stack[base + i as usize]),
+            Op::Var(i) => stack.push(slots.get(program, i as usize, context)?),
+            Op::Load(i) => stack.push(stack[locals + i as usize]),
+            Op::Tee(i) => stack[locals + i as usize] = *stack.last().expect("stack underflow"),
+            Op::Neg => {
+                let top = stack.last_mut().expect("stack underflow");
+                *top = -*top;
+            }
+            Op::Add => binary(stack, |a, b| a + b),
+            Op::Sub => binary(stack, |a, b| a - b),
+            Op::Mul => binary(stack, |a, b| a * b),
+            Op::Div => binary(stack, |a, b| a / b),
+            Op::Rem => binary(stack, |a, b| a % b),
+            Op::Pow => binary(stack, f64::powf),
+            Op::Math(f) => {
+                let top = stack.last_mut().expect("stack underflow");
+                *top = f.apply(*top);
+            }
+            Op::Call(index, argc) => {
+                let callee = &program.callees[index as usize].program;
+                let frame = stack.len() - argc as usize;
+                let inner = slots.callees[index as usize].get_or_insert_with(|| Slots::new(callee));
+                let result = exec(callee, frame, stack, inner, context)?;
+                stack.truncate(frame);
+                stack.push(result);
+            }
+        }
+    }
+    Ok(stack.pop().expect("stack underflow"))
+}
+
+/// A reusable operand stack, so repeated calls (tables, sums, solvers) never
+/// allocate. A machine borrows the context it runs against, so it cannot
+/// change underneath: each variable is looked up once per program and then
+/// read from its slot, and runs never hash a name again.
+#[derive(Debug)]
+pub struct Machine<'a> {
+    context: &'a Context,
+    stack: Vec<f64>,
+    /* Slots of every program run so far; rarely more than a few */
+    programs: Vec<(&'a Program, Slots)>,
+}
+
+impl<'a> Machine<'a> {
+    pub fn new(context: &'a Context) -> Self {
+        Machine { context, stack: Vec::new(), programs: Vec::new() }
+    }
+
+    pub fn run(&mut self, program: &'a Program, args: &[f64]) -> Result<f64, FunctionError> {
+        let slots = match self.programs.iter().position(|(p, _)| std::ptr::eq(*p, program)) {
+            Some(i) => &mut self.programs[i].1,
+            None => {
+                self.programs.push((program, Slots::new(program)));
+                &mut self.programs.last_mut().expect("just pushed").1
+            }
+        };
+        self.stack.clear();
+        self.stack.reserve(program.max_stack + args.len());
+        self.stack.extend_from_slice(args);
+        exec(program, 0, &mut self.stack, slots, self.context)
+    }
+}
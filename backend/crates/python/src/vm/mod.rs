@@ -0,0 +1,554 @@
+//! User-defined functions, compiled once to bytecode and run on a small stack VM.
+//!
+//! `f(x) = x^2 + 3x` is parsed and compiled when it is defined. Calls from
+//! expressions, tables or solvers only execute the stored bytecode.
+
+pub mod bytecode;
+pub mod compiler;
+pub mod machine;
+pub mod optimize;
+pub mod symbols;
+
+use std::collections::{HashMap, HashSet};
+use std::sync::Arc;
+
+use thiserror::Error;
+
+use crate::expr::{self, Arena, Expr, ParseError, UnaryOp};
+use crate::linalg;
+use crate::metrics::{self, Counter};
+
+use bytecode::MathFn;
+
+pub use bytecode::Program;
+pub use compiler::{compile, compile_with_report};
+pub use machine::Machine;
+pub use optimize::Report;
+pub use symbols::Symbol;
+
+/// Arguments are addressed with a `u8` slot.
+const MAX_PARAMS: usize = u8::MAX as usize;
+
+/// Compiled expressions kept per table before the cache starts over.
+const CACHE_CAPACITY: usize = 256;
+
+#[derive(Debug, Clone, PartialEq, Error)]
+pub enum FunctionError {
+    #[error("Unknown function: {0}")]
+    UnknownFunction(String),
+    #[error("Unknown variable: {0}")]
+    UnknownVariable(String),
+    #[error("{name} expects {expected} argument(s), got {found}")]
+    Arity { name: String, expected: usize, found: usize },
+    #[error("Invalid number: {0}")]
+    InvalidNumber(String),
+    #[error("{0} cannot call itself")]
+    Recursive(String),
+    #[error("{0} is a built-in function")]
+    Reserved(String),
+    #[error("{name} is still used by {user}")]
+    InUse { name: String, user: String },
+    #[error("{user} would stop working: {error}")]
+    Breaks { user: String, error: Box<FunctionError> },
+    #[error("Functions cannot contain matrices")]
+    Matrix,
+    #[error("Invalid parameter list: {0}")]
+    InvalidParameters(String),
+    #[error(transparent)]
+    Parse(#[from] ParseError),
+}
+
+/// A compiled user function together with its source.
+#[derive(Debug)]
+pub struct UserFunction {
+    pub name: String,
+    pub params: Vec<String>,
+    pub body: String,
+    pub program: Program,
+}
+
+impl UserFunction {
+    pub fn signature(&self) -> String {
+        format!("{}({})", self.name, self.params.join(", "))
+    }
+
+    /// True if this function reaches `target` through any chain of calls.
+    fn depends_on(&self, target: &str) -> bool {
+        self.program
+            .callees
+            .iter()
+            .any(|f| f.name == target || f.depends_on(target))
+    }
+}
+
+/// An expression cut around its outermost calls of user functions: `parts`
+/// has one more entry than `calls`, and the text is `parts[0]`, the value of
+/// `calls[0]`, `parts[1]`, and so on.
+#[derive(Debug, Clone, Default)]
+pub struct Split {
+    pub parts: Vec<String>,
+    pub calls: Vec<Arc<Program>>,
+}
+
+impl Split {
+    /// True if the whole expression is one call.
+    pub fn is_single_call(&self) -> bool {
+        self.calls.len() == 1 && self.parts.iter().all(String::is_empty)
+    }
+
+    fn push(&mut self, text: &str) {
+        self.parts.last_mut().expect("never empty").push_str(text);
+    }
+
+    /// The text with `values` in place of the calls.
+    pub fn join(&self, values: &[f64]) -> String {
+        let mut out = self.parts[0].clone();
+        for (value, part) in values.iter().zip(&self.parts[1..]) {
+            /* Parenthesized so a negative value binds as one operand */
+            if *value < 0.0 {
+                out.push_str(&format!("({})", value));
+            } else {
+                out.push_str(&value.to_string());
+            }
+            out.push_str(part);
+        }
+        out
+    }
+}
+
+/// `name(a, b) = body`, as typed by the user.
+#[derive(Debug, Clone, PartialEq)]
+pub struct Definition<'a> {
+    pub name: &'a str,
+    pub params: Vec<&'a str>,
+    pub body: &'a str,
+}
+
+impl<'a> Definition<'a> {
+    /// Recognises a function definition. Anything else, including plain variable
+    /// assignments such as `x = 5`, returns `None` and is left to the engine.
+    pub fn parse(input: &'a str) -> Option<Self> {
+        let (head, body) = input.split_once('=')?;
+        /* `f(x) == 3` compares */
+        if body.starts_with('=') {
+            return None;
+        }
+        let (name, params) = expr::signature(head)?;
+        Some(Definition { name, params, body: body.trim() })
+    }
+}
+
+/// All user functions of a calculator, in definition order except that every
+/// function comes after the ones it calls, plus the compiled form of
+/// expressions that call them.
+#[derive(Debug, Clone)]
+pub struct FunctionTable {
+    functions: HashMap<String, Arc<UserFunction>>,
+    order: Vec<String>,
+    optimize: bool,
+    /* Expression text to optimized code, dropped whenever a function changes */
+    cache: HashMap<String, Arc<Program>>,
+}
+
+impl Default for FunctionTable {
+    fn default() -> Self {
+        FunctionTable { functions: HashMap::new(), order: Vec::new(), optimize: true, cache: HashMap::new() }
+    }
+}
+
+impl FunctionTable {
+    pub fn optimizing(&self) -> bool {
+        self.optimize
+    }
+
+    /// Turns the optimizer on or off and recompiles every function accordingly.
+    /// Nothing changes if any of them fails to recompile.
+    pub fn set_optimize(&mut self, enabled: bool) -> Result<(), FunctionError> {
+        if self.optimize == enabled {
+            return Ok(());
+        }
+        let mut next = self.clone();
+        next.optimize = enabled;
+        next.cache.clear();
+        next.rebuild(|_| true)?;
+        *self = next;
+        Ok(())
+    }
+
+    /// Compiled code for `text`, compiling and caching it on first use.
+    /// Returns `None` if the expression does not call a user function.
+    pub fn program_for(&mut self, text: &str) -> Option<Result<Arc<Program>, FunctionError>> {
+        if let Some(program) = self.cache.get(text) {
+            metrics::count(Counter::ProgramCacheHit, 1);
+            return Some(Ok(program.clone()));
+        }
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, text).ok()?;
+        if !self.is_used_by(&parsed) {
+            return None;
+        }
+        metrics::count(Counter::ProgramCacheMiss, 1);
+        let program = match compile(&parsed, &[], self) {
+            Ok(program) => Arc::new(program),
+            Err(e) => return Some(Err(e)),
+        };
+        if self.cache.len() >= CACHE_CAPACITY {
+            self.cache.clear();
+        }
+        self.cache.insert(text.to_string(), program.clone());
+        Some(Ok(program))
+    }
+
+    /// Cuts `text` around its outermost calls of user functions, compiling each
+    /// call. Returns `None` if it calls none.
+    pub fn split_calls(&mut self, text: &str) -> Option<Result<Split, FunctionError>> {
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, text).ok()?;
+        if !self.is_used_by(&parsed) {
+            return None;
+        }
+        let mut split = Split { parts: vec![String::new()], calls: Vec::new() };
+        Some(self.split_into(&parsed, &mut split).map(|_| split))
+    }
+
+    fn split_into(&mut self, expr: &Expr<'_>, split: &mut Split) -> Result<(), FunctionError> {
+        /* Everything but the calls is written as `Expr`'s Display writes it */
+        match expr {
+            Expr::Call(name, _) if self.functions.contains_key(*name) => {
+                let program = self.program_for(&expr.to_string()).expect("calls a user function")?;
+                split.calls.push(program);
+                split.parts.push(String::new());
+            }
+            Expr::Number(text) | Expr::Ident(text) => split.push(text),
+            Expr::Unary(UnaryOp::Neg, inner) => {
+                split.push("(-");
+                self.split_into(inner, split)?;
+                split.push(")");
+            }
+            Expr::Unary(UnaryOp::Factorial, inner) => {
+                split.push("(");
+                self.split_into(inner, split)?;
+                split.push(")!");
+            }
+            Expr::Binary(op, lhs, rhs) => {
+                split.push("(");
+                self.split_into(lhs, split)?;
+                split.push(&format!(" {} ", op.symbol()));
+                self.split_into(rhs, split)?;
+                split.push(")");
+            }
+            Expr::Call(name, args) => {
+                split.push(name);
+                split.push("(");
+                self.split_items(args, split)?;
+                split.push(")");
+            }
+            Expr::List(items) => {
+                split.push("[");
+                self.split_items(items, split)?;
+                split.push("]");
+            }
+        }
+        Ok(())
+    }
+
+    fn split_items(&mut self, items: &[Expr<'_>], split: &mut Split) -> Result<(), FunctionError> {
+        for (i, item) in items.iter().enumerate() {
+            if i > 0 {
+                split.push(", ");
+            }
+            self.split_into(item, split)?;
+        }
+        Ok(())
+    }
+
+    pub fn get(&self, name: &str) -> Option<&Arc<UserFunction>> {
+        self.functions.get(name)
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.functions.is_empty()
+    }
+
+    pub fn iter(&self) -> impl Iterator<Item = &Arc<UserFunction>> {
+        self.order.iter().filter_map(|name| self.functions.get(name))
+    }
+
+    fn build(&self, name: &str, params: Vec<String>, body: &str) -> Result<UserFunction, FunctionError> {
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, body)?;
+        let program = compile(&parsed, &params, self)?;
+        Ok(UserFunction { name: name.to_string(), params, body: body.to_string(), program })
+    }
+
+    /// Compiles and stores a definition, replacing any previous one with that name.
+    /// Functions that call it are recompiled; if one of them no longer compiles
+    /// (say the parameter count changed), nothing is stored.
+    pub fn define(&mut self, def: &Definition<'_>) -> Result<Arc<UserFunction>, FunctionError> {
+        /* Matrix functions are tried before user functions, so they are reserved too */
+        if MathFn::from_name(def.name).is_some() || linalg::FUNCTIONS.contains(&def.name) {
+            return Err(FunctionError::Reserved(def.name.to_string()));
+        }
+        if def.params.len() > MAX_PARAMS {
+            return Err(FunctionError::InvalidParameters(format!("more than {} parameters", MAX_PARAMS)));
+        }
+        for (i, p) in def.params.iter().enumerate() {
+            if def.params[..i].contains(p) {
+                return Err(FunctionError::InvalidParameters(format!("{} is repeated", p)));
+            }
+        }
+
+        let params = def.params.iter().map(|p| p.to_string()).collect();
+        let function = self.build(def.name, params, def.body)?;
+        if function.program.callees.iter().any(|f| f.name == def.name || f.depends_on(def.name)) {
+            return Err(FunctionError::Recursive(def.name.to_string()));
+        }
+
+        /* Built on a copy, so a caller that breaks leaves the table as it was */
+        let function = Arc::new(function);
+        let mut next = self.clone();
+        if !next.functions.contains_key(def.name) {
+            next.order.push(def.name.to_string());
+        }
+        next.functions.insert(def.name.to_string(), function.clone());
+        next.cache.clear();
+        /* A redefinition may call functions defined after it */
+        next.sort_order();
+        next.rebuild(|f| f.name != def.name && f.depends_on(def.name))?;
+        *self = next;
+        Ok(function)
+    }
+
+    /// Reorders `order` so every function comes after the ones it calls, and
+    /// otherwise keeps definition order. There are no cycles: recursion is rejected.
+    fn sort_order(&mut self) {
+        fn visit(table: &FunctionTable, name: &str, seen: &mut HashSet<String>, sorted: &mut Vec<String>) {
+            let Some(function) = table.functions.get(name) else {
+                return;
+            };
+            if !seen.insert(name.to_string()) {
+                return;
+            }
+            for callee in &function.program.callees {
+                visit(table, &callee.name, seen, sorted);
+            }
+            sorted.push(name.to_string());
+        }
+        let mut seen = HashSet::new();
+        let mut sorted = Vec::with_capacity(self.order.len());
+        for name in &self.order {
+            visit(self, name, &mut seen, &mut sorted);
+        }
+        self.order = sorted;
+    }
+
+    /// Recompiles the functions `selected` picks, callees first, so each links
+    /// the already rebuilt versions of the ones it calls.
+    fn rebuild(&mut self, selected: impl Fn(&UserFunction) -> bool) -> Result<(), FunctionError> {
+        for name in self.order.clone() {
+            let current = self.functions[&name].clone();
+            if !selected(&current) {
+                continue;
+            }
+            let rebuilt = self
+                .build(&name, current.params.clone(), &current.body)
+                .map_err(|e| FunctionError::Breaks { user: current.signature(), error: Box::new(e) })?;
+            self.functions.insert(name, Arc::new(rebuilt));
+        }
+        Ok(())
+    }
+
+    /// Removes a function unless another one still calls it.
+    pub fn remove(&mut self, name: &str) -> Result<bool, FunctionError> {
+        if let Some(user) = self.iter().find(|f| f.name != name && f.depends_on(name)) {
+            return Err(FunctionError::InUse { name: name.to_string(), user: user.name.clone() });
+        }
+        self.order.retain(|n| n != name);
+        self.cache.clear();
+        Ok(self.functions.remove(name).is_some())
+    }
+
+    /// Every variable `expr` reads, including globals read inside the user
+    /// functions it calls, in first-use order.
+    pub fn free_variables(&self, expr: &Expr<'_>) -> Vec<String> {
+        let mut reads = Vec::new();
+        self.collect_reads(expr, &mut reads);
+        reads
+    }
+
+    fn collect_reads(&self, expr: &Expr<'_>, reads: &mut Vec<String>) {
+        let mut push = |name: &str| {
+            if !reads.iter().any(|r| r == name) {
+                reads.push(name.to_string());
+            }
+        };
+        match expr {
+            Expr::Ident(name) if *name != "pi" && *name != "e" => push(name),
+            Expr::Number(_) | Expr::Ident(_) => {}
+            Expr::Unary(_, inner) => self.collect_reads(inner, reads),
+            Expr::Binary(_, lhs, rhs) => {
+                self.collect_reads(lhs, reads);
+                self.collect_reads(rhs, reads);
+            }
+            Expr::Call(name, args) => {
+                if let Some(function) = self.functions.get(*name) {
+                    let mut pending = vec![function.clone()];
+                    while let Some(f) = pending.pop() {
+                        f.program.names.iter().for_each(|n| push(&n.name()));
+                        pending.extend(f.program.callees.iter().cloned());
+                    }
+                }
+                for arg in *args {
+                    self.collect_reads(arg, reads);
+                }
+            }
+            Expr::List(items) => {
+                for item in *items {
+                    self.collect_reads(item, reads);
+                }
+            }
+        }
+    }
+
+    /// True if `expr` calls any function defined here.
+    pub fn is_used_by(&self, expr: &Expr<'_>) -> bool {
+        match expr {
+            Expr::Call(name, args) => {
+                self.functions.contains_key(*name) || args.iter().any(|a| self.is_used_by(a))
+            }
+            Expr::Unary(_, inner) => self.is_used_by(inner),
+            Expr::Binary(_, lhs, rhs) => self.is_used_by(lhs) || self.is_used_by(rhs),
+            Expr::List(items) => items.iter().any(|i| self.is_used_by(i)),
+            Expr::Number(_) | Expr::Ident(_) => false,
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use neocalc_core::{Context, Number};
+
+    use super::*;
+
+    fn table(definitions: &[&str], optimize: bool) -> FunctionTable {
+        let mut table = FunctionTable::default();
+        table.set_optimize(optimize).unwrap();
+        for text in definitions {
+            table.define(&Definition::parse(text).unwrap()).unwrap();
+        }
+        table
+    }
+
+    fn context(values: &[(&str, f64)]) -> Context {
+        let mut context = Context::new();
+        for (name, value) in values {
+            context.scopes[0].insert(name.to_string(), Arc::new(Number::Float(*value)));
+        }
+        context
+    }
+
+    fn run(table: &mut FunctionTable, text: &str, context: &Context) -> f64 {
+        let program = table.program_for(text).expect("calls a user function").unwrap();
+        Machine::new(context).run(&program, &[]).unwrap()
+    }
+
+    #[test]
+    fn optimized_code_computes_the_same_values() {
+        let definitions = [
+            "f(x) = x^2 + 3x",
+            "g(x, y) = f(x) * y + k*1 - 0",
+            "s(x) = sin(x)^2 + sin(x)*cos(x) + 2*pi/360 + x^1 - --x",
+            "factorial(x) = x + 1",
+            "h(x) = x! + factorial(x) + factorial(x)*0 + x!/1",
+        ];
+        let expressions = [
+            "g(2, 3) + f(x) + f(x)",
+            "s(x) * s(x) - s(0.5)",
+            "h(x) + h(y)",
+            "factorial(x) - x!",
+            "g(x, y)^0 + f(1/0*0)",
+        ];
+        let mut optimized = table(&definitions, true);
+        let mut plain = table(&definitions, false);
+        for point in [[1.0, -2.0], [5.0, 0.5], [0.0, f64::INFINITY]] {
+            let context = context(&[("x", point[0]), ("y", point[1]), ("k", 7.0)]);
+            for text in expressions {
+                let (a, b) = (run(&mut optimized, text, &context), run(&mut plain, text, &context));
+                assert!(a.to_bits() == b.to_bits() || a.is_nan() && b.is_nan(), "{text} at {point:?}: {a} != {b}");
+            }
+        }
+    }
+
+    #[test]
+    fn user_calls_are_not_merged_with_built_ins() {
+        let mut table = table(&["factorial(x) = x + 1"], true);
+        assert_eq!(run(&mut table, "x! + factorial(x)", &context(&[("x", 5.0)])), 126.0);
+
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, "x! * factorial(x) + x! + factorial(x)").unwrap();
+        let (_, report) = compile_with_report(&parsed, &[], &table).unwrap();
+        assert_eq!(report.hoisted, vec!["factorial(x)".to_string(), "@factorial(x)".to_string()]);
+    }
+
+    #[test]
+    fn report_counts_what_was_removed() {
+        let table = table(&[], true);
+        let arena = Arena::new();
+        let parsed = expr::parse(&arena, "sin(x)^2 + sin(x)*cos(x) + 2*pi/360 + x*1").unwrap();
+        let (program, report) = compile_with_report(&parsed, &[], &table).unwrap();
+        assert_eq!(report.hoisted, vec!["sin(x)".to_string()]);
+        assert_eq!(report.simplified, 1);
+        assert!(report.folded >= 2);
+        assert_eq!(report.ops_after, program.code.len());
+        assert!(report.ops_after < report.ops_before);
+    }
+
+    #[test]
+    fn functions_call_each_other_through_the_machine() {
+        let mut table = table(&["f(x) = x^2 + 3x", "g(x, y) = f(x) * y + k"], true);
+        let context = context(&[("k", 1.0)]);
+        assert_eq!(run(&mut table, "g(2, 3) + sin(0)", &context), 31.0);
+
+        /* One machine runs a program many times, and other programs in between */
+        let g = table.get("g").unwrap().clone();
+        let f = table.get("f").unwrap().clone();
+        let mut machine = Machine::new(&context);
+        for x in 0..4 {
+            let x = f64::from(x);
+            assert_eq!(machine.run(&g.program, &[x, 2.0]).unwrap(), (x * x + 3.0 * x) * 2.0 + 1.0);
+            assert_eq!(machine.run(&f.program, &[x]).unwrap(), x * x + 3.0 * x);
+        }
+        assert_eq!(g.signature(), "g(x, y)");
+    }
+
+    #[test]
+    fn redefining_a_callee_relinks_its_callers() {
+        let mut table = table(&["f(x) = x^2", "g(x) = f(x) + 1"], true);
+        table.define(&Definition::parse("f(x) = -x").unwrap()).unwrap();
+        assert_eq!(run(&mut table, "g(3)", &context(&[])), -2.0);
+        /* A new parameter count would break g, so the table is left as it was */
+        assert!(matches!(table.define(&Definition::parse("f(x, y) = x").unwrap()), Err(FunctionError::Breaks { .. })));
+        assert_eq!(table.get("f").unwrap().params.len(), 1);
+    }
+
+    #[test]
+    fn rejects_invalid_definitions() {
+        let mut table = table(&["f(x) = x", "g(x) = f(x)"], true);
+        let mut define = |text| table.define(&Definition::parse(text).unwrap());
+        assert!(matches!(define("f(x) = g(x)"), Err(FunctionError::Recursive(_))));
+        assert!(matches!(define("h(x) = h(x)"), Err(FunctionError::UnknownFunction(_))));
+        assert!(matches!(define("sin(x) = x"), Err(FunctionError::Reserved(_))));
+        assert!(matches!(define("q(x, x) = x"), Err(FunctionError::InvalidParameters(_))));
+        assert!(matches!(table.remove("f"), Err(FunctionError::InUse { .. })));
+        assert!(Definition::parse("x = 5").is_none());
+    }
+
+    #[test]
+    fn reports_unknown_variables_and_plain_expressions() {
+        let mut table = table(&["f(x) = x + z"], true);
+        let program = table.program_for("f(1)").unwrap().unwrap();
+        assert_eq!(Machine::new(&context(&[])).run(&program, &[]), Err(FunctionError::UnknownVariable("z".into())));
+        assert_eq!(Machine::new(&context(&[("z", 2.0)])).run(&program, &[]), Ok(3.0));
+        assert!(table.program_for("1 + 2").is_none());
+    }
+}
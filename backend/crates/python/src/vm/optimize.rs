@@ -0,0 +1,158 @@
+//! Rewrites applied between lowering and code generation: constant folding,
+//! algebraic identities and common-subexpression elimination.
+//!
+//! Every rewrite keeps the value of the expression. Nothing that could change
+//! a NaN or infinity is simplified away, so `x*0` is left alone.
+
+use std::collections::HashMap;
+
+use neocalc_core::Context;
+
+use super::compiler::Node;
+use super::machine::Machine;
+use crate::expr::BinaryOp;
+
+/// What the optimizer did to one expression.
+#[derive(Debug, Clone, Default, PartialEq)]
+pub struct Report {
+    /// Subtrees replaced by their constant value.
+    pub folded: usize,
+    /// Identities removed, such as `x*1` or `--x`.
+    pub simplified: usize,
+    /// Repeated subtrees now computed once.
+    pub hoisted: Vec<String>,
+    pub ops_before: usize,
+    pub ops_after: usize,
+}
+
+fn fold_binary(op: BinaryOp, a: f64, b: f64) -> f64 {
+    match op {
+        BinaryOp::Add => a + b,
+        BinaryOp::Sub => a - b,
+        BinaryOp::Mul => a * b,
+        BinaryOp::Div => a / b,
+        BinaryOp::Rem => a % b,
+        BinaryOp::Pow => a.powf(b),
+    }
+}
+
+/// What a binary node reduces to when one operand is an identity element.
+enum Identity {
+    Left,
+    Right,
+    NegLeft,
+    NegRight,
+    One,
+}
+
+fn is(node: &Node, value: f64) -> bool {
+    matches!(node, Node::Const(v) if *v == value)
+}
+
+/// Folds constants and removes identities, bottom-up.
+pub fn simplify(node: Node, report: &mut Report) -> Node {
+    match node {
+        Node::Neg(inner) => match simplify(*inner, report) {
+            Node::Const(v) => {
+                report.folded += 1;
+                Node::Const(-v)
+            }
+            Node::Neg(x) => {
+                report.simplified += 1;
+                *x
+            }
+            inner => Node::Neg(Box::new(inner)),
+        },
+        Node::Math(f, arg) => match simplify(*arg, report) {
+            Node::Const(v) => {
+                report.folded += 1;
+                Node::Const(f.apply(v))
+            }
+            arg => Node::Math(f, Box::new(arg)),
+        },
+        Node::Binary(op, lhs, rhs) => {
+            let lhs = simplify(*lhs, report);
+            let rhs = simplify(*rhs, report);
+            if let (Node::Const(a), Node::Const(b)) = (&lhs, &rhs) {
+                report.folded += 1;
+                return Node::Const(fold_binary(op, *a, *b));
+            }
+            use Identity::*;
+            let identity = match op {
+                BinaryOp::Add if is(&rhs, 0.0) => Left,
+                BinaryOp::Add if is(&lhs, 0.0) => Right,
+                BinaryOp::Sub if is(&rhs, 0.0) => Left,
+                BinaryOp::Sub if is(&lhs, 0.0) => NegRight,
+                BinaryOp::Mul | BinaryOp::Div if is(&rhs, 1.0) => Left,
+                BinaryOp::Mul if is(&lhs, 1.0) => Right,
+                BinaryOp::Mul if is(&rhs, -1.0) => NegLeft,
+                BinaryOp::Mul if is(&lhs, -1.0) => NegRight,
+                BinaryOp::Pow if is(&rhs, 1.0) => Left,
+                /* powf(x, 0) is 1 for every x, NaN included */
+                BinaryOp::Pow if is(&rhs, 0.0) => One,
+                _ => return Node::Binary(op, Box::new(lhs), Box::new(rhs)),
+            };
+            report.simplified += 1;
+            match identity {
+                Left => lhs,
+                Right => rhs,
+                NegLeft => Node::Neg(Box::new(lhs)),
+                NegRight => Node::Neg(Box::new(rhs)),
+                One => Node::Const(1.0),
+            }
+        }
+        Node::Call(function, args) => {
+            let args: Vec<Node> = args.into_iter().map(|a| simplify(a, report)).collect();
+            let constant: Option<Vec<f64>> = args
+                .iter()
+                .map(|a| match a {
+                    Node::Const(v) => Some(*v),
+                    _ => None,
+                })
+                .collect();
+            /* User functions are pure, so constant arguments give a constant, unless
+             * the body reads a variable, which fails against an empty context. */
+            if let Some(values) = constant {
+                if let Ok(v) = Machine::new(&Context::new()).run(&function.program, &values) {
+                    report.folded += 1;
+                    return Node::Const(v);
+                }
+            }
+            Node::Call(function, args)
+        }
+        leaf => leaf,
+    }
+}
+
+fn count(node: &Node, seen: &mut HashMap<String, usize>, order: &mut Vec<String>) {
+    if node.is_leaf() {
+        return;
+    }
+    let key = node.key();
+    let n = seen.entry(key.clone()).or_insert(0);
+    *n += 1;
+    if *n > 1 {
+        /* Its children are covered by the first occurrence */
+        return;
+    }
+    order.push(key);
+    match node {
+        Node::Neg(inner) | Node::Math(_, inner) => count(inner, seen, order),
+        Node::Binary(_, lhs, rhs) => {
+            count(lhs, seen, order);
+            count(rhs, seen, order);
+        }
+        Node::Call(_, args) => args.iter().for_each(|a| count(a, seen, order)),
+        _ => {}
+    }
+}
+
+/// Subtrees that occur more than once, outermost first. Everything in the
+/// tree is pure, so each of them only needs to be computed the first time.
+pub fn common_subexpressions(node: &Node) -> Vec<String> {
+    let mut seen = HashMap::new();
+    let mut order = Vec::new();
+    count(node, &mut seen, &mut order);
+    order.retain(|k| seen[k] > 1);
+    order
+}
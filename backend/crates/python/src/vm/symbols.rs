@@ -0,0 +1,112 @@
+//! Interned identifiers. Every distinct name in use is stored once and shared,
+//! so compiled code carries pointers rather than strings and two symbols are
+//! compared without looking at their text.
+//!
+//! A name stays in the table only while some compiled program still holds it:
+//! once the table has doubled since it was last cleaned, names nothing else
+//! refers to are dropped, so it never outgrows the functions and expressions
+//! actually alive.
+
+use std::collections::HashSet;
+use std::fmt;
+use std::hash::{Hash, Hasher};
+use std::sync::{Arc, LazyLock, PoisonError, RwLock};
+
+/// Size the table may reach before it is first cleaned.
+const MIN_PRUNE_AT: usize = 1024;
+
+#[derive(Clone)]
+pub struct Symbol(Arc<str>);
+
+struct Interner {
+    names: HashSet<Arc<str>>,
+    prune_at: usize,
+}
+
+static INTERNER: LazyLock<RwLock<Interner>> =
+    LazyLock::new(|| RwLock::new(Interner { names: HashSet::new(), prune_at: MIN_PRUNE_AT }));
+
+impl Interner {
+    fn insert(&mut self, name: &str) -> Symbol {
+        if let Some(name) = self.names.get(name) {
+            return Symbol(name.clone());
+        }
+        if self.names.len() >= self.prune_at {
+            /* Only the table holds these; no symbol for them exists any more */
+            self.names.retain(|name| Arc::strong_count(name) > 1);
+            self.prune_at = (2 * self.names.len()).max(MIN_PRUNE_AT);
+        }
+        let name: Arc<str> = Arc::from(name);
+        self.names.insert(name.clone());
+        Symbol(name)
+    }
+}
+
+impl Symbol {
+    /// The symbol for `name`, interning it on first use.
+    pub fn intern(name: &str) -> Symbol {
+        if let Some(name) = INTERNER.read().unwrap_or_else(PoisonError::into_inner).names.get(name) {
+            return Symbol(name.clone());
+        }
+        INTERNER.write().unwrap_or_else(PoisonError::into_inner).insert(name)
+    }
+
+    pub fn name(&self) -> Arc<str> {
+        self.0.clone()
+    }
+}
+
+/* Equal names share one allocation for as long as either symbol lives */
+impl PartialEq for Symbol {
+    fn eq(&self, other: &Self) -> bool {
+        Arc::ptr_eq(&self.0, &other.0)
+    }
+}
+
+impl Eq for Symbol {}
+
+impl Hash for Symbol {
+    fn hash<H: Hasher>(&self, state: &mut H) {
+        std::ptr::hash(Arc::as_ptr(&self.0), state);
+    }
+}
+
+impl fmt::Debug for Symbol {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        write!(f, "Symbol({:?})", &*self.0)
+    }
+}
+
+impl fmt::Display for Symbol {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        f.write_str(&self.0)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn table_len() -> usize {
+        INTERNER.read().unwrap_or_else(PoisonError::into_inner).names.len()
+    }
+
+    #[test]
+    fn equal_names_share_a_symbol() {
+        let a = Symbol::intern("symbols_test_a");
+        assert_eq!(a, Symbol::intern("symbols_test_a"));
+        assert_ne!(a, Symbol::intern("symbols_test_b"));
+        assert_eq!(&*a.name(), "symbols_test_a");
+    }
+
+    #[test]
+    fn unused_names_are_dropped() {
+        let kept = Symbol::intern("symbols_test_kept");
+        for i in 0..10 * MIN_PRUNE_AT {
+            Symbol::intern(&format!("symbols_test_{}", i));
+        }
+        /* Other tests may hold a few symbols of their own */
+        assert!(table_len() <= 2 * MIN_PRUNE_AT + 64, "{} names", table_len());
+        assert_eq!(kept, Symbol::intern("symbols_test_kept"));
+    }
+}
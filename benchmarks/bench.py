@@ -0,0 +1,313 @@
+"""
+NeoCalc benchmark runner.
+
+Times the Python side of the app (CalculatorLogic round trips, the latency of
+evaluate_non_blocking, opening a calculator tab, and opening and closing 1, 100
+and 1000 tabs at once), collects the criterion results of the native benches,
+and compares everything against a baseline.
+
+    cargo build --release -p neocalc-python
+    cargo bench -p neocalc-python --no-default-features
+    python3 benchmarks/bench.py --output bench.json
+    python3 benchmarks/bench.py --baseline bench.json --thresholds benchmarks/thresholds.json
+
+Exits with status 1 when a benchmark got slower than its threshold allows.
+"""
+import argparse
+import fnmatch
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Expressions typed in the round-trip and preview benchmarks
+TYPED = ["12*(3+4)-5/2", "2^64+1", "sin(pi/7)*cos(pi/7)", "pmt(0.05/12, 360, 200000)"]
+
+
+def load_backend(path=None):
+    """
+    Make neocalc_backend importable, either installed or from the cargo build.
+    """
+    if "neocalc_backend" in sys.modules:
+        return
+    candidates = [path] if path else [
+        os.path.join(ROOT, "target", profile, "libneocalc_backend.so") for profile in ("release", "debug")
+    ]
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            spec = importlib.util.spec_from_file_location("neocalc_backend", candidate)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            sys.modules["neocalc_backend"] = module
+            return
+    ## Fall back to an installed module; the import error is reported by the caller
+
+
+def measure(func, repeat, warmup=3):
+    """
+    Runs func repeatedly and returns timing statistics in nanoseconds.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - start)
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "median_ns": statistics.median(samples),
+        "mean_ns": statistics.fmean(samples),
+        "min_ns": samples[0],
+        "p95_ns": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "samples": len(samples),
+    }
+
+
+def bench_logic(results, repeat):
+    from neocalc.core.backend import CalculatorLogic
+
+    logic = CalculatorLogic()
+
+    def round_trip():
+        for expression in TYPED:
+            logic.clear()
+            for ch in expression:
+                logic.input(ch)
+            logic.evaluate(logic.get_buffer())
+        logic.clear_history()
+
+    def preview():
+        for expression in TYPED:
+            for end in range(1, len(expression) + 1):
+                logic.preview(expression[:end])
+
+    results["python/logic/round_trip"] = measure(round_trip, repeat)
+    results["python/logic/preview"] = measure(preview, repeat)
+    return logic
+
+
+def bench_non_blocking(results, logic, repeat):
+    """
+    Time from evaluate_non_blocking to the callback running on the main loop,
+    which is what the user waits for after pressing "=".
+    """
+    from gi.repository import GLib
+
+    context = GLib.MainContext.default()
+    done = threading.Event()
+
+    def on_done(_result):
+        done.set()
+        return False
+
+    def once():
+        done.clear()
+        logic.evaluate_non_blocking(TYPED[0], on_success=on_done, on_error=on_done)
+        while not done.is_set():
+            context.iteration(True)
+
+    results["python/evaluate_non_blocking"] = measure(once, repeat)
+    logic.clear_history()
+
+
+def bench_add_instance(results, repeat):
+    """
+    Opens calculator tabs in a real main window. Needs a display.
+    """
+    import gi
+
+    gi.require_version("Gtk", "4.0")
+    gi.require_version("Adw", "1")
+    from gi.repository import Adw, Gio, Gtk
+
+    if not Gtk.init_check():
+        results["python/add_calculator_instance"] = {"skipped": "no display"}
+        return
+
+    from neocalc.ui.windows.main_window import Calculator
+
+    app = Adw.Application(application_id="com.nilton.neocalc.bench", flags=Gio.ApplicationFlags.NON_UNIQUE)
+
+    def on_activate(app):
+        window = Calculator(app)
+        results["python/add_calculator_instance"] = measure(window.add_calculator_instance, repeat, warmup=1)
+        window.destroy()
+        app.quit()
+
+    app.connect("activate", on_activate)
+    app.run([])
+
+
+def bench_tab_lifecycle(results, repeat, sizes=(1, 100, 1000)):
+    """
+    Opens n tabs with the bulk API and closes them again, for each n in sizes.
+    Each sample includes running the main loop until it is idle. Needs a display.
+    """
+    import gi
+
+    gi.require_version("Gtk", "4.0")
+    gi.require_version("Adw", "1")
+    from gi.repository import Adw, Gio, GLib, Gtk
+
+    if not Gtk.init_check():
+        for n in sizes:
+            results[f"python/tabs/open/{n}"] = {"skipped": "no display"}
+            results[f"python/tabs/close/{n}"] = {"skipped": "no display"}
+        return
+
+    from neocalc.ui.windows.main_window import Calculator
+
+    app = Adw.Application(application_id="com.nilton.neocalc.bench", flags=Gio.ApplicationFlags.NON_UNIQUE)
+    context = GLib.MainContext.default()
+
+    def drain():
+        while context.pending():
+            context.iteration(False)
+
+    def on_activate(app):
+        window = Calculator(app)
+        window.present()
+        drain()
+        for n in sizes:
+            ## Big sizes are slow enough that a few samples are plenty
+            samples = max(1, repeat // max(1, n // 10))
+            opened, closed = [], []
+            for _ in range(samples + 1):
+                start = time.perf_counter_ns()
+                window.add_calculator_instances(n)
+                drain()
+                middle = time.perf_counter_ns()
+                pages = [window.tab_view.get_nth_page(i) for i in range(1, window.tab_view.get_n_pages())]
+                window.close_calculator_instances([page.calc_widget for page in pages])
+                drain()
+                opened.append(middle - start)
+                closed.append(time.perf_counter_ns() - middle)
+            ## The first round warms up
+            results[f"python/tabs/open/{n}"] = summarize(opened[1:])
+            results[f"python/tabs/close/{n}"] = summarize(closed[1:])
+        window.destroy()
+        app.quit()
+
+    app.connect("activate", on_activate)
+    app.run([])
+
+
+def collect_criterion(directory):
+    """
+    Median estimates of every criterion benchmark under target/criterion.
+    """
+    results = {}
+    for dirpath, _, filenames in os.walk(directory):
+        if os.path.basename(dirpath) != "new" or "estimates.json" not in filenames:
+            continue
+        with open(os.path.join(dirpath, "estimates.json")) as f:
+            estimates = json.load(f)
+        name = os.path.relpath(os.path.dirname(dirpath), directory).replace(os.sep, "/")
+        results["native/" + name] = {
+            "median_ns": estimates["median"]["point_estimate"],
+            "mean_ns": estimates["mean"]["point_estimate"],
+        }
+    return results
+
+
+def threshold_for(name, thresholds, default):
+    """
+    Allowed slowdown in percent: the longest matching pattern wins.
+    """
+    matches = [p for p in thresholds if fnmatch.fnmatch(name, p)]
+    if not matches:
+        return default
+    return thresholds[max(matches, key=len)]
+
+
+def compare(current, baseline, thresholds, default):
+    """
+    Returns (name, before, after, change %, allowed %) for each regression.
+    """
+    regressions = []
+    for name, result in sorted(current.items()):
+        before = baseline.get(name, {}).get("median_ns")
+        after = result.get("median_ns")
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100.0
+        allowed = threshold_for(name, thresholds, default)
+        if change > allowed:
+            regressions.append((name, before, after, change, allowed))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent (default 10)")
+    parser.add_argument("--thresholds", help="JSON object of benchmark name patterns to allowed slowdown")
+    parser.add_argument("--repeat", type=int, default=200, help="samples per Python benchmark")
+    parser.add_argument("--criterion", default=os.path.join(ROOT, "target", "criterion"),
+                        help="criterion output directory to include")
+    parser.add_argument("--backend", help="path to a built neocalc_backend extension module")
+    parser.add_argument("--no-python", action="store_true", help="only collect the native results")
+    parser.add_argument("--no-gui", action="store_true", help="skip benchmarks that need a display")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, "python"))
+    ## The main window restores and saves a session; keep it away from the real one
+    os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="neocalc-bench-")
+    results = {}
+
+    if not args.no_python:
+        load_backend(args.backend)
+        try:
+            import neocalc_backend  # noqa: F401
+        except ImportError:
+            print("neocalc_backend not found: run `cargo build --release -p neocalc-python` "
+                  "or pass --backend, or use --no-python", file=sys.stderr)
+            return 2
+        logic = bench_logic(results, args.repeat)
+        bench_non_blocking(results, logic, args.repeat)
+        if not args.no_gui:
+            bench_add_instance(results, max(1, args.repeat // 10))
+            bench_tab_lifecycle(results, max(1, args.repeat // 10))
+
+    if os.path.isdir(args.criterion):
+        results.update(collect_criterion(args.criterion))
+
+    report = {"created": time.time(), "python": sys.version.split()[0], "benchmarks": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["benchmarks"]
+    thresholds = {}
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+
+    regressions = compare(results, baseline, thresholds, args.threshold)
+    for name, before, after, change, allowed in regressions:
+        print(f"REGRESSION {name}: {before:.0f} ns -> {after:.0f} ns (+{change:.1f}%, allowed {allowed:.1f}%)",
+              file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
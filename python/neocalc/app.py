@@ -2,12 +2,13 @@ import gi
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
 gi.require_version('Rsvg', '2.0')
-from gi.repository import Adw, Gio, Gtk, Gdk
+from gi.repository import Adw, Gio, GLib, Gtk, Gdk
 import os
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
-from neocalc.ui.windows.main_window import Calculator
+## The main window (and with it GTK widgets and the backend) is imported on
+## first use, so a launch that only forwards to a running instance stays cheap
 import gettext
 
 BASE_DIR = getattr(sys, 'frozen', False) and sys._MEIPASS or os.path.dirname(os.path.abspath(__file__))
@@ -27,21 +28,65 @@ except Exception as e:
     gettext.install('neocalc', LOCALE_DIR)
 
 class CalculatorApp(Adw.Application):
-    def __init__(self):
+    def __init__(self, single_instance=False):
         ## Initialize the Adwaita application
         ## application_id must be unique and match the desktop file
+        ## Single-instance launches hand their command line to the running
+        ## process over D-Bus and exit, instead of starting a second app
+        flags = Gio.ApplicationFlags.HANDLES_COMMAND_LINE
+        if not single_instance:
+            flags |= Gio.ApplicationFlags.NON_UNIQUE
 
-        super().__init__(application_id="com.nilton.neocalc",
-                         flags=Gio.ApplicationFlags.NON_UNIQUE)
+        super().__init__(application_id="com.nilton.neocalc", flags=flags)
 
-    def do_activate(self):
+        self.add_main_option("new-window", ord("w"), GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Open a new window instead of a tab in the running one", None)
+        self.add_main_option("single-instance", 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Reuse a running NeoCalc if there is one", None)
+        self.add_main_option(GLib.OPTION_REMAINING, 0, GLib.OptionFlags.NONE, GLib.OptionArg.STRING_ARRAY,
+                             "Expressions to evaluate, each in a new tab", "[EXPRESSION…]")
+
+    def do_startup(self):
+        Adw.Application.do_startup(self)
         ## Add resources directory to icon theme search path
         icon_theme = Gtk.IconTheme.get_for_display(Gdk.Display.get_default())
         resource_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
         icon_theme.add_search_path(resource_dir)
 
-        ## On activation, create and present the main window
-        Calculator(self).present()
+    def _new_window(self):
+        from neocalc.ui.windows.main_window import Calculator
+
+        ## Only the first window owns the saved session
+        window = Calculator(self, restore_session=not self.get_windows())
+        window.present()
+        return window
+
+    def do_activate(self):
+        ## On activation, present the main window, creating it if needed
+        window = self.get_active_window()
+        if window is None:
+            self._new_window()
+        else:
+            window.present()
+
+    def do_command_line(self, command_line):
+        ## Runs in the primary instance, for its own launch and forwarded ones
+        options = command_line.get_options_dict().end().unpack()
+        expressions = options.get(GLib.OPTION_REMAINING, [])
+
+        window = self.get_active_window()
+        if window is None or options.get("new-window"):
+            window = self._new_window()
+            if expressions:
+                window.open_expressions(expressions)
+        else:
+            ## An existing window gets a new tab, or one per expression
+            if expressions:
+                window.open_expressions(expressions)
+            else:
+                window.add_calculator_instance()
+            window.present()
+        return 0
 
 def main():
     import sys
@@ -50,8 +95,11 @@ def main():
     if not argv or not argv[0]:
         argv = ["neocalc"]
 
+    ## NON_UNIQUE has to be decided before the command line is parsed
+    single_instance = "--single-instance" in argv or os.environ.get("NEOCALC_SINGLE_INSTANCE") == "1"
+
     ## Run the application
-    CalculatorApp().run(argv)
+    return CalculatorApp(single_instance).run(argv)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
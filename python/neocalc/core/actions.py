@@ -20,6 +20,8 @@ class ActionRegistry:
             ("switch_standard", self.on_switch_standard, ["<Control>r"]),
             ("switch_programming", self.on_switch_programming, ["<Control>p"]),
             ("switch_financial", self.on_switch_financial, ["<Control>f"]),
+            ("toggle_latency_overlay", self.on_toggle_latency_overlay, ["<Control><Shift>l"]),
+            ("export_latency", self.on_export_latency, ["<Control><Shift>e"]),
         ]
 
         ## Register each action with the window and set accelerators if app is present
@@ -97,6 +99,12 @@ class ActionRegistry:
             if hasattr(page, 'calc_widget'):
                     self.window.switch_display_for(page.calc_widget)
 
+    def on_toggle_latency_overlay(self, action, param):
+        self.window.toggle_latency_overlay()
+
+    def on_export_latency(self, action, param):
+        self.window.export_latency()
+
     def on_import_theme(self, action, param):
         StyleManager.import_theme(self.window)
 
@@ -3,9 +3,11 @@ import neocalc_backend
 from gi.repository import GLib
 import asyncio
 import threading
+import weakref
 import concurrent.futures
 
-from neocalc_backend import DisplayManager, CalculatorManager
+from neocalc_backend import DisplayManager, CalculatorManager, SessionStore
+from neocalc_backend import set_stats_enabled, get_stats, reset_stats, dump_trace
 
 class CalculatorLogic:
     """
@@ -13,19 +15,36 @@ class CalculatorLogic:
     Now instance-based so everyone gets their own sandbox.
     """
 
-    def __init__(self):
+    ## One background loop for every instance; a thread per tab does not scale
+    _loop = None
+    _loop_lock = threading.Lock()
 
-        self._calc = neocalc_backend.Calculator()
-        
-        ## Create a dedicated event loop for background tasks
-        self._loop = asyncio.new_event_loop()
-        self._thread = threading.Thread(target=self._start_background_loop, daemon=True)
-        self._thread.start()
+    def __init__(self, calc=None):
+
+        ## A restored session hands in an already rebuilt calculator
+        self._calc = calc if calc is not None else neocalc_backend.Calculator()
+
+    @property
+    def calculator(self):
+        """
+        The Rust Calculator itself, for saving sessions.
+        """
+        return self._calc
+
+    @classmethod
+    def _background_loop(cls):
+        """The shared loop for background tasks, started on first use."""
+        with cls._loop_lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._start_background_loop, args=(cls._loop,), daemon=True).start()
+            return cls._loop
 
-    def _start_background_loop(self):
+    @staticmethod
+    def _start_background_loop(loop):
         """Runs the asyncio loop in a separate thread."""
-        asyncio.set_event_loop(self._loop)
-        self._loop.run_forever()
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
 
     def input(self, text: str) -> str:
         """
@@ -79,7 +98,34 @@ class CalculatorLogic:
                 if on_error:
                     GLib.idle_add(on_error, error_msg)
         
-        asyncio.run_coroutine_threadsafe(_wrapper(), self._loop)
+        asyncio.run_coroutine_threadsafe(_wrapper(), self._background_loop())
+
+    def connect_changes(self, callback) -> None:
+        """
+        Call callback(changes) on the main loop after every evaluation, base
+        conversion or history clear, with a list of (kind, payload):
+        ("buffer", text), ("history_appended", (version, entry)),
+        ("history", version) and ("variables", version).
+        A bound method is held weakly, so the backend does not keep its widget alive.
+        """
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+
+        def deliver(changes):
+            target = ref()
+            if target is not None:
+                GLib.idle_add(target, changes)
+
+        self._calc.set_listener(deliver)
+
+    def disconnect_changes(self) -> None:
+        self._calc.set_listener(None)
+
+    def cancel(self) -> None:
+        """
+        Stop a running evaluation, such as a huge factorial. It reports
+        "Calculation cancelled" instead of a result.
+        """
+        self._calc.cancel()
 
     def get_history(self) -> list:
         """
@@ -98,3 +144,241 @@ class CalculatorLogic:
         Set buffer directly.
         """
         self._calc.set_expression(text)
+
+    def apply_edit(self, text: str, start: int = 0, end: int = None, since: int = 0) -> dict:
+        """
+        Replace characters start..end of the buffer with text (end=None: to the end)
+        and get the new buffer, its preview, the history version and the variables
+        changed after version `since`, all in one call.
+        """
+        buffer, preview, history_version, version, changed, removed, complete = \
+            self._calc.apply_edit(text, start, end, since)
+        return {
+            "buffer": buffer,
+            "preview": preview,
+            "history_version": history_version,
+            "variables": {"version": version, "changed": changed, "removed": removed, "complete": complete},
+        }
+
+    def get_state(self, since: int = 0) -> dict:
+        """
+        Same result as apply_edit, without editing anything.
+        """
+        return self.apply_edit("", 0, 0, since)
+
+    def preview(self, text: str) -> str:
+        """
+        Evaluate without touching history or variables.
+        """
+        return self._calc.preview(text)
+
+    def get_variables(self) -> dict:
+        """
+        Name -> formatted value of every defined variable.
+        """
+        return self._calc.get_variables()
+
+    def convert_to_hex(self) -> str:
+        """
+        Replace the buffer with its value in hexadecimal.
+        """
+        return self._calc.convert_to_hex()
+
+    def convert_to_bin(self) -> str:
+        """
+        Replace the buffer with its value in binary.
+        """
+        return self._calc.convert_to_bin()
+
+    def set_word_size(self, bits, signed: bool = True) -> None:
+        """
+        Switch to fixed-width integer math (8/16/32/64/128 bits).
+        bits=None goes back to unbounded numbers.
+        """
+        self._calc.set_word_size(bits, signed)
+
+    def get_word_size(self):
+        """
+        (bits, signed) or None when no word size is active.
+        """
+        return self._calc.get_word_size()
+
+    def preview_bases(self, text: str) -> dict:
+        """
+        hex/dec/oct/bin renderings of text as a machine word.
+        """
+        return self._calc.preview_bases(text)
+
+    def set_dataset(self, name: str, values) -> None:
+        """
+        Store a numeric series (e.g. cash flows) so irr(name) / npv(r, name) can use it.
+        """
+        self._calc.set_dataset(name, values)
+
+    def load_dataset(self, name: str, path: str) -> None:
+        """
+        Register a file-backed dataset (.f64/.bin raw doubles, anything else as text).
+        The file is streamed when used, never loaded up front.
+        """
+        self._calc.load_dataset(name, path)
+
+    def remove_dataset(self, name: str) -> bool:
+        return self._calc.remove_dataset(name)
+
+    def get_datasets(self) -> dict:
+        """
+        Dataset name -> number of values (None if not known until read).
+        """
+        return self._calc.get_datasets()
+
+    def set_matrix(self, name: str, rows) -> None:
+        """
+        Store a matrix from a list of equal-length rows, for det(name), solve(name, b), ...
+        Raises ValueError for ragged rows.
+        """
+        self._calc.set_matrix(name, rows)
+
+    def set_vector(self, name: str, values) -> None:
+        """
+        Store a vector (a one-column matrix).
+        """
+        self._calc.set_vector(name, values)
+
+    def get_matrix(self, name: str) -> list:
+        """
+        The rows of a stored matrix. Raises KeyError if there is none.
+        """
+        return self._calc.get_matrix(name)
+
+    def remove_matrix(self, name: str) -> bool:
+        return self._calc.remove_matrix(name)
+
+    def get_matrices(self) -> dict:
+        """
+        Matrix name -> (rows, cols).
+        """
+        return self._calc.get_matrices()
+
+    def statistics(self, data) -> dict:
+        """
+        count/mean/var/std/min/max of a dataset name or sequence, in a single pass.
+        """
+        return self._calc.statistics(data)
+
+    def median(self, data) -> float:
+        return self._calc.median(data)
+
+    def irr(self, flows, guess: float = None) -> float:
+        """
+        Internal rate of return of a dataset name or a sequence of cash flows.
+        Raises ValueError when there is no solution.
+        """
+        return self._calc.irr(flows, guess)
+
+    def npv(self, rate: float, flows) -> float:
+        return self._calc.npv(rate, flows)
+
+    def rate(self, nper: float, pmt: float, pv: float, fv: float = 0.0, when: float = 0.0, guess: float = None) -> float:
+        return self._calc.rate(nper, pmt, pv, fv, when, guess)
+
+    def nper(self, rate: float, pmt: float, pv: float, fv: float = 0.0, when: float = 0.0) -> float:
+        return self._calc.nper(rate, pmt, pv, fv, when)
+
+    def call_function(self, name: str, *args: float) -> float:
+        """
+        Call a user function defined with `f(x) = ...` on plain numbers.
+        """
+        return self._calc.call_function(name, list(args))
+
+    def tabulate(self, name: str, start: float, stop: float, step: float) -> list:
+        """
+        Values of a one-argument user function from start to stop (inclusive).
+        """
+        return self._calc.tabulate(name, start, stop, step)
+
+    def remove_function(self, name: str) -> bool:
+        return self._calc.remove_function(name)
+
+    def set_optimization(self, enabled: bool) -> None:
+        self._calc.set_optimization(enabled)
+
+    def optimization_report(self, text: str) -> dict:
+        """
+        Debug view of what the optimizer folds, simplifies and hoists in text.
+        """
+        folded, simplified, hoisted, before, after = self._calc.optimization_report(text)
+        return {
+            "folded": folded,
+            "simplified": simplified,
+            "hoisted": hoisted,
+            "ops_before": before,
+            "ops_after": after,
+        }
+
+    def get_formulas(self) -> dict:
+        """
+        Formulas bound with `name := expression`, recomputed when their inputs change.
+        """
+        return self._calc.get_formulas()
+
+    def remove_formula(self, name: str) -> bool:
+        return self._calc.remove_formula(name)
+
+    def get_recomputed(self) -> list:
+        """
+        Formulas the last assignment recomputed, in dependency order.
+        """
+        return self._calc.get_recomputed()
+
+    def evaluate_batch(self, expressions) -> list:
+        """
+        Evaluate several expressions against one snapshot of the variables, in parallel.
+        """
+        return self._calc.evaluate_batch(list(expressions))
+
+    def get_lock_stats(self) -> dict:
+        """
+        Per-state lock acquisitions and wait times (ns), to check nothing blocks the UI.
+        """
+        return self._calc.get_lock_stats()
+
+    def reset_lock_stats(self) -> None:
+        self._calc.reset_lock_stats()
+
+    def get_variable_changes(self, since: int) -> dict:
+        """
+        Variables added/changed/removed after version `since`. With complete=True,
+        `changed` is the full listing and anything missing from it is gone.
+        """
+        version, changed, removed, complete = self._calc.get_variable_changes(since)
+        return {"version": version, "changed": changed, "removed": removed, "complete": complete}
+
+    def remove_variable(self, name: str) -> bool:
+        return self._calc.remove_variable(name)
+
+    ## Process-wide profiling; the counters are shared by every calculator
+
+    @staticmethod
+    def set_stats_enabled(enabled: bool, trace: bool = False) -> None:
+        """
+        Turn timing collection on or off. trace=True also keeps every span for dump_trace.
+        """
+        set_stats_enabled(enabled, trace)
+
+    @staticmethod
+    def get_stats() -> dict:
+        """
+        Timers (count, total/max and p50/p90/p99 in ns), counters and cache hit rates.
+        """
+        return get_stats()
+
+    @staticmethod
+    def reset_stats() -> None:
+        reset_stats()
+
+    @staticmethod
+    def dump_trace(path: str) -> int:
+        """
+        Write the recorded spans as a Chrome trace file and return how many were written.
+        """
+        return dump_trace(path)
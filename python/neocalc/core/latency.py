@@ -0,0 +1,129 @@
+import json
+import time
+from collections import deque
+
+## Inputs kept for the percentiles and the export
+MAX_SAMPLES = 2000
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyRecorder:
+    """
+    Measures input-to-pixel latency: from a key press or button click, through
+    the edit and the backend calls, to the frame where the display repaints.
+    Does nothing until enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self._current = None
+        self._waiting = None
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+        if not enabled:
+            self._cancel()
+
+    def reset(self):
+        self.samples.clear()
+        self._cancel()
+
+    def begin(self, source: str):
+        """
+        Start timing an input. Inputs arriving while an earlier one waits for its
+        frame are counted from the earlier one, since they are painted together.
+        """
+        if not self.enabled:
+            return
+        if self._waiting is None:
+            self._current = {"source": source, "start": time.perf_counter_ns(), "stages": [], "inputs": 0}
+        self._current["inputs"] += 1
+
+    def mark(self, stage: str):
+        """
+        Record that the current input has reached `stage`.
+        """
+        current = self._current
+        if current is None:
+            return
+        if all(name != stage for name, _ in current["stages"]):
+            current["stages"].append((stage, time.perf_counter_ns()))
+
+    def wait_for_paint(self, widget):
+        """
+        Finish the current input once `widget` has been painted by the frame clock.
+        """
+        if self._current is None or self._waiting is not None:
+            return
+        clock = widget.get_frame_clock()
+        if clock is None:
+            self._current = None
+            return
+        handler = clock.connect("after-paint", self._on_after_paint)
+        self._waiting = (clock, handler)
+        widget.queue_draw()
+
+    def _cancel(self):
+        if self._waiting is not None:
+            clock, handler = self._waiting
+            clock.disconnect(handler)
+        self._waiting = None
+        self._current = None
+
+    def _on_after_paint(self, clock):
+        current = self._current
+        self._cancel()
+        if current is None:
+            return
+        now = time.perf_counter_ns()
+        stages = {}
+        previous = current["start"]
+        for name, stamp in current["stages"] + [("paint", now)]:
+            stages[name] = (stamp - previous) / 1e6
+            previous = stamp
+        self.samples.append({
+            "source": current["source"],
+            "inputs": current["inputs"],
+            "total_ms": (now - current["start"]) / 1e6,
+            "stages_ms": stages,
+        })
+
+    def summary(self) -> dict:
+        """
+        p50/p90/p99 in milliseconds for the total and for each stage.
+        """
+        totals = sorted(s["total_ms"] for s in self.samples)
+        stages = {}
+        for sample in self.samples:
+            for name, ms in sample["stages_ms"].items():
+                stages.setdefault(name, []).append(ms)
+
+        def describe(values):
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "p50": _percentile(values, 0.5),
+                "p90": _percentile(values, 0.9),
+                "p99": _percentile(values, 0.99),
+                "max": values[-1] if values else 0.0,
+            }
+
+        return {"total": describe(totals), "stages": {name: describe(v) for name, v in stages.items()}}
+
+    def export(self, path: str):
+        """
+        Write the summary and every sample as JSON.
+        """
+        with open(path, "w") as f:
+            json.dump({"summary": self.summary(), "samples": list(self.samples)}, f, indent=2)
+
+
+## One recorder for the whole app; every calculator reports to it
+recorder = LatencyRecorder()
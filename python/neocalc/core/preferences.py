@@ -0,0 +1,52 @@
+import os
+import logging
+
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+GROUP = "preferences"
+
+
+class Preferences:
+    """
+    User settings kept between runs, in a key file such as
+    ~/.config/neocalc/preferences.ini. Missing or unreadable values fall back
+    to the defaults the callers pass in.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = GLib.KeyFile()
+        try:
+            self._file.load_from_file(path, GLib.KeyFileFlags.NONE)
+        except GLib.Error:
+            ## First run, or a damaged file: start from the defaults
+            pass
+
+    def get_int(self, key: str, default: int) -> int:
+        try:
+            return self._file.get_integer(GROUP, key)
+        except GLib.Error:
+            return default
+
+    def get_string(self, key: str, default: str) -> str:
+        try:
+            return self._file.get_string(GROUP, key)
+        except GLib.Error:
+            return default
+
+    def set_int(self, key: str, value: int) -> None:
+        self._file.set_integer(GROUP, key, value)
+        self.save()
+
+    def set_string(self, key: str, value: str) -> None:
+        self._file.set_string(GROUP, key, value)
+        self.save()
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._file.save_to_file(self._path)
+        except (GLib.Error, OSError) as e:
+            logger.error(f"Failed to save preferences: {e}")
@@ -1,16 +1,28 @@
 import gi
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Gdk, Adw
+from gi.repository import Gtk, Gdk, Adw, Gio, GLib
 import os
 import shutil
 import logging
 
 logger = logging.getLogger(__name__)
 
+## Editors save in bursts (temp file, rename, chmod); reload once they are done
+RELOAD_DELAY_MS = 250
+
 class StyleManager:
     _base_provider = None
     _theme_provider = None
+    current_theme = "default"
+
+    ## Parsed providers by CSS path, so switching themes never re-reads a file
+    _providers = {}
+    ## Sorted theme names, rescanned only when the themes directory changes
+    _themes = None
+    _monitors = []
+    _changed_paths = set()
+    _reload_source = None
 
     ## Return the full path to the directory containing theme CSS files
     @staticmethod
@@ -19,9 +31,20 @@ class StyleManager:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         return os.path.join(base_dir, "themes")
 
+    @staticmethod
+    def _get_base_path():
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "base.css")
+
+    @staticmethod
+    def _get_theme_path(theme_name):
+        return os.path.join(StyleManager._get_themes_dir(), f"{theme_name}.css")
+
     @staticmethod
     def get_available_themes():
         """Returns a list of available theme names (filenames without extension)."""
+        if StyleManager._themes is not None:
+            return list(StyleManager._themes)
+
         themes_dir = StyleManager._get_themes_dir()
         if not os.path.exists(themes_dir):
             return []
@@ -36,66 +59,127 @@ class StyleManager:
             logger.error(f"Failed to list themes: {e}")
             return []
 
+        ## Only trust the cache while a monitor keeps it current
+        if StyleManager._monitors:
+            StyleManager._themes = sorted(themes)
         return sorted(themes)
 
     @staticmethod
-    def _load_css_provider(display, path, priority):
-        """Helper to create, load, and attach a CSS provider."""
-        provider = Gtk.CssProvider()
-        try:
-            ## Load CSS file data into a new provider
-            provider.load_from_path(path)
-            ## Attach the provider to the display with specified priority
-            Gtk.StyleContext.add_provider_for_display(
-                display,
-                provider,
-                priority
-            )
-            return provider
-        except Exception as e:
-            logger.error(f"Failed to load CSS from {path}: {e}")
-            return None
+    def _get_provider(path):
+        """Returns the parsed provider for a CSS file, loading it on first use."""
+        provider = StyleManager._providers.get(path)
+        if provider is None:
+            provider = Gtk.CssProvider()
+            try:
+                provider.load_from_path(path)
+            except Exception as e:
+                logger.error(f"Failed to load CSS from {path}: {e}")
+                return None
+            StyleManager._providers[path] = provider
+        return provider
 
     @staticmethod
     def load_css(theme_name=None):
         """
-        Ensures base.css is loaded, and optionally loads a theme CSS on top.
-        Always reloads base to ensure cascade order is preserved.
+        Ensures base.css is loaded, and swaps the theme provider on top of it.
+        Both stay parsed, so switching back and forth costs no file reads.
         """
         display = Gdk.Display.get_default()
-        base_dir = os.path.dirname(os.path.abspath(__file__))
+        StyleManager._start_monitoring()
+
+        ## The base styles are attached once and stay
+        if StyleManager._base_provider is None:
+            StyleManager._base_provider = StyleManager._get_provider(StyleManager._get_base_path())
+            if StyleManager._base_provider:
+                Gtk.StyleContext.add_provider_for_display(
+                    display,
+                    StyleManager._base_provider,
+                    Gtk.STYLE_PROVIDER_PRIORITY_USER
+                )
+
+        provider = None
+        if theme_name and theme_name != 'default':
+            provider = StyleManager._get_provider(StyleManager._get_theme_path(theme_name))
+        if provider is StyleManager._theme_provider:
+            StyleManager.current_theme = theme_name or "default"
+            return
 
-        ## Clear any previously loaded custom theme provider
+        ## Swap the theme provider; it has the higher priority
         if StyleManager._theme_provider:
             Gtk.StyleContext.remove_provider_for_display(
                 display,
                 StyleManager._theme_provider
             )
-            StyleManager._theme_provider = None
-
-        if StyleManager._base_provider:
-             Gtk.StyleContext.remove_provider_for_display(
-                 display,
-                 StyleManager._base_provider
-             )
-             StyleManager._base_provider = None
-
-        ## Load the base styles (always required)
-        base_path = os.path.join(base_dir, "base.css")
-        StyleManager._base_provider = StyleManager._load_css_provider(
-            display,
-            base_path,
-            Gtk.STYLE_PROVIDER_PRIORITY_USER
-        )
-
-        ## If a theme is selected, load it on top with higher priority
-        if theme_name and theme_name != 'default':
-            theme_path = os.path.join(base_dir, "themes", f"{theme_name}.css")
-            StyleManager._theme_provider = StyleManager._load_css_provider(
+        StyleManager._theme_provider = provider
+        if provider:
+            Gtk.StyleContext.add_provider_for_display(
                 display,
-                theme_path,
+                provider,
                 Gtk.STYLE_PROVIDER_PRIORITY_USER + 1
             )
+        StyleManager.current_theme = theme_name if provider else "default"
+
+    @staticmethod
+    def apply_theme(theme_name):
+        StyleManager.load_css(theme_name)
+
+    @staticmethod
+    def _start_monitoring():
+        """Watch base.css and the themes directory for edits, once."""
+        if StyleManager._monitors:
+            return
+        paths = [(StyleManager._get_base_path(), False), (StyleManager._get_themes_dir(), True)]
+        for path, is_dir in paths:
+            if not os.path.exists(path):
+                continue
+            gfile = Gio.File.new_for_path(path)
+            try:
+                if is_dir:
+                    monitor = gfile.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+                else:
+                    monitor = gfile.monitor_file(Gio.FileMonitorFlags.NONE, None)
+            except GLib.Error as e:
+                logger.warning(f"Cannot watch {path} for theme changes: {e}")
+                continue
+            monitor.connect("changed", StyleManager._on_file_changed)
+            StyleManager._monitors.append(monitor)
+
+    @staticmethod
+    def _on_file_changed(monitor, file, other_file, event_type):
+        for f in (file, other_file):
+            path = f.get_path() if f else None
+            if path and path.endswith(".css"):
+                StyleManager._changed_paths.add(path)
+        if event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.DELETED,
+                          Gio.FileMonitorEvent.MOVED_IN, Gio.FileMonitorEvent.MOVED_OUT,
+                          Gio.FileMonitorEvent.RENAMED):
+            StyleManager._themes = None
+
+        ## Restart the delay on every event, so a burst ends in one reload
+        if StyleManager._reload_source:
+            GLib.source_remove(StyleManager._reload_source)
+        StyleManager._reload_source = GLib.timeout_add(RELOAD_DELAY_MS, StyleManager._reload_changed)
+
+    @staticmethod
+    def _reload_changed():
+        StyleManager._reload_source = None
+        changed, StyleManager._changed_paths = StyleManager._changed_paths, set()
+        active = (StyleManager._base_provider, StyleManager._theme_provider)
+        for path in changed:
+            provider = StyleManager._providers.get(path)
+            if provider is None:
+                continue
+            if provider in active and os.path.exists(path):
+                ## Reparsing in place restyles once, without a remove/add pair
+                logger.info(f"Reloading {os.path.basename(path)}")
+                try:
+                    provider.load_from_path(path)
+                except Exception as e:
+                    logger.error(f"Failed to reload CSS from {path}: {e}")
+            elif provider not in active:
+                ## Not shown now; parse it again when it is next selected
+                del StyleManager._providers[path]
+        return GLib.SOURCE_REMOVE
 
     @staticmethod
     def toggle_theme():
@@ -0,0 +1,91 @@
+import gi
+gi.require_version("Gtk", "4.0")
+from gi.repository import Gtk, GObject, Pango
+
+class BasePanel(Gtk.Box):
+    """
+    Word size selector plus a live readout of the current value
+    in hexadecimal, decimal, octal and binary.
+    """
+
+    __gsignals__ = {
+        'word-size-changed': (GObject.SignalFlags.RUN_FIRST, None, ()),
+    }
+
+    WORD_SIZES = [8, 16, 32, 64, 128]
+    DEFAULT_WORD_SIZE = 64
+
+    BASES = [
+        ("hex", "HEX"),
+        ("dec", "DEC"),
+        ("oct", "OCT"),
+        ("bin", "BIN"),
+    ]
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=2, **kwargs)
+        self.add_css_class("calc-base-panel")
+        self._restoring = False
+        self.set_margin_bottom(6)
+
+        controls = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+
+        self.size_dropdown = Gtk.DropDown.new_from_strings(
+            [f"{bits}-bit" for bits in self.WORD_SIZES]
+        )
+        self.size_dropdown.set_selected(self.WORD_SIZES.index(self.DEFAULT_WORD_SIZE))
+        self.size_dropdown.set_focusable(False)
+        self.size_dropdown.connect("notify::selected", self._on_size_changed)
+        controls.append(self.size_dropdown)
+
+        self.signed_check = Gtk.CheckButton(label=_("Signed"))
+        self.signed_check.set_active(True)
+        self.signed_check.set_focusable(False)
+        self.signed_check.connect("toggled", self._on_size_changed)
+        controls.append(self.signed_check)
+
+        self.append(controls)
+
+        ## One row per base: short name on the left, value on the right
+        self.value_labels = {}
+        for key, title in self.BASES:
+            row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+
+            name_lbl = Gtk.Label(label=title)
+            name_lbl.add_css_class("dim-label")
+            name_lbl.set_xalign(0)
+            row.append(name_lbl)
+
+            value_lbl = Gtk.Label(label="0")
+            value_lbl.add_css_class("calc-base-value")
+            value_lbl.set_hexpand(True)
+            value_lbl.set_xalign(1.0)
+            value_lbl.set_selectable(True)
+            value_lbl.set_wrap(True)
+            value_lbl.set_wrap_mode(Pango.WrapMode.CHAR)
+            row.append(value_lbl)
+
+            self.value_labels[key] = value_lbl
+            self.append(row)
+
+    def get_word_size(self):
+        """Return (bits, signed) for the current selection."""
+        return self.WORD_SIZES[self.size_dropdown.get_selected()], self.signed_check.get_active()
+
+    def set_word_size(self, bits, signed):
+        """Select a word size without emitting word-size-changed."""
+        if bits not in self.WORD_SIZES:
+            return
+        self._restoring = True
+        self.size_dropdown.set_selected(self.WORD_SIZES.index(bits))
+        self.signed_check.set_active(signed)
+        self._restoring = False
+
+    def set_values(self, values):
+        """Show a dict with hex/dec/oct/bin keys; missing keys are blanked."""
+        for key, label in self.value_labels.items():
+            label.set_text(values.get(key, "") if values else "")
+
+    def _on_size_changed(self, *args):
+        if not self._restoring:
+            self.emit('word-size-changed')
@@ -2,6 +2,8 @@ import gi
 gi.require_version("Gtk", "4.0")
 from gi.repository import Gtk, GObject
 
+from ...core.latency import recorder
+
 class CalculatorDisplay(Gtk.Box):
     """
     A widget acting as the calculator's display.
@@ -21,6 +23,9 @@ class CalculatorDisplay(Gtk.Box):
         "√": "sqrt(",
     }
 
+    ## Most recent history entries shown above the entry
+    HISTORY_ROWS = 10
+
     AUTO_PAREN_FUNCTIONS = {
         "sin", "cos", "tan", "asin", "acos", "atan",
         "sinh", "cosh", "tanh", "log", "ln", "sqrt", "abs"
@@ -87,13 +92,27 @@ class CalculatorDisplay(Gtk.Box):
 
         if history_list:
             ## Show recent items
-            for item_text in history_list[-10:]:
-                row = Gtk.ListBoxRow()
-                label = Gtk.Label(label=item_text)
-                label.set_xalign(1.0)
-                label.add_css_class("calc-history-item")
-                row.set_child(label)
-                self.history_list.append(row)
+            for item_text in history_list[-self.HISTORY_ROWS:]:
+                self.history_list.append(self._history_row(item_text))
+
+    def append_history(self, item_text):
+        """Add one history entry, dropping the oldest row past the limit."""
+        self.history_list.append(self._history_row(item_text))
+        count = 0
+        child = self.history_list.get_first_child()
+        while child:
+            count += 1
+            child = child.get_next_sibling()
+        if count > self.HISTORY_ROWS:
+            self.history_list.remove(self.history_list.get_first_child())
+
+    def _history_row(self, item_text):
+        row = Gtk.ListBoxRow()
+        label = Gtk.Label(label=item_text)
+        label.set_xalign(1.0)
+        label.add_css_class("calc-history-item")
+        row.set_child(label)
+        return row
     
     def _on_history_row_activated(self, box, row):
         """Handle history item click."""
@@ -169,6 +188,8 @@ class CalculatorDisplay(Gtk.Box):
     def _on_entry_changed(self, entry):
         if self._internal_update:
             return
+        ## Typed straight into the entry, so this is where the input starts
+        recorder.begin("entry")
         self.emit('user-edited', entry.get_text())
 
     def _on_entry_activate(self, entry):
@@ -78,6 +78,13 @@ class HeaderView(Adw.Bin):
         self.vars_list = Gtk.ListBox()
         self.vars_list.set_selection_mode(Gtk.SelectionMode.NONE)
         self.vars_list.add_css_class("rich-list")
+        self.vars_list.set_sort_func(self._sort_variable_rows)
+
+        ## Rows by name, and which calculator/version they reflect
+        self._var_rows = {}
+        self._vars_source = None
+        self._vars_version = 0
+        self._vars_placeholder = None
         
         scroll = Gtk.ScrolledWindow()
         scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
@@ -100,47 +107,82 @@ class HeaderView(Adw.Bin):
             self.refresh_variables()
 
     def refresh_variables(self):
-        """Populate variables list."""
-        ## Clear list
-        while True:
-            child = self.vars_list.get_first_child()
-            if not child: break
-            self.vars_list.remove(child)
-
+        """Update the variables list with what changed since the last refresh."""
         ## Get active calculator
         page = self.main_window.tab_view.get_selected_page()
         if not page or not hasattr(page, 'calc_widget'):
+            self._clear_variable_rows()
+            self._vars_source = None
             self._add_placeholder(_("No active calculator"))
             return
 
         calc_widget = page.calc_widget
-        variables = calc_widget.get_variables()
-
-        if not variables:
-            self._add_placeholder(_("No variables defined"))
+        same_source = calc_widget is self._vars_source
+        changes = calc_widget.get_variable_changes(self._vars_version if same_source else 0)
+        if changes is None:
             return
 
-        for name, value in sorted(variables.items()):
-            row = Gtk.ListBoxRow()
-            box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
-            box.set_margin_start(12)
-            box.set_margin_end(12)
-            box.set_margin_top(8)
-            box.set_margin_bottom(8)
+        ## Another tab, or too far behind for the change log: start over
+        if not same_source or changes["complete"]:
+            self._clear_variable_rows()
+            self._vars_source = calc_widget
+
+        for name in changes["removed"]:
+            row = self._var_rows.pop(name, None)
+            if row:
+                self.vars_list.remove(row[0])
+
+        for name, value in changes["changed"].items():
+            if name in self._var_rows:
+                self._var_rows[name][1].set_label(value)
+            else:
+                self._add_variable_row(name, value)
 
-            name_lbl = Gtk.Label(label=name)
-            name_lbl.add_css_class("heading")
-            name_lbl.set_hexpand(True)
-            name_lbl.set_xalign(0)
+        self._vars_version = changes["version"]
 
-            val_lbl = Gtk.Label(label=value)
-            val_lbl.add_css_class("dim-label")
-            val_lbl.set_xalign(1)
+        if not self._var_rows:
+            if not self._vars_placeholder:
+                self._add_placeholder(_("No variables defined"))
+        elif self._vars_placeholder:
+            self.vars_list.remove(self._vars_placeholder)
+            self._vars_placeholder = None
 
-            box.append(name_lbl)
-            box.append(val_lbl)
-            row.set_child(box)
-            self.vars_list.append(row)
+    def _clear_variable_rows(self):
+        while True:
+            child = self.vars_list.get_first_child()
+            if not child: break
+            self.vars_list.remove(child)
+        self._var_rows = {}
+        self._vars_placeholder = None
+
+    def _sort_variable_rows(self, a, b):
+        name_a = getattr(a, "var_name", "")
+        name_b = getattr(b, "var_name", "")
+        return (name_a > name_b) - (name_a < name_b)
+
+    def _add_variable_row(self, name, value):
+        row = Gtk.ListBoxRow()
+        row.var_name = name
+        box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+        box.set_margin_start(12)
+        box.set_margin_end(12)
+        box.set_margin_top(8)
+        box.set_margin_bottom(8)
+
+        name_lbl = Gtk.Label(label=name)
+        name_lbl.add_css_class("heading")
+        name_lbl.set_hexpand(True)
+        name_lbl.set_xalign(0)
+
+        val_lbl = Gtk.Label(label=value)
+        val_lbl.add_css_class("dim-label")
+        val_lbl.set_xalign(1)
+
+        box.append(name_lbl)
+        box.append(val_lbl)
+        row.set_child(box)
+        self.vars_list.append(row)
+        self._var_rows[name] = (row, val_lbl)
 
     def _add_placeholder(self, text):
         row = Gtk.ListBoxRow()
@@ -150,5 +192,6 @@ class HeaderView(Adw.Bin):
         lbl.add_css_class("dim-label")
         row.set_child(lbl)
         self.vars_list.append(row)
+        self._vars_placeholder = row
 
 
@@ -0,0 +1,78 @@
+import gi
+gi.require_version("Gtk", "4.0")
+from gi.repository import Gtk, GLib
+import logging
+
+from ...core.latency import recorder
+
+logger = logging.getLogger(__name__)
+
+## Stages in the order an input goes through them
+STAGE_ORDER = ["insert", "edited", "set_expression", "changed", "preview", "paint"]
+
+
+class LatencyOverlay(Gtk.Label):
+    """
+    Debug readout of input-to-pixel latency percentiles, drawn over the window.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.add_css_class("osd")
+        self.add_css_class("monospace")
+        self.set_halign(Gtk.Align.END)
+        self.set_valign(Gtk.Align.END)
+        self.set_margin_end(12)
+        self.set_margin_bottom(12)
+        self.set_xalign(0.0)
+        ## Never steal clicks from the keypad underneath
+        self.set_can_target(False)
+        self.set_visible(False)
+        self._timer = None
+
+    def toggle(self):
+        """Show or hide the overlay; recording runs only while it is shown."""
+        shown = not self.get_visible()
+        recorder.set_enabled(shown)
+        self.set_visible(shown)
+        if shown:
+            recorder.reset()
+            self.refresh()
+            self._timer = GLib.timeout_add(500, self.refresh)
+        elif self._timer:
+            GLib.source_remove(self._timer)
+            self._timer = None
+
+    def refresh(self):
+        summary = recorder.summary()
+        total = summary["total"]
+        lines = [f"input→paint  n={total['count']}", "stage          p50    p90    p99 ms"]
+        rows = [("total", total)]
+        stages = summary["stages"]
+        rows += [(name, stages[name]) for name in STAGE_ORDER if name in stages]
+        for name, s in rows:
+            lines.append(f"{name:<13}{s['p50']:>6.2f} {s['p90']:>6.2f} {s['p99']:>6.2f}")
+        self.set_text("\n".join(lines))
+        return self.get_visible()
+
+    def export(self, parent_window):
+        """Asks for a file and writes the recorded samples to it as JSON."""
+        dialog = Gtk.FileChooserNative(
+            title=_("Export Latency"),
+            transient_for=parent_window,
+            action=Gtk.FileChooserAction.SAVE
+        )
+        dialog.set_current_name("neocalc-latency.json")
+
+        def on_response(dialog, response):
+            if response == Gtk.ResponseType.ACCEPT:
+                path = dialog.get_file().get_path()
+                try:
+                    recorder.export(path)
+                    logger.info(f"Exported latency samples to {path}")
+                except OSError as e:
+                    logger.error(f"Failed to export latency samples: {e}")
+            dialog.destroy()
+
+        dialog.connect("response", on_response)
+        dialog.show()
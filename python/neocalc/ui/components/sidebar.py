@@ -1,7 +1,28 @@
 import gi
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Adw
+from gi.repository import Gtk, Adw, Gio, GObject
+
+
+class CalculatorItem(GObject.Object):
+    """
+    One calculator in the sidebar. Rows are recycled by the list view, so all a
+    row shows is bound to these properties.
+    """
+
+    title = GObject.Property(type=str, default="")
+    preview = GObject.Property(type=str, default="0")
+    calc_number = GObject.Property(type=int, default=0)
+
+    def __init__(self, title, name, calc_widget, number):
+        super().__init__(title=title, calc_number=number)
+        self.calc_name = name
+        self.calc_widget = calc_widget
+
+    def show_expression(self, text):
+        """Used as the widget's on_expression_changed callback."""
+        self.preview = text or "0"
+
 
 class SidebarView(Adw.NavigationPage):
     """Handles the sidebar visualization and interaction logic."""
@@ -28,10 +49,20 @@ class SidebarView(Adw.NavigationPage):
 
         toolbar_view.add_top_bar(sidebar_header)
 
-        self.sidebar_list = Gtk.ListBox()
-        self.sidebar_list.set_selection_mode(Gtk.SelectionMode.SINGLE)
+        ## Only the visible rows exist; they are rebound as the list scrolls
+        self.store = Gio.ListStore(item_type=CalculatorItem)
+        self.selection = Gtk.SingleSelection(model=self.store)
+        self.selection.set_autoselect(False)
+        self.selection.set_can_unselect(True)
+        self.selection.connect("notify::selected-item", self._on_selected_item_changed)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self._on_setup_row)
+        factory.connect("bind", self._on_bind_row)
+        factory.connect("unbind", self._on_unbind_row)
+
+        self.sidebar_list = Gtk.ListView(model=self.selection, factory=factory)
         self.sidebar_list.add_css_class("sidebar-list")
-        self.sidebar_list.connect("row-selected", self.main_window.on_sidebar_row_selected)
 
         scrolled = Gtk.ScrolledWindow()
         scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
@@ -41,13 +72,104 @@ class SidebarView(Adw.NavigationPage):
         toolbar_view.set_content(scrolled)
         self.set_child(toolbar_view)
 
-    def add_row(self, row):
-        """Add a row to the sidebar list."""
-        self.sidebar_list.append(row)
+    def _on_setup_row(self, factory, list_item):
+        row_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        row_box.set_margin_start(4)
+        row_box.set_margin_end(4)
+        row_box.set_margin_top(4)
+        row_box.set_margin_bottom(4)
+
+        header_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=4)
+
+        title_label = Gtk.Label(xalign=0.0, hexpand=True)
+        title_label.add_css_class("heading")
+        header_box.append(title_label)
+
+        close_btn = Gtk.Button(icon_name="window-close-symbolic")
+        close_btn.add_css_class("flat")
+        close_btn.add_css_class("circular")
+        close_btn.set_tooltip_text("Close Calculation")
+        ## Looks the item up on click, so the handler survives recycling
+        close_btn.connect("clicked", self._on_close_clicked, list_item)
+        header_box.append(close_btn)
+        row_box.append(header_box)
+
+        preview_label = Gtk.Label(xalign=1.0, wrap=True, max_width_chars=20)
+        preview_label.add_css_class("calc-preview")
+        row_box.append(preview_label)
+
+        list_item.set_child(row_box)
+        list_item.labels = (title_label, preview_label)
+
+    def _on_bind_row(self, factory, list_item):
+        item = list_item.get_item()
+        title_label, preview_label = list_item.labels
+        flags = GObject.BindingFlags.SYNC_CREATE
+        list_item.bindings = (
+            item.bind_property("title", title_label, "label", flags),
+            item.bind_property("preview", preview_label, "label", flags),
+        )
+
+    def _on_unbind_row(self, factory, list_item):
+        for binding in getattr(list_item, "bindings", ()):
+            binding.unbind()
+        list_item.bindings = ()
+
+    def _on_close_clicked(self, button, list_item):
+        item = list_item.get_item()
+        if item is not None:
+            self.main_window.calc_manager.on_close_calculator_from_sidebar(item.calc_widget)
+
+    def _on_selected_item_changed(self, selection, param):
+        self.main_window.on_sidebar_row_selected(self.sidebar_list, selection.get_selected_item())
+
+    def add_item(self, title, name, calc_widget, number):
+        """Add a calculator to the sidebar and return its item."""
+        item = CalculatorItem(title, name, calc_widget, number)
+        calc_widget.sidebar_item = item
+        self.store.append(item)
+        return item
+
+    def add_items(self, entries):
+        """
+        Add (title, name, calc_widget, number) entries with a single model
+        change and return their items.
+        """
+        items = []
+        for title, name, calc_widget, number in entries:
+            item = CalculatorItem(title, name, calc_widget, number)
+            calc_widget.sidebar_item = item
+            items.append(item)
+        self.store.splice(self.store.get_n_items(), 0, items)
+        return items
+
+    def remove_item(self, item):
+        found, position = self.store.find(item)
+        if found:
+            self.store.remove(position)
+
+    def remove_items(self, items):
+        """
+        Remove many items, one model change per contiguous run so the
+        selection of the items that stay is kept.
+        """
+        gone = set(items)
+        positions = [i for i, item in enumerate(self.store) if item in gone]
+        while positions:
+            end = positions.pop()
+            start = end
+            while positions and positions[-1] == start - 1:
+                start = positions.pop()
+            self.store.splice(start, end - start + 1, [])
+
+    def find_item(self, calc_widget):
+        return getattr(calc_widget, "sidebar_item", None)
 
-    def select_row(self, row):
-        """Select a specific row."""
-        self.sidebar_list.select_row(row)
+    def select_item(self, item):
+        """Select a specific item."""
+        found, position = self.store.find(item)
+        if found and self.selection.get_selected() != position:
+            self.selection.set_selected(position)
 
-    def get_first_row(self):
-        return self.sidebar_list.get_first_child()
+    def get_selected_item(self):
+        return self.selection.get_selected_item()
@@ -64,12 +64,33 @@ class PreferencesDialog(Adw.PreferencesWindow):
         icon = Gtk.Image(icon_name="document-open-symbolic")
         import_row.add_suffix(icon)
 
+        tabs_page = Adw.PreferencesPage()
+        tabs_page.set_title(_("Tabs"))
+        tabs_page.set_icon_name("tab-new-symbolic")
+        self.add(tabs_page)
+
+        tabs_group = Adw.PreferencesGroup()
+        tabs_group.set_title(_("Inactive Tabs"))
+        tabs_group.set_description(_("Hidden tabs free their buttons and history after a while. Their calculations are kept."))
+        tabs_page.add(tabs_group)
+
+        ## Minutes before a hidden tab hibernates; 0 keeps every tab built
+        self.hibernate_row = Adw.SpinRow.new_with_range(0, 240, 1)
+        self.hibernate_row.set_title(_("Hibernate After"))
+        self.hibernate_row.set_subtitle(_("Minutes, 0 to never hibernate"))
+        self.hibernate_row.set_value(getattr(self.get_transient_for(), "hibernate_after", 0) // 60)
+        self.hibernate_row.connect("notify::value", self.on_hibernate_changed)
+        tabs_group.add(self.hibernate_row)
+
     def on_theme_changed(self, row, param):
         index = row.get_selected()
         if index < len(self.theme_map):
             theme_id = self.theme_map[index]
             self.get_transient_for().set_theme(theme_id)
 
+    def on_hibernate_changed(self, row, param):
+        self.get_transient_for().set_hibernate_after(int(row.get_value()) * 60)
+
     def on_import_clicked(self, row):
         parent = self.get_transient_for()
         if hasattr(parent, 'import_theme'):
@@ -52,6 +52,18 @@ def show_shortcuts_dialog(parent_window):
                 <property name="accelerator">&lt;Control&gt;h</property>
               </object>
             </child>
+            <child>
+              <object class="GtkShortcutsShortcut">
+                <property name="title" translatable="yes">Toggle Latency Overlay</property>
+                <property name="accelerator">&lt;Control&gt;&lt;Shift&gt;l</property>
+              </object>
+            </child>
+            <child>
+              <object class="GtkShortcutsShortcut">
+                <property name="title" translatable="yes">Export Latency Samples</property>
+                <property name="accelerator">&lt;Control&gt;&lt;Shift&gt;e</property>
+              </object>
+            </child>
           </object>
         </child>
       </object>
@@ -6,6 +6,8 @@ from typing import Callable, List, Optional
 
 from gi.repository import Gtk
 
+from ...core.latency import recorder
+
 
 @dataclass
 class GridButton:
@@ -62,19 +64,17 @@ class CalculatorGrid(Gtk.Grid):
 
     def on_button_clicked(self, button):
         """Handle standard digit and operator clicks."""
+        recorder.begin("click")
         self.calculator.insert_at_cursor(button.get_label())
 
     def on_equal_clicked(self, button):
         """Handle evaluation."""
+        if hasattr(self.calculator, "flush_edits"):
+            self.calculator.flush_edits()
+
         if self.calculator.logic:
+            ## The display, history and tab name follow from the changes it reports
             self.calculator.logic.evaluate()
-            self.calculator.update_display()
-
-        if hasattr(self.calculator, "update_history_display"):
-            self.calculator.update_history_display()
-
-        if hasattr(self.calculator, "trigger_name_update"):
-            self.calculator.trigger_name_update()
 
     def on_clear_clicked(self, button):
         """Handle clear action."""
@@ -85,17 +85,21 @@ class CalculatorGrid(Gtk.Grid):
     def on_backspace_clicked(self, button):
         """Handle backspace action."""
         if hasattr(self.calculator, "backspace_at_cursor"):
+            recorder.begin("click")
             self.calculator.backspace_at_cursor()
 
     def on_func_clicked(self, button):
         """Handle scientific function clicks."""
         text = getattr(button, "insert_text", button.get_label())
+        recorder.begin("click")
         self.calculator.insert_at_cursor(text)
 
     def on_convert_clicked(self, button):
         """Handle base conversion."""
         label = button.get_label()
         new_val = None
+        if hasattr(self.calculator, "flush_edits"):
+            self.calculator.flush_edits()
         if label == "Hex":
             new_val = self.calculator.logic.convert_to_hex()
         elif label == "Bin":
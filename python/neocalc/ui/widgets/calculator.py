@@ -5,6 +5,8 @@ gi.require_version("Adw", "1")
 from gi.repository import Adw, GLib, Gtk
 
 from ...core.backend import CalculatorLogic
+from ...core.latency import recorder
+from ..components.base_panel import BasePanel
 from ..components.display import CalculatorDisplay
 from ..grids.financial import FinancialGrid
 from ..grids.programming import ProgrammingGrid
@@ -13,14 +15,19 @@ from ..grids.standard import ButtonGrid
 
 
 class CalculatorWidget(Gtk.Box):
-    def __init__(self, **kwargs):
+    def __init__(self, calculator=None, mode=None, **kwargs):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=0, **kwargs)
 
         self.parent_window = None
-        self.logic = CalculatorLogic()
+        ## A restored session passes its backend calculator and keypad mode in
+        self.logic = CalculatorLogic(calculator)
+        self._mode = mode or "standard"
 
         self.on_expression_changed = None
-        GLib.idle_add(self.update_display)
+        ## Restored tabs show their state when they are first mapped
+        self._needs_display = calculator is not None
+        if not self._needs_display:
+            GLib.idle_add(self.update_display)
 
         key_controller = Gtk.EventControllerKey()
         key_controller.connect("key-pressed", self.on_key_pressed)
@@ -30,37 +37,72 @@ class CalculatorWidget(Gtk.Box):
         self.display.connect("user-edited", self.on_display_edited)
         self.display.connect("activated", self.on_display_activated)
 
-        main_content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
+        self.main_content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
 
-        main_content.set_margin_start(8)
-        main_content.set_margin_end(8)
-        main_content.set_margin_top(8)
-        main_content.set_margin_bottom(8)
+        self.main_content.set_margin_start(8)
+        self.main_content.set_margin_end(8)
+        self.main_content.set_margin_top(8)
+        self.main_content.set_margin_bottom(8)
 
-        grid_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
+        ## The keypads are built on first map (see _ensure_keypad) and dropped by hibernate()
+        self.grid_box = None
+        self.view_stack = None
+        self.base_panel = None
+        self._unmapped_at = GLib.get_monotonic_time()
+
+        self.append(self.main_content)
+        self.set_vexpand(True)
+
+        self.set_focusable(True)
+
+        ## Edits are applied once per frame with the latest text (see on_display_edited)
+        self._pending_text = None
+        self._edit_tick = None
+        ## Work skipped while it could not be seen, done when it can
+        self._deferred_name = None
+        self._stale_preview = False
+        ## Versions last seen from the backend, to skip refreshes when nothing changed
+        self._history_version = None
+        self._vars_version = 0
+        ## Evaluations report what they changed (see _on_backend_changes)
+        self.logic.connect_changes(self._on_backend_changes)
+        self.connect("map", self._on_map)
+        self.connect("unmap", self._on_unmap)
+
+    def _ensure_keypad(self):
+        """Build the four keypads. Tabs that are never shown never pay for them."""
+        if self.view_stack is not None:
+            return
+        self.grid_box = grid_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
         grid_box.set_hexpand(True)
         grid_box.set_vexpand(True)
-        main_content.append(grid_box)
+        self.main_content.append(grid_box)
 
         self.view_stack = Adw.ViewStack()
 
-        from ..grids.standard import ButtonGrid
-
         button_grid = ButtonGrid(self)
         self.view_stack.add_titled(button_grid, "standard", "Standard")
         self.view_stack.get_page(button_grid).set_icon_name("view-grid-symbolic")
 
-        from ..grids.scientific import ScientificGrid
-
         scientific_grid = ScientificGrid(self)
         self.view_stack.add_titled(scientific_grid, "scientific", "Scientific")
         self.view_stack.get_page(scientific_grid).set_icon_name(
             "applications-science-symbolic"
         )
 
+        ## Programming mode shows the word size and every base above the keypad
+        self.base_panel = BasePanel()
+        word_size = self.logic.get_word_size()
+        if word_size:
+            self.base_panel.set_word_size(*word_size)
+        self.base_panel.connect("word-size-changed", self.on_word_size_changed)
+
         programming_grid = ProgrammingGrid(self)
-        self.view_stack.add_titled(programming_grid, "programming", "Programming")
-        self.view_stack.get_page(programming_grid).set_icon_name(
+        programming_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
+        programming_box.append(self.base_panel)
+        programming_box.append(programming_grid)
+        self.view_stack.add_titled(programming_box, "programming", "Programming")
+        self.view_stack.get_page(programming_box).set_icon_name(
             "applications-engineering-symbolic"
         )
 
@@ -68,18 +110,62 @@ class CalculatorWidget(Gtk.Box):
         self.view_stack.add_titled(financial_grid, "financial", "Financial")
         self.view_stack.get_page(financial_grid).set_icon_name("money-symbolic")
 
+        ## Before connecting, so a restored word size is not reset to the panel's
+        self.view_stack.set_visible_child_name(self._mode)
+        self.view_stack.connect("notify::visible-child-name", self.on_mode_changed)
         grid_box.append(self.view_stack)
 
-        self.append(main_content)
-        self.set_vexpand(True)
-
-        self.set_focusable(True)
-
-        self.on_expression_changed = None
+    def hibernate(self):
+        """
+        Drop the keypads and history rows of a tab that is not shown. The
+        backend calculator keeps every bit of state; the next map rebuilds
+        the widgets from it.
+        """
+        if self.get_mapped() or self.view_stack is None:
+            return False
+        self.flush_edits()
+        self._mode = self.view_stack.get_visible_child_name()
+        self.main_content.remove(self.grid_box)
+        self.grid_box = None
+        self.view_stack = None
+        self.base_panel = None
+
+        self.display.set_history([])
+        ## The header keeps a display per visited tab; let go of this one
+        parent = self.display.get_parent()
+        if parent is not None and parent.get_visible_child() is not self.display:
+            parent.remove(self.display)
+        self._history_version = None
+        self._needs_display = True
+        return True
+
+    def is_hibernated(self):
+        return self.view_stack is None
+
+    def idle_seconds(self):
+        """How long the tab has been hidden; 0 while it is shown."""
+        if self.get_mapped():
+            return 0
+        return (GLib.get_monotonic_time() - self._unmapped_at) / 1e6
+
+    def _on_unmap(self, widget):
+        self._unmapped_at = GLib.get_monotonic_time()
+        self.flush_edits()
 
     def get_stack(self):
+        self._ensure_keypad()
         return self.view_stack
 
+    def get_mode(self):
+        """Name of the keypad shown, even before it is built."""
+        if self.view_stack is None:
+            return self._mode
+        return self.view_stack.get_visible_child_name()
+
+    def sync_sidebar(self):
+        """Show the backend buffer in the sidebar row without touching the display."""
+        self._notify_expression_changed(self.logic.get_buffer())
+
     def get_display_widget(self):
         """Return the display widget to be placed in the header/stack."""
         self.update_history_display()
@@ -90,36 +176,141 @@ class CalculatorWidget(Gtk.Box):
         history = self.logic.get_history()
         self.display.set_history(history)
 
-    def trigger_name_update(self):
-        """Trigger parent window to update calculator name"""
+    def trigger_name_update(self, entry=None):
+        """Trigger parent window to update calculator name, from entry if given"""
         if self.parent_window and hasattr(self.parent_window, "update_calculator_name"):
-            self.parent_window.update_calculator_name(self)
+            self.parent_window.update_calculator_name(self, entry)
 
     def get_expression(self):
+        self.flush_edits()
         return self.logic.get_buffer()
 
     def set_expression(self, text):
         """Called when logic updates (e.g. from buttons)"""
+        self._drop_pending_edit()
         self.display.set_value(text)
-        if self.on_expression_changed:
-            self.on_expression_changed(text)
+        self._notify_expression_changed(text)
         self.update_preview(text)
 
     def insert_at_cursor(self, text):
+        recorder.mark("insert")
         self.display.insert_at_cursor(text)
 
     def backspace_at_cursor(self):
         self.display.backspace_at_cursor()
 
     def update_display(self):
-        text = self.logic.get_buffer()
+        ## The backend buffer is authoritative now; an unsynced edit would overwrite it
+        self._drop_pending_edit()
+        state = self.logic.get_state(self._vars_version)
+        text = state["buffer"]
         self.display.set_value(text)
-        if self.on_expression_changed:
-            self.on_expression_changed(text)
-        self.update_preview(text)
+        self._notify_expression_changed(text)
+        self.update_base_panel(text)
+        self._apply_state(state)
+
+    def _apply_state(self, state):
+        """Show the preview from a backend state and follow its versions."""
+        self._show_preview(state["buffer"], state["preview"])
+        if state["history_version"] != self._history_version:
+            self._history_version = state["history_version"]
+            self.update_history_display()
+        variables = state["variables"]
+        self._vars_version = variables["version"]
+        if variables["changed"] or variables["removed"]:
+            self._on_variables_changed()
+
+    def _on_backend_changes(self, changes):
+        """Update from what an evaluation changed, without reading the state back."""
+        for kind, payload in changes:
+            if kind == "buffer":
+                if not self._needs_display:
+                    self.set_expression(payload)
+            elif kind == "history_appended":
+                version, entry = payload
+                self._on_history_appended(version, entry)
+            elif kind == "history":
+                if not self._needs_display and payload != self._history_version:
+                    self._history_version = payload
+                    self.update_history_display()
+            elif kind == "variables" and payload != self._vars_version:
+                self._vars_version = payload
+                self._on_variables_changed()
+
+    def _on_history_appended(self, version, entry):
+        ## A hidden tab rebuilds its display when shown; only its name follows now
+        if not self._needs_display:
+            if self._history_version is not None and version == self._history_version + 1:
+                self.display.append_history(entry)
+            else:
+                self.update_history_display()
+            self._history_version = version
+        self.trigger_name_update(entry)
+
+    def _on_variables_changed(self):
+        """Keep an open variables popover current."""
+        header = getattr(self.get_root(), "header_view", None)
+        if header is not None and header.vars_popover.get_visible():
+            header.refresh_variables()
+
+    def _notify_expression_changed(self, text):
+        """Update the sidebar label, or remember the text while the sidebar is hidden."""
+        if not self.on_expression_changed:
+            return
+        root = self.get_root()
+        split_view = getattr(root, "split_view", None)
+        if split_view is not None and not split_view.get_show_sidebar():
+            self._deferred_name = text
+            return
+        self._deferred_name = None
+        self.on_expression_changed(text)
+
+    def flush_sidebar_update(self):
+        """Called when the sidebar is shown again."""
+        if self._deferred_name is not None and self.on_expression_changed:
+            self.on_expression_changed(self._deferred_name)
+        self._deferred_name = None
+
+    def _on_map(self, widget):
+        self._ensure_keypad()
+        if self._needs_display:
+            self._needs_display = False
+            self.update_display()
+        elif self._stale_preview:
+            self._stale_preview = False
+            self.update_base_panel(self.display.get_text())
+
+    def is_programming_mode(self):
+        return self.get_mode() == "programming"
+
+    def on_mode_changed(self, stack, param):
+        """Fixed-width math only applies while the programming keypad is shown."""
+        self.on_word_size_changed(self.base_panel)
+
+    def on_word_size_changed(self, panel):
+        if self.is_programming_mode():
+            bits, signed = panel.get_word_size()
+            self.logic.set_word_size(bits, signed)
+        else:
+            self.logic.set_word_size(None)
+        self.update_preview(self.display.get_text())
+
+    def update_base_panel(self, text):
+        """Refresh the hex/dec/oct/bin readout."""
+        if not self.is_programming_mode():
+            return
+        if not self.get_mapped():
+            self._stale_preview = True
+            return
+        try:
+            self.base_panel.set_values(self.logic.preview_bases(text) if text else {})
+        except Exception:
+            self.base_panel.set_values({})
 
     def update_preview(self, text):
         """Calculate and show preview result."""
+        self.update_base_panel(text)
+
         if not text:
             self.display.set_preview("")
             return
@@ -131,16 +322,17 @@ class CalculatorWidget(Gtk.Box):
                 return
 
             # Use the new preview method from the backend which respects variables
-            result = self.logic.preview(text)
-
-            # If result is same as input (no calc happened), hide it
-            if result == text or result == "Error" or not result:
-                self.display.set_preview("")
-            else:
-                self.display.set_preview(result)
+            self._show_preview(text, self.logic.preview(text))
         except Exception:
             self.display.set_preview("")
 
+    def _show_preview(self, text, result):
+        # If result is same as input (no calc happened), hide it
+        if result == text or result == "Error" or not result:
+            self.display.set_preview("")
+        else:
+            self.display.set_preview(result)
+
     def get_variables(self):
         """Retrieve defined variables from the backend."""
         try:
@@ -148,22 +340,57 @@ class CalculatorWidget(Gtk.Box):
         except Exception:
             return {}
 
+    def get_variable_changes(self, since):
+        """Variables changed in the backend after version `since`."""
+        try:
+            return self.logic.get_variable_changes(since)
+        except Exception:
+            return None
+
     def on_display_edited(self, widget, text):
-        self.logic.set_expression(text)
-        if self.on_expression_changed:
-            self.on_expression_changed(text)
+        recorder.mark("edited")
+        ## Pasting or key repeat can edit many times per frame; only the last
+        ## text is sent to the backend, the sidebar and the preview
+        self._pending_text = text
+        if self._edit_tick is None:
+            self._edit_tick = self.add_tick_callback(self._on_edit_tick)
+
+    def _on_edit_tick(self, widget, frame_clock):
+        self._edit_tick = None
+        self.flush_edits()
+        return GLib.SOURCE_REMOVE
+
+    def flush_edits(self):
+        """Apply the pending edit now. Call before anything reads the backend buffer."""
+        if self._edit_tick is not None:
+            self.remove_tick_callback(self._edit_tick)
+            self._edit_tick = None
+        text = self._pending_text
+        if text is None:
+            return
+        self._pending_text = None
+
+        ## One backend call syncs the buffer and returns the preview and versions
+        state = self.logic.apply_edit(text, 0, None, self._vars_version)
+        recorder.mark("set_expression")
+        self._notify_expression_changed(text)
+        recorder.mark("changed")
+        self.update_base_panel(text)
+        self._apply_state(state)
+        recorder.mark("preview")
+        recorder.wait_for_paint(self.display.display_entry)
+
+    def _drop_pending_edit(self):
+        if self._edit_tick is not None:
+            self.remove_tick_callback(self._edit_tick)
+            self._edit_tick = None
+        self._pending_text = None
 
     def on_display_activated(self, widget):
+        self.flush_edits()
         ## Use non-blocking evaluation to keep UI responsive
-        self.logic.evaluate_non_blocking(
-            on_success=self._on_eval_success, on_error=self._on_eval_error
-        )
-
-    def _on_eval_success(self, result):
-        """Called when async evaluation completes successfully."""
-        self.update_display()
-        self.update_history_display()
-        self.trigger_name_update()
+        ## The display, history and tab name follow from the changes it reports
+        self.logic.evaluate_non_blocking(on_error=self._on_eval_error)
 
     def _on_eval_error(self, error_msg):
         """Called when async evaluation fails."""
@@ -180,17 +407,20 @@ class CalculatorWidget(Gtk.Box):
         from gi.repository import Gdk
 
         key_char = Gdk.keyval_to_unicode(keyval)
-        valid_chars = "0123456789.+-*/^%()abcdefABCDEFxb"
+        ## Brackets and commas type matrix literals such as [[1, 2], [3, 4]]
+        valid_chars = "0123456789.+-*/^%()[],abcdefABCDEFxb"
 
         if key_char:
             char = chr(key_char)
             if char in valid_chars or char.isalpha():
+                recorder.begin("key")
                 self.insert_at_cursor(char)
                 return True
 
         name = Gdk.keyval_name(keyval)
 
         if name == "BackSpace":
+            recorder.begin("key")
             self.backspace_at_cursor()
             return True
 
@@ -199,6 +429,7 @@ class CalculatorWidget(Gtk.Box):
             return True
 
         elif name == "Escape":
+            self.logic.cancel()
             self.logic.clear()
             self.update_display()
             return True
@@ -3,6 +3,7 @@ gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
 from gi.repository import Gtk, Adw, Gio, GLib, Gdk
 import os
+import logging
 
 from ..dialogs.about import present_about_dialog
 from ..widgets.calculator import CalculatorWidget
@@ -10,17 +11,32 @@ from ...styling.manager import StyleManager
 from ...core.actions import ActionRegistry
 from ..components.sidebar import SidebarView
 from ..components.header import HeaderView
-from ...core.backend import DisplayManager, CalculatorManager
+from ..components.latency_overlay import LatencyOverlay
+from ...core.backend import DisplayManager, CalculatorManager, SessionStore
+from ...core.preferences import Preferences
 from ..dialogs.preferences import PreferencesDialog
 
+logger = logging.getLogger(__name__)
+
+## Seconds between background session saves; unchanged sessions are not rewritten
+SESSION_SAVE_INTERVAL = 5
+
+## Hidden tabs drop their widgets after this many seconds (0: never).
+## The preferences dialog changes it, and NEOCALC_HIBERNATE_AFTER overrides both
+HIBERNATE_AFTER = 300
+HIBERNATE_CHECK_INTERVAL = 30
+
 class Calculator(Adw.ApplicationWindow):
-    def __init__(self, app):
+    def __init__(self, app, restore_session=True):
         super().__init__(application=app)
         self.set_title("NeoCalc")
         self.set_default_size(450, 600)
         self.set_size_request(430, 500)
         self.set_resizable(True)
 
+        ## Settings chosen in the preferences dialog, kept between runs
+        self.preferences = Preferences(os.path.join(GLib.get_user_config_dir(), "neocalc", "preferences.ini"))
+
         ## Initialize registry for handling user actions and shortcuts
         self.action_registry = ActionRegistry(self)
         self.register_custom_actions()
@@ -35,16 +51,38 @@ class Calculator(Adw.ApplicationWindow):
 
         self.setup_keyboard_controller()
 
-        ## Add the first default calculator instance
-        self.calc_manager.add_calculator_instance()
-
-        ## Apply the CSS styles on startup
-        StyleManager.load_css()
+        ## Reopen the tabs of the last session, or start with one calculator.
+        ## Further windows of the same process start empty and are not saved
+        self.session = None
+        self._sources = []
+        if restore_session:
+            self.session = SessionStore(os.path.join(GLib.get_user_data_dir(), "neocalc", "session.bin"))
+            self.restore_session()
+            self._sources.append(GLib.timeout_add_seconds(SESSION_SAVE_INTERVAL, self.on_session_save_timeout))
+        else:
+            self.calc_manager.add_calculator_instance()
+        self.connect("close-request", self.on_close_request)
+
+        ## Resident memory should follow the tabs on screen, not the tabs open
+        self.hibernate_after = self.preferences.get_int("hibernate_after", HIBERNATE_AFTER)
+        try:
+            self.hibernate_after = int(os.environ.get("NEOCALC_HIBERNATE_AFTER", self.hibernate_after))
+        except ValueError:
+            pass
+        self._sources.append(GLib.timeout_add_seconds(HIBERNATE_CHECK_INTERVAL, self.on_hibernate_timeout))
+        self._memory_monitor = Gio.MemoryMonitor.dup_default()
+        self._memory_handler = self._memory_monitor.connect("low-memory-warning", self.on_low_memory_warning)
+
+        ## Apply the CSS styles on startup, with the theme picked last time
+        theme = self.preferences.get_string("theme", "default")
+        StyleManager.load_css(None if theme == "default" else theme)
 
     def setup_layout(self):
         """Initializes the main window layout using OverlaySplitView."""
         self.split_view = Adw.OverlaySplitView()
         self.split_view.set_show_sidebar(False)
+        ## Sidebar labels are not updated while hidden; catch up when it opens
+        self.split_view.connect("notify::show-sidebar", self.on_sidebar_visibility_changed)
 
         ## Automatically collapse the sidebar if the window width is small (< 600px)
         breakpoint = Adw.Breakpoint.new(
@@ -100,8 +138,13 @@ class Calculator(Adw.ApplicationWindow):
         ## Set the main content of the toolbar view
         toolbar_view.set_content(content_box)
 
+        ## Debug latency readout, drawn over the content when toggled on
+        overlay = Gtk.Overlay(child=toolbar_view)
+        self.latency_overlay = LatencyOverlay()
+        overlay.add_overlay(self.latency_overlay)
+
         ## Wrap in a NavigationPage (required for split view content)
-        nav_page = Adw.NavigationPage(child=toolbar_view, title="Calculator")
+        nav_page = Adw.NavigationPage(child=overlay, title="Calculator")
         self.split_view.set_content(nav_page)
 
     def on_toggle_sidebar(self, button):
@@ -116,11 +159,112 @@ class Calculator(Adw.ApplicationWindow):
     def add_calculator_instance(self):
         self.calc_manager.add_calculator_instance()
 
+    def add_calculator_instances(self, n):
+        self.calc_manager.add_calculator_instances(n)
+
+    def close_calculator_instances(self, calc_widgets):
+        self.calc_manager.close_calculator_instances(calc_widgets)
+
+    def restore_session(self):
+        try:
+            calculators, modes, selected, dropped = self.session.load()
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not restore the last session: {e}")
+            calculators, modes, selected, dropped = [], [], 0, []
+        for entry in dropped:
+            logger.warning(f"Dropped from the last session: {entry}")
+        self.calc_manager.restore_calculator_instances(calculators, modes, selected)
+
+    def save_session(self):
+        """Queue a save of every tab; the encoding and writing happen in the background."""
+        widgets = []
+        for i in range(self.tab_view.get_n_pages()):
+            page = self.tab_view.get_nth_page(i)
+            if hasattr(page, "calc_widget"):
+                page.calc_widget.flush_edits()
+                widgets.append(page.calc_widget)
+        selected = self.tab_view.get_selected_page()
+        selected = self.tab_view.get_page_position(selected) if selected else 0
+        self.session.save(
+            [w.logic.calculator for w in widgets],
+            [w.get_mode() for w in widgets],
+            selected,
+        )
+
+    def on_session_save_timeout(self):
+        self.save_session()
+        return GLib.SOURCE_CONTINUE
+
+    def on_close_request(self, window):
+        ## The process may keep running with other windows; stop this one's timers
+        for source in self._sources:
+            GLib.source_remove(source)
+        self._sources = []
+        self._memory_monitor.disconnect(self._memory_handler)
+        if self.session is None:
+            return False
+        self.save_session()
+        try:
+            self.session.flush()
+        except OSError as e:
+            logger.error(f"Could not save the session: {e}")
+        return False
+
+    def open_expressions(self, expressions):
+        """Evaluate each expression in a new tab, as passed on the command line."""
+        for text in expressions:
+            self.calc_manager.add_calculator_instance()
+            page = self.tab_view.get_selected_page()
+            if page is None or not hasattr(page, "calc_widget"):
+                continue
+            widget = page.calc_widget
+            widget.logic.set_expression(text)
+            widget.display.set_value(text)
+            widget.on_display_activated(None)
+
+    def hibernate_idle_tabs(self, idle_for):
+        """Hibernate every tab other than the selected one hidden for idle_for seconds."""
+        selected = self.tab_view.get_selected_page()
+        count = 0
+        for i in range(self.tab_view.get_n_pages()):
+            page = self.tab_view.get_nth_page(i)
+            if page is selected or not hasattr(page, "calc_widget"):
+                continue
+            widget = page.calc_widget
+            if not widget.is_hibernated() and widget.idle_seconds() >= idle_for and widget.hibernate():
+                count += 1
+        if count:
+            logger.debug(f"Hibernated {count} tabs")
+        return count
+
+    def on_hibernate_timeout(self):
+        if self.hibernate_after > 0:
+            self.hibernate_idle_tabs(self.hibernate_after)
+        return GLib.SOURCE_CONTINUE
+
+    def on_low_memory_warning(self, monitor, level):
+        ## Under pressure nothing hidden is worth keeping, whatever the idle time
+        self.hibernate_idle_tabs(0)
+
+    def on_sidebar_visibility_changed(self, split_view, param):
+        if not split_view.get_show_sidebar():
+            return
+        for i in range(self.tab_view.get_n_pages()):
+            page = self.tab_view.get_nth_page(i)
+            if hasattr(page, "calc_widget"):
+                page.calc_widget.flush_sidebar_update()
+
+    def toggle_latency_overlay(self):
+        self.latency_overlay.toggle()
+
+    def export_latency(self):
+        self.latency_overlay.export(self)
+
     def on_sidebar_row_selected(self, box, row):
         self.calc_manager.on_sidebar_row_selected(box, row)
 
-    def update_calculator_name(self, calc_widget):
-        self.calc_manager.update_calculator_name(calc_widget)
+    def update_calculator_name(self, calc_widget, entry=None):
+        self.calc_manager.update_calculator_name(calc_widget, entry)
 
     def switch_display_for(self, calc_widget):
         self.display_manager.switch_display_for(calc_widget)
@@ -167,6 +311,12 @@ class Calculator(Adw.ApplicationWindow):
 
     def set_theme(self, theme_id):
         StyleManager.apply_theme(theme_id)
+        self.preferences.set_string("theme", theme_id)
+
+    def set_hibernate_after(self, seconds):
+        """Hibernate hidden tabs after this many idle seconds (0: never), also on later runs."""
+        self.hibernate_after = seconds
+        self.preferences.set_int("hibernate_after", seconds)
 
     def import_theme(self, action, param):
         ## TODO: Implement file chooser